@@ -7,7 +7,27 @@ from rindegastort_cdk.rindegastort_cdk_stack import RindegastORTCdkStack
 
 
 app = cdk.App()
+warmup_minutes = app.node.try_get_context("warmup_minutes")
+
 RindegastORTCdkStack(app, "RindegastortCdkStack",
+    # Handler de OCR: cdk deploy -c generator_handler=ocr/cascade.lambda_handler
+    generator_handler=app.node.try_get_context("generator_handler")
+    or "ocr/generator_textract.lambda_handler",
+    # Capacidad caliente opcional: cdk deploy -c provisioned_concurrency=5 -c warmup_minutes=5
+    provisioned_concurrency=int(app.node.try_get_context("provisioned_concurrency") or 0),
+    warmup_interval=cdk.Duration.minutes(int(warmup_minutes)) if warmup_minutes else None,
+    # Pipeline por etapas con Step Functions: cdk deploy -c staged_pipeline=true
+    staged_pipeline=str(app.node.try_get_context("staged_pipeline")).lower() == "true",
+    # Export mensual de ocr_files_data: cdk deploy -c monthly_export=true [-c pyarrow_layer_arn=...]
+    monthly_export=str(app.node.try_get_context("monthly_export")).lower() == "true",
+    pyarrow_layer_arn=app.node.try_get_context("pyarrow_layer_arn"),
+    # Cuotas por id_usuario con carriles de prioridad: cdk deploy -c user_quotas=true
+    user_quotas=str(app.node.try_get_context("user_quotas")).lower() == "true",
+    # Una sola invocacion por documento ante reintentos: cdk deploy -c single_flight=true
+    single_flight=str(app.node.try_get_context("single_flight")).lower() == "true",
+    # Artefactos por hash de documento y backfill de re-extraccion: cdk deploy -c artifact_store=true
+    artifact_store=str(app.node.try_get_context("artifact_store")).lower() == "true",
+
     # If you don't specify 'env', this stack will be environment-agnostic.
     # Account/Region-dependent features and context lookups will not work,
     # but a single synthesized template can be deployed anywhere.
@@ -7,17 +7,64 @@ from aws_cdk import (
     aws_iam as iam,
     aws_apigateway as apigateway,
     aws_s3_deployment as s3_deployment,
+    aws_applicationautoscaling as appscaling,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_stepfunctions as sfn,
+    aws_stepfunctions_tasks as tasks,
+    CfnOutput,
     Duration,
     RemovalPolicy,
     Duration,
     Stack,
+    TimeZone,
 )
 from constructs import Construct
 
 
 class RindegastORTCdkStack(Stack):
 
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        generator_handler: str = "ocr/generator_textract.lambda_handler",
+        provisioned_concurrency: int = 0,
+        off_hours_provisioned_concurrency: int = 1,
+        business_hours: tuple = (8, 20),
+        warmup_interval: Duration = None,
+        staged_pipeline: bool = False,
+        monthly_export: bool = False,
+        pyarrow_layer_arn: str = None,
+        user_quotas: bool = False,
+        single_flight: bool = False,
+        artifact_store: bool = False,
+        **kwargs,
+    ) -> None:
+        """
+        generator_handler: handler de la funcion generadora, por ejemplo
+            "ocr/generator.lambda_handler" (Claude) u "ocr/cascade.lambda_handler"
+            (Textract + Titan, escalando a Claude los campos de baja confianza).
+        provisioned_concurrency: instancias calientes del alias `live` en horario
+            laboral. Con 0 no se crea el alias y se invoca la funcion on-demand.
+        off_hours_provisioned_concurrency: instancias calientes fuera de horario.
+        business_hours: (hora inicio, hora fin) de lunes a viernes, hora de Buenos Aires.
+        warmup_interval: si se indica, una regla de EventBridge envia un evento
+            {"warmup": true} con esa frecuencia para mantener contenedores calientes.
+        staged_pipeline: crea el pipeline por etapas (rasterize con PyMuPDF/PIL +
+            extract sin layers) orquestado con Step Functions y el endpoint
+            POST /pipeline que inicia sus ejecuciones.
+        monthly_export: crea la lambda de export de ocr_files_data a CSV/Parquet y
+            una regla que la ejecuta el primer dia de cada mes con el mes anterior.
+        pyarrow_layer_arn: layer con pyarrow para escribir Parquet (sin ella solo CSV).
+        user_quotas: crea la tabla de cuotas y activa el control de admision por
+            id_usuario (solicitudes en curso y por minuto, carriles interactiva/lote).
+        single_flight: crea la tabla de leases para que las invocaciones concurrentes
+            sobre el mismo documento (reintentos del cliente) se procesen una sola vez.
+        artifact_store: guarda los artefactos intermedios (bloques de Textract, imagenes
+            codificadas, texto) por hash del documento y crea la lambda de backfill que
+            re-extrae el archivo historico llamando solo al modelo.
+        """
         super().__init__(scope, construct_id, **kwargs)
 
         ########################### BUCKET ############################
@@ -106,7 +153,7 @@ class RindegastORTCdkStack(Stack):
             "GeneratorFunction",
             function_name="rinde_gastos_ocr_generator_function",
             runtime=_lambda.Runtime.PYTHON_3_8,
-            handler="ocr/generator_textract.lambda_handler",
+            handler=generator_handler,
             code=_lambda.Code.from_asset("scripts/lambdas"),
             layers=[pillow_layer, pyMUPDF_layer],
             timeout=Duration.seconds(300),
@@ -118,12 +165,105 @@ class RindegastORTCdkStack(Stack):
                 "FAIL_TOPIC_ARN": fail_topic.topic_arn,
             },
         )
-        generator_file_url = generator_function.add_function_url(
+        # -------------------------- Capacidad caliente --------------------------#
+
+        # Las invocaciones deben apuntar al alias para usar la concurrencia aprovisionada
+        generator_target = generator_function
+        if provisioned_concurrency > 0:
+            generator_alias = generator_function.add_alias(
+                "live",
+                provisioned_concurrent_executions=off_hours_provisioned_concurrency,
+            )
+            generator_scaling = generator_alias.add_auto_scaling(
+                min_capacity=off_hours_provisioned_concurrency,
+                max_capacity=provisioned_concurrency,
+            )
+            start_hour, end_hour = business_hours
+            # Sin politica de escalado, Application Auto Scaling solo reduce la
+            # capacidad si supera el nuevo maximo: cada accion fija min y max
+            generator_scaling.scale_on_schedule(
+                "ScaleUpBusinessHours",
+                schedule=appscaling.Schedule.cron(
+                    hour=str(start_hour), minute="0", week_day="MON-FRI"
+                ),
+                min_capacity=provisioned_concurrency,
+                max_capacity=provisioned_concurrency,
+                time_zone=TimeZone.AMERICA_ARGENTINA_BUENOS_AIRES,
+            )
+            generator_scaling.scale_on_schedule(
+                "ScaleDownOffHours",
+                schedule=appscaling.Schedule.cron(
+                    hour=str(end_hour), minute="0", week_day="MON-FRI"
+                ),
+                min_capacity=off_hours_provisioned_concurrency,
+                max_capacity=off_hours_provisioned_concurrency,
+                time_zone=TimeZone.AMERICA_ARGENTINA_BUENOS_AIRES,
+            )
+            generator_target = generator_alias
+
+        if warmup_interval is not None:
+            # Evento de warm-up: inicializa clientes y prompts sin hacer OCR
+            events.Rule(
+                self,
+                "GeneratorWarmupRule",
+                schedule=events.Schedule.rate(warmup_interval),
+                targets=[
+                    targets.LambdaFunction(
+                        generator_target,
+                        event=events.RuleTargetInput.from_object({"warmup": True}),
+                    )
+                ],
+            )
+
+        generator_file_url = generator_target.add_function_url(
             auth_type=_lambda.FunctionUrlAuthType.NONE
         )
         rindegastort_data_bucket.grant_read(generator_function)
+        # Atributos que no entran en el limite de 400 KB de DynamoDB (dynamo_writer.py);
+        # una escritura rechazada borra los suyos
+        rindegastort_data_bucket.grant_put(generator_function, "dynamodb-offload/*")
+        rindegastort_data_bucket.grant_delete(generator_function, "dynamodb-offload/*")
         file_metadata_table.grant_read_write_data(generator_function)
         fail_topic.grant_publish(generator_function)
+
+        # -------------------------- Cuotas por usuario --------------------------#
+
+        if user_quotas:
+            # Contadores condicionales de admision; los items vencidos se borran por TTL
+            quotas_table = dynamodb.Table(
+                self,
+                "QuotasTable",
+                table_name=f"rindegastort_quotas",
+                partition_key=dynamodb.Attribute(
+                    name="pk", type=dynamodb.AttributeType.STRING
+                ),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            quotas_table.grant_read_write_data(generator_function)
+            generator_function.add_environment("QUOTAS_TABLE_NAME", quotas_table.table_name)
+
+        # -------------------------- Single-flight por documento --------------------------#
+
+        if single_flight:
+            # Lease "en proceso" y resultado reciente por uuid; vencen por TTL
+            idempotency_table = dynamodb.Table(
+                self,
+                "IdempotencyTable",
+                table_name=f"rindegastort_idempotency",
+                partition_key=dynamodb.Attribute(
+                    name="uuid", type=dynamodb.AttributeType.STRING
+                ),
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                time_to_live_attribute="expires_at",
+                removal_policy=RemovalPolicy.DESTROY,
+            )
+            idempotency_table.grant_read_write_data(generator_function)
+            generator_function.add_environment(
+                "IDEMPOTENCY_TABLE_NAME", idempotency_table.table_name
+            )
+
         # agregar politica de acceso a modelos de amazon bedrock
         generator_function.add_to_role_policy(
             iam.PolicyStatement(actions=["bedrock:*"], resources=["*"])
@@ -133,13 +273,208 @@ class RindegastORTCdkStack(Stack):
             iam.PolicyStatement(actions=["textract:*"], resources=["*"])
         )
 
+        # -------------------------- Almacen de artefactos --------------------------#
+
+        artifact_store_environment = {}
+        if artifact_store:
+            # Sin expiracion: son la entrada del backfill cuando cambia el prompt
+            artifact_store_environment = {
+                "ARTIFACT_STORE_BUCKET": rindegastort_data_bucket.bucket_name,
+                "ARTIFACT_STORE_PREFIX": "artifacts/",
+            }
+            for name, value in artifact_store_environment.items():
+                generator_function.add_environment(name, value)
+            rindegastort_data_bucket.grant_read_write(generator_function)
+
+        # -------------------------- Pipeline por etapas --------------------------#
+
+        if staged_pipeline:
+            stage_environment = {
+                "BUCKET_NAME": rindegastort_data_bucket.bucket_name,
+                "FILE_KEY": "prompt_engineering/prompt.txt",
+                "DYNAMODB_TABLE_NAME": file_metadata_table.table_name,
+                "FAIL_TOPIC_ARN": fail_topic.topic_arn,
+                "ARTIFACTS_BUCKET": rindegastort_data_bucket.bucket_name,
+                "ARTIFACTS_PREFIX": "pipeline/",
+                **artifact_store_environment,
+            }
+            # Los artefactos intermedios solo se necesitan mientras corre la ejecucion
+            rindegastort_data_bucket.add_lifecycle_rule(
+                id="ExpirePipelineArtifacts",
+                prefix="pipeline/",
+                expiration=Duration.days(7),
+                noncurrent_version_expiration=Duration.days(1),
+            )
+
+            # Rasterizacion y encoding: CPU intensivo, 1769 MB equivale a 1 vCPU completa
+            rasterize_function = _lambda.Function(
+                self,
+                "PipelineRasterizeFunction",
+                function_name="rinde_gastos_ocr_pipeline_rasterize",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                handler="pipeline/rasterize.lambda_handler",
+                code=_lambda.Code.from_asset("scripts/lambdas"),
+                layers=[pillow_layer, pyMUPDF_layer],
+                timeout=Duration.seconds(120),
+                memory_size=1769,
+                environment=stage_environment,
+            )
+            rindegastort_data_bucket.grant_read_write(rasterize_function)
+            fail_topic.grant_publish(rasterize_function)
+
+            # Llamada al modelo: espera de I/O, no necesita las layers. El artefacto
+            # no se parsea: el prompt y el body de Bedrock se arman sobre sus bytes,
+            # asi el peor caso (20 imagenes de 5 MB en base64, ~100 MB) tiene a lo
+            # sumo dos copias en memoria
+            extract_function = _lambda.Function(
+                self,
+                "PipelineExtractFunction",
+                function_name="rinde_gastos_ocr_pipeline_extract",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                handler="pipeline/extract.lambda_handler",
+                code=_lambda.Code.from_asset("scripts/lambdas"),
+                timeout=Duration.seconds(300),
+                memory_size=512,
+                environment=stage_environment,
+            )
+            rindegastort_data_bucket.grant_read(extract_function)
+            rindegastort_data_bucket.grant_put(extract_function, "dynamodb-offload/*")
+            rindegastort_data_bucket.grant_delete(extract_function, "dynamodb-offload/*")
+            file_metadata_table.grant_read_write_data(extract_function)
+            fail_topic.grant_publish(extract_function)
+            extract_function.add_to_role_policy(
+                iam.PolicyStatement(actions=["bedrock:InvokeModel"], resources=["*"])
+            )
+            if user_quotas:
+                # POST /pipeline no pasa por el generador: rasterize toma la
+                # admision y extract la libera. El lugar se conserva entre etapas,
+                # asi que su TTL cubre el timeout de la state machine
+                for stage_function in (rasterize_function, extract_function):
+                    quotas_table.grant_read_write_data(stage_function)
+                    stage_function.add_environment("QUOTAS_TABLE_NAME", quotas_table.table_name)
+                    stage_function.add_environment("QUOTA_INFLIGHT_TTL_SECONDS", "600")
+
+            rasterize_task = tasks.LambdaInvoke(
+                self,
+                "RasterizeTask",
+                lambda_function=rasterize_function,
+                payload_response_only=True,
+            )
+            # Sin cupo la ejecucion espera en vez de fallar (~5 min en total)
+            rasterize_task.add_retry(
+                errors=["QuotaExceeded"],
+                interval=Duration.seconds(10),
+                max_attempts=5,
+                backoff_rate=2,
+            )
+            extract_task = tasks.LambdaInvoke(
+                self,
+                "ExtractTask",
+                lambda_function=extract_function,
+                payload_response_only=True,
+            )
+            extract_task.add_retry(
+                errors=["ThrottlingException", "ModelTimeoutException"],
+                interval=Duration.seconds(5),
+                max_attempts=3,
+                backoff_rate=2,
+            )
+
+            pipeline_state_machine = sfn.StateMachine(
+                self,
+                "OcrPipelineStateMachine",
+                state_machine_name="rinde_gastos_ocr_pipeline",
+                definition_body=sfn.DefinitionBody.from_chainable(
+                    rasterize_task.next(extract_task)
+                ),
+                timeout=Duration.minutes(10),
+            )
+            CfnOutput(
+                self,
+                "OcrPipelineStateMachineArn",
+                value=pipeline_state_machine.state_machine_arn,
+            )
+
+        # -------------------------- Export mensual --------------------------#
+
+        if monthly_export:
+            export_layers = []
+            if pyarrow_layer_arn:
+                export_layers.append(
+                    _lambda.LayerVersion.from_layer_version_arn(
+                        self, "PyArrowLayer", layer_version_arn=pyarrow_layer_arn
+                    )
+                )
+            export_function = _lambda.Function(
+                self,
+                "ExportFunction",
+                function_name="rinde_gastos_ocr_export_function",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                handler="export/exporter.lambda_handler",
+                code=_lambda.Code.from_asset("scripts/lambdas"),
+                layers=export_layers,
+                timeout=Duration.minutes(15),
+                memory_size=1024,
+                environment={
+                    "DYNAMODB_TABLE_NAME": file_metadata_table.table_name,
+                    "EXPORT_BUCKET": rindegastort_data_bucket.bucket_name,
+                    "EXPORT_PREFIX": "exports/",
+                    "EXPORT_SEGMENTS": "8",
+                },
+            )
+            file_metadata_table.grant_read_data(export_function)
+            rindegastort_data_bucket.grant_put(export_function)
+            # Atributos de las filas guardados en S3 por dynamo_writer
+            rindegastort_data_bucket.grant_read(export_function, "dynamodb-offload/*")
+
+            events.Rule(
+                self,
+                "MonthlyExportRule",
+                schedule=events.Schedule.cron(minute="0", hour="6", day="1"),
+                targets=[
+                    targets.LambdaFunction(
+                        export_function,
+                        event=events.RuleTargetInput.from_object({"month": "previous"}),
+                    )
+                ],
+            )
+
+        # -------------------------- Backfill de re-extraccion --------------------------#
+
+        if artifact_store:
+            # Las filas de la cascada se re-extraen con la cascada, que importa
+            # la rasterizacion: necesita las mismas layers que el generator
+            backfill_function = _lambda.Function(
+                self,
+                "BackfillFunction",
+                function_name="rinde_gastos_ocr_backfill_function",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                handler="backfill/reextract.lambda_handler",
+                code=_lambda.Code.from_asset("scripts/lambdas"),
+                layers=[pillow_layer, pyMUPDF_layer],
+                timeout=Duration.minutes(15),
+                memory_size=512,
+                environment={
+                    "BUCKET_NAME": rindegastort_data_bucket.bucket_name,
+                    "FILE_KEY": "prompt_engineering/prompt.txt",
+                    "DYNAMODB_TABLE_NAME": file_metadata_table.table_name,
+                    "BACKFILL_CONCURRENCY": "4",
+                    **artifact_store_environment,
+                },
+            )
+            rindegastort_data_bucket.grant_read_write(backfill_function)
+            file_metadata_table.grant_read_write_data(backfill_function)
+            backfill_function.add_to_role_policy(
+                iam.PolicyStatement(actions=["bedrock:InvokeModel"], resources=["*"])
+            )
+
         # ############## ApiGateway ##############
 
         # Crear API Gateway con proxy habilitado
         api = apigateway.LambdaRestApi(
             self,
             "MyApiGateway",
-            handler=generator_function,
+            handler=generator_target,
             proxy=True,  # Cambiar a True para habilitar el proxy
         )
 
@@ -147,6 +482,37 @@ class RindegastORTCdkStack(Stack):
         items = api.root.add_resource("extract")
         items.add_method("POST")  # Definir el método GET
 
+        if staged_pipeline:
+            # POST /pipeline inicia una ejecucion de la state machine con el body
+            # como input ({"s3": {...}, "id_usuario": ...}) y responde 202 con el
+            # executionArn
+            pipeline_api_role = iam.Role(
+                self,
+                "PipelineApiRole",
+                assumed_by=iam.ServicePrincipal("apigateway.amazonaws.com"),
+            )
+            pipeline_state_machine.grant_start_execution(pipeline_api_role)
+            pipeline_resource = api.root.add_resource("pipeline")
+            pipeline_resource.add_method(
+                "POST",
+                apigateway.AwsIntegration(
+                    service="states",
+                    action="StartExecution",
+                    options=apigateway.IntegrationOptions(
+                        credentials_role=pipeline_api_role,
+                        request_templates={
+                            "application/json": '{"stateMachineArn": "'
+                            + pipeline_state_machine.state_machine_arn
+                            + '", "input": "$util.escapeJavaScript($input.json(\'$\'))"}'
+                        },
+                        integration_responses=[
+                            apigateway.IntegrationResponse(status_code="202")
+                        ],
+                    ),
+                ),
+                method_responses=[apigateway.MethodResponse(status_code="202")],
+            )
+
         ########################### Deployamos prompt.txt dentro del bucket ###########################
 
         # Llevamos el prompt en .txt al bucket
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark de escritura en DynamoDB.
+
+Compara el camino anterior (utils.float_to_decimal + Table.put_item del
+resource de boto3, y update_item armando las expresiones en cada llamada) con
+dynamo_writer.ItemWriter (serializacion directa a AttributeValue con el
+cliente de bajo nivel y expresiones cacheadas; los valores del update
+entran en el margen, asi que no se lee el item). Las solicitudes recorren
+todo el stack de botocore (validacion, serializacion JSON, firma) pero la respuesta
+HTTP se simula, asi que no se llama a AWS ni se mide la red.
+
+Ejemplo:
+    python scripts/benchmarks/dynamodb_write_bench.py --items 2000 --line-items 30
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, "scripts", "lambdas"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+import boto3  # noqa: E402
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+from botocore.awsrequest import AWSResponse  # noqa: E402
+
+from utils import float_to_decimal  # noqa: E402
+from dynamo_writer import ItemWriter, serialize_map  # noqa: E402
+
+TABLE_NAME = "ocr_files_data"
+
+
+class FakeRaw:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def short_circuit(client):
+    """Responde {} a toda solicitud antes de enviarla por la red."""
+
+    def respond(request, **kwargs):
+        return AWSResponse(request.url, 200, {}, FakeRaw(b"{}"))
+
+    client.meta.events.register("before-send.dynamodb", respond)
+    return client
+
+
+def sample_item(index, line_items, rng):
+    return {
+        "uuid": f"{index:064x}",
+        "s3_uri": f"s3://rindegastort-data-bucket-v2/uploads/{index}.pdf",
+        "timestamp": f"2024-09-{1 + index % 28:02d}T10:00:00",
+        "id_usuario": rng.randint(1, 500),
+        "cuit": "30-00000000-7",
+        "razon_social": "Comercio de prueba S.A.",
+        "tipo_factura": "A",
+        "punto_de_venta": "0003",
+        "numero_comprobante": f"{index:08d}",
+        "fecha_impresion": "01-09-2024",
+        "monto_total": round(rng.uniform(100, 100000), 2),
+        "iva": "I",
+        "categoria": "Comida",
+        "confianza": {name: round(rng.random(), 2) for name in ("cuit", "fecha_impresion", "monto_total")},
+        "items": [
+            {
+                "descripcion": f"Articulo {n}",
+                "cantidad": rng.randint(1, 5),
+                "precio_unitario": round(rng.uniform(10, 5000), 2),
+            }
+            for n in range(line_items)
+        ],
+    }
+
+
+# ------------------------ Caminos ------------------------
+
+
+def legacy_update(table, key, update_dict):
+    update_dict = float_to_decimal(update_dict)
+    table.update_item(
+        Key=key,
+        UpdateExpression="SET " + ", ".join(f"#{k} = :{k}" for k in update_dict.keys()),
+        ExpressionAttributeNames={f"#{k}": k for k in update_dict.keys()},
+        ExpressionAttributeValues={f":{k}": v for k, v in update_dict.items()},
+    )
+
+
+def build_paths():
+    table = boto3.resource("dynamodb").Table(TABLE_NAME)
+    short_circuit(table.meta.client)
+    writer = ItemWriter(TABLE_NAME, client=short_circuit(boto3.client("dynamodb")), offload_bucket=None)
+    serializer = TypeSerializer()
+    return {
+        # Solo la conversion a AttributeValue, sin botocore
+        "serializacion anterior (float_to_decimal + TypeSerializer)": lambda item: {
+            k: serializer.serialize(v) for k, v in float_to_decimal(item).items()
+        },
+        "serializacion actual (serialize_map)": lambda item: serialize_map(item),
+        "put anterior (resource + float_to_decimal)": lambda item: table.put_item(
+            Item=float_to_decimal(item)
+        ),
+        "put actual (ItemWriter)": lambda item: writer.put(item),
+        "put actual condicional (newer_than)": lambda item: writer.put(item, newer_than="timestamp"),
+        "update anterior": lambda item: legacy_update(
+            table, {"uuid": item["uuid"]}, {k: item[k] for k in ("cuit", "monto_total", "confianza")}
+        ),
+        "update actual (expresion cacheada)": lambda item: writer.update(
+            {"uuid": item["uuid"]}, {k: item[k] for k in ("cuit", "monto_total", "confianza")}
+        ),
+    }
+
+
+def measure(operation, items):
+    for item in items[:50]:  # calentamiento
+        operation(item)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for item in items:
+        operation(item)
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    tracemalloc.start()
+    for item in items[:200]:
+        operation(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "us_per_item": round(wall * 1e6 / len(items), 1),
+        "cpu_us_per_item": round(cpu * 1e6 / len(items), 1),
+        "py_peak_kb": round(peak / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--line-items", type=int, default=20, help="renglones por comprobante")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    items = [sample_item(i, args.line_items, rng) for i in range(args.items)]
+    report = {"items": args.items, "line_items": args.line_items}
+    for name, operation in build_paths().items():
+        report[name] = measure(operation, items)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
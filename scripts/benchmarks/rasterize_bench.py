@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark de rasterizacion + armado del payload para Claude.
+
+Compara el camino anterior (PIL.frombytes + paste + PNG, y en
+encode_images_for_claude volver a abrir ese PNG, decodificarlo y
+codificarlo otra vez) con el actual de rasterization.py (paginas compuestas
+en un pixmap de PyMuPDF y un unico encode PNG). Reporta por pagina el tiempo
+de CPU, el tiempo real y las asignaciones de memoria de Python (tracemalloc:
+los buffers internos de MuPDF y PIL no se cuentan, si los bytes que devuelven).
+
+Ejemplo:
+    python scripts/benchmarks/rasterize_bench.py --pages 6 --repeat 20
+    python scripts/benchmarks/rasterize_bench.py --pdf factura.pdf
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT_DIR, "scripts", "lambdas"))
+# Los modulos crean clientes de boto3 al importarse; no se llama a AWS
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import fitz  # noqa: E402  PyMuPDF
+from PIL import Image  # noqa: E402
+
+from rasterization import convert_pdf_to_images, encode_images_for_claude  # noqa: E402
+
+
+def synthetic_receipt_pdf(pages, seed=0):
+    """PDF con texto y una imagen escaneada (ruido JPEG) por pagina."""
+    rng = random.Random(seed)
+    noise = Image.frombytes("RGB", (600, 400), bytes(rng.getrandbits(8) for _ in range(600 * 400 * 3)))
+    scan = io.BytesIO()
+    noise.save(scan, format="JPEG", quality=60)
+
+    document = fitz.open()
+    for page_num in range(pages):
+        page = document.new_page()
+        page.insert_text(
+            (72, 72),
+            f"FACTURA A - pagina {page_num + 1}\nCUIT 30-00000000-7  Total $ 1.234,56\n" * 12,
+            fontsize=9,
+        )
+        page.insert_image(fitz.Rect(72, 420, 520, 720), stream=scan.getvalue())
+    return document.tobytes()
+
+
+# ------------------------ Camino anterior ------------------------
+
+
+def legacy_convert_pdf_to_images(pdf_content, max_images=20, pages_per_image=2):
+    pdf_document = fitz.open(stream=io.BytesIO(pdf_content), filetype="pdf")
+    pages_to_process = min(pdf_document.page_count, max_images * pages_per_image)
+    images = []
+    for start_page in range(0, pages_to_process, pages_per_image):
+        temp_images = []
+        for page_num in range(start_page, min(start_page + pages_per_image, pages_to_process)):
+            pix = pdf_document[page_num].get_pixmap()
+            temp_images.append(Image.frombytes("RGB", [pix.width, pix.height], pix.samples))
+        combined_image = Image.new(
+            "RGB", (max(i.width for i in temp_images), sum(i.height for i in temp_images))
+        )
+        y_offset = 0
+        for img in temp_images:
+            combined_image.paste(img, (0, y_offset))
+            y_offset += img.height
+        img_byte_arr = io.BytesIO()
+        combined_image.save(img_byte_arr, format="PNG")
+        images.append(img_byte_arr.getvalue())
+    return images
+
+
+def legacy_encode_images_for_claude(images):
+    content = []
+    for image in images:
+        img = Image.open(io.BytesIO(image))
+        img_format = img.format or "PNG"
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format=img_format)
+        content.append(
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": f"image/{img_format.lower()}",
+                    "data": base64.b64encode(img_byte_arr.getvalue()).decode("utf-8"),
+                },
+            }
+        )
+    return content
+
+
+PATHS = {
+    "anterior": lambda pdf: legacy_encode_images_for_claude(legacy_convert_pdf_to_images(pdf)),
+    "actual": lambda pdf: encode_images_for_claude(convert_pdf_to_images(pdf)),
+}
+
+
+# ------------------------ Medicion ------------------------
+
+
+def measure(path, pdf, pages, repeat):
+    path(pdf)  # calentamiento (fuentes, tablas de zlib)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(repeat):
+        content = path(pdf)
+    cpu = (time.process_time() - cpu_start) / repeat
+    wall = (time.perf_counter() - wall_start) / repeat
+
+    tracemalloc.start()
+    path(pdf)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "cpu_ms_per_page": round(cpu * 1000 / pages, 2),
+        "wall_ms_per_page": round(wall * 1000 / pages, 2),
+        "py_peak_kb_per_page": round(peak / 1024 / pages, 1),
+        "payload_kb": round(sum(len(block["source"]["data"]) for block in content) / 1024, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", help="PDF a usar; por defecto uno sintetico")
+    parser.add_argument("--pages", type=int, default=4, help="paginas del PDF sintetico")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.pdf:
+        with open(args.pdf, "rb") as pdf_file:
+            pdf = pdf_file.read()
+    else:
+        pdf = synthetic_receipt_pdf(args.pages)
+    pages = min(fitz.open(stream=pdf, filetype="pdf").page_count, 40)
+
+    report = {"pages": pages, "repeat": args.repeat}
+    for name, path in PATHS.items():
+        report[name] = measure(path, pdf, pages, args.repeat)
+    before, after = report["anterior"], report["actual"]
+    report["ahorro_por_pagina"] = {
+        "cpu_ms": round(before["cpu_ms_per_page"] - after["cpu_ms_per_page"], 2),
+        "py_peak_kb": round(before["py_peak_kb_per_page"] - after["py_peak_kb_per_page"], 1),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import json
+import os
+import logging
+import time
+import uuid
+import functools
+import boto3
+from botocore.exceptions import ClientError
+
+# Control de admision por id_usuario con items condicionales en DynamoDB.
+#
+# Cada usuario tiene, por carril de prioridad, un limite de solicitudes en
+# curso y uno por minuto. Cada solicitud en curso ocupa un "lugar" propio
+# (un item con su token y su vencimiento), asi un lugar que nunca se libero
+# vence solo sin afectar a las demas solicitudes.
+#
+# El carril sale del punto de entrada, no del payload: las invocaciones HTTP
+# (API Gateway / Function URL) son interactivas y las directas (backfills,
+# Step Functions, scripts) son de lote. Ambos carriles comparten un pool
+# global de lugares: las interactivas los toman de arriba hacia abajo y se
+# admiten aunque no quede ninguno, y las de lote solo pueden tomar los
+# primeros QUOTA_BULK_GLOBAL_INFLIGHT, de abajo hacia arriba. Asi la carga
+# interactiva desplaza a la de lote y nunca al reves.
+
+logger = logging.getLogger()
+
+QUOTAS_TABLE_NAME = os.environ.get("QUOTAS_TABLE_NAME")
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL")
+
+INTERACTIVE = "interactiva"
+BULK = "lote"
+DEFAULT_PRIORITY = INTERACTIVE
+
+# Un lugar en curso que no se libero (por ejemplo un timeout de Lambda)
+# vence luego de este tiempo; debe superar el timeout de la funcion.
+INFLIGHT_TTL_SECONDS = int(os.environ.get("QUOTA_INFLIGHT_TTL_SECONDS", "360"))
+# Lugares del pool global compartido por ambos carriles
+GLOBAL_INFLIGHT = int(os.environ.get("QUOTA_GLOBAL_INFLIGHT", "20"))
+
+LANE_LIMITS = {
+    INTERACTIVE: {
+        "inflight": int(os.environ.get("QUOTA_INTERACTIVE_INFLIGHT", "4")),
+        "per_minute": int(os.environ.get("QUOTA_INTERACTIVE_PER_MINUTE", "30")),
+        "retry_after": 5,
+    },
+    BULK: {
+        "inflight": int(os.environ.get("QUOTA_BULK_INFLIGHT", "2")),
+        "per_minute": int(os.environ.get("QUOTA_BULK_PER_MINUTE", "20")),
+        "global_inflight": int(os.environ.get("QUOTA_BULK_GLOBAL_INFLIGHT", "10")),
+        "retry_after": 30,
+    },
+}
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_response(self):
+        """Respuesta 429 en el formato de proxy de API Gateway / Function URL."""
+        return {
+            "statusCode": 429,
+            "headers": {
+                "Content-Type": "application/json",
+                "Retry-After": str(self.retry_after),
+            },
+            "body": json.dumps({"error": self.reason, "retry_after": self.retry_after}),
+        }
+
+
+def request_identity(event):
+    """
+    Devuelve (id_usuario, prioridad). Los eventos HTTP de API Gateway (con
+    body) son interactivos; las invocaciones directas son de lote. Un
+    "prioridad" en el payload se ignora: lo controla el cliente.
+    """
+    if "body" in event and "s3" not in event:
+        try:
+            payload = json.loads(event["body"] or "{}")
+        except (TypeError, ValueError):
+            payload = {}
+        return payload.get("id_usuario", "anonimo"), INTERACTIVE
+    return event.get("id_usuario", "anonimo"), BULK
+
+
+class AdmissionController:
+    def __init__(self, table, limits=None, clock=time.time, global_inflight=GLOBAL_INFLIGHT):
+        self.table = table
+        self.limits = limits or LANE_LIMITS
+        self.clock = clock
+        self.global_inflight = global_inflight
+
+    @classmethod
+    def from_env(cls):
+        dynamodb = boto3.resource("dynamodb", endpoint_url=DYNAMODB_ENDPOINT_URL)
+        return cls(dynamodb.Table(QUOTAS_TABLE_NAME))
+
+    # ------------------------ Contadores ------------------------
+
+    def _increment(self, pk, maximum, expires_at):
+        """Incrementa el contador si esta por debajo de `maximum`."""
+        try:
+            self.table.update_item(
+                Key={"pk": pk},
+                # El vencimiento se fija al crear el contador y no se extiende
+                UpdateExpression="ADD #count :one SET #expires_at = if_not_exists(#expires_at, :expires_at)",
+                ConditionExpression="attribute_not_exists(#count) OR #count < :max",
+                ExpressionAttributeNames={"#count": "count", "#expires_at": "expires_at"},
+                ExpressionAttributeValues={
+                    ":one": 1,
+                    ":max": maximum,
+                    ":expires_at": expires_at,
+                },
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def _claim(self, pk, token, now):
+        """Ocupa el lugar `pk` si esta libre o vencido."""
+        try:
+            self.table.put_item(
+                Item={"pk": pk, "token": token, "expires_at": now + INFLIGHT_TTL_SECONDS},
+                ConditionExpression="attribute_not_exists(pk) OR #expires_at < :now",
+                ExpressionAttributeNames={"#expires_at": "expires_at"},
+                ExpressionAttributeValues={":now": now},
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return False
+
+    def _claim_any(self, prefix, indexes, token, now):
+        """
+        Ocupa el primer lugar libre de `indexes` (en ese orden); devuelve su
+        pk o None. Los lugares ocupados se leen con un BatchGetItem para no
+        intentar una escritura condicional por cada uno.
+        """
+        pks = [f"{prefix}#{index}" for index in indexes]
+        response = self.table.meta.client.batch_get_item(
+            RequestItems={
+                self.table.name: {
+                    "Keys": [{"pk": pk} for pk in pks],
+                    "ProjectionExpression": "pk, expires_at",
+                }
+            }
+        )
+        busy = {
+            item["pk"]
+            for item in response["Responses"].get(self.table.name, [])
+            if item["expires_at"] >= now
+        }
+        for pk in pks:
+            # Otra solicitud puede haberlo tomado despues de la lectura
+            if pk not in busy and self._claim(pk, token, now):
+                return pk
+        return None
+
+    def _free(self, pk, token):
+        # Solo lo libera si sigue siendo nuestro (no fue tomado al vencer)
+        try:
+            self.table.delete_item(
+                Key={"pk": pk},
+                ConditionExpression="#token = :token",
+                ExpressionAttributeNames={"#token": "token"},
+                ExpressionAttributeValues={":token": token},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    # ------------------------ Admision ------------------------
+
+    def acquire(self, id_usuario, priority=DEFAULT_PRIORITY):
+        """
+        Reserva un lugar para la solicitud o lanza QuotaExceeded. Devuelve la
+        lista de (lugar, token) que hay que liberar con release().
+        """
+        limits = self.limits[priority]
+        clock_now = self.clock()
+        now = int(clock_now)
+        token = uuid.uuid4().hex
+        ticket = []
+        # Los lugares en curso se reservan antes de contar la solicitud en el
+        # limite por minuto: un rechazo por lugares no consume cuota por minuto
+        user_slot = self._claim_any(
+            f"inflight#{priority}#{id_usuario}", range(limits["inflight"]), token, now
+        )
+        if user_slot is None:
+            raise QuotaExceeded(
+                f"Limite de {limits['inflight']} solicitudes en curso alcanzado",
+                limits["retry_after"],
+            )
+        ticket.append((user_slot, token))
+
+        if "global_inflight" in limits:
+            # Lote: solo los lugares mas bajos del pool, y es obligatorio
+            indexes = range(min(limits["global_inflight"], self.global_inflight))
+            global_slot = self._claim_any("inflight#*", indexes, token, now)
+            if global_slot is None:
+                self.release(ticket)
+                raise QuotaExceeded(
+                    f"Limite global de {limits['global_inflight']} solicitudes de lote en curso alcanzado",
+                    limits["retry_after"],
+                )
+        else:
+            # Interactiva: desde el lugar mas alto; sin lugares libres igual se admite
+            indexes = reversed(range(self.global_inflight))
+            global_slot = self._claim_any("inflight#*", indexes, token, now)
+        if global_slot is not None:
+            ticket.append((global_slot, token))
+
+        minute = int(clock_now // 60)
+        rate_pk = f"rate#{priority}#{id_usuario}#{minute}"
+        if not self._increment(rate_pk, limits["per_minute"], (minute + 2) * 60):
+            self.release(ticket)
+            retry_after = max(1, int((minute + 1) * 60 - clock_now))
+            raise QuotaExceeded(
+                f"Limite de {limits['per_minute']} solicitudes por minuto alcanzado",
+                retry_after,
+            )
+        return ticket
+
+    def release(self, ticket):
+        for pk, token in ticket:
+            try:
+                self._free(pk, token)
+            except Exception as e:
+                # El lugar vence solo; no fallamos la solicitud
+                logger.error(f"Error al liberar el lugar {pk}: {str(e)}")
+
+
+_controller = None
+
+
+def get_controller():
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController.from_env()
+    return _controller
+
+
+def admit(event):
+    """
+    Admision para las etapas de Step Functions, que no pueden responder 429:
+    devuelve el ticket (serializable como JSON, para pasarlo a la etapa que
+    lo libera) o lanza QuotaExceeded y la state machine reintenta. Sin
+    QUOTAS_TABLE_NAME devuelve un ticket vacio.
+    """
+    if not QUOTAS_TABLE_NAME:
+        return []
+    id_usuario, priority = request_identity(event)
+    try:
+        return get_controller().acquire(id_usuario, priority)
+    except QuotaExceeded as e:
+        logger.warning(f"Ejecucion demorada para {id_usuario} ({priority}): {e.reason}")
+        raise
+
+
+def release_admission(ticket):
+    if ticket:
+        get_controller().release(ticket)
+
+
+def admission_control(handler):
+    """
+    Decorador para handlers de Lambda: aplica las cuotas del usuario antes de
+    procesar y libera el lugar al terminar. Sin QUOTAS_TABLE_NAME no hace nada.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not QUOTAS_TABLE_NAME or event.get("warmup"):
+            return handler(event, context)
+        controller = get_controller()
+
+        id_usuario, priority = request_identity(event)
+        try:
+            ticket = controller.acquire(id_usuario, priority)
+        except QuotaExceeded as e:
+            logger.warning(f"Solicitud rechazada para {id_usuario} ({priority}): {e.reason}")
+            return e.to_response()
+
+        try:
+            return handler(event, context)
+        finally:
+            controller.release(ticket)
+
+    return wrapper
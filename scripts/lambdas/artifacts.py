@@ -0,0 +1,175 @@
+import json
+import os
+import logging
+import re
+import hashlib
+import boto3
+from botocore.exceptions import ClientError
+
+# Almacen de artefactos intermedios en S3, con clave por hash del contenido
+# del documento y version de la etapa:
+#
+#   <prefijo><sha256 del documento>/manifest.json
+#   <prefijo><sha256 del documento>/<etapa>-v<version>.json
+#   <prefijo><sha256 del documento>/fuentes/<uuid>.json
+#
+# manifest.json solo marca el documento para el listado del backfill; las
+# etapas guardadas salen de los artefactos presentes y cada subida del
+# documento (fuente) tiene su propio objeto, de modo que dos subidas
+# concurrentes nunca pisan el registro de la otra.
+#
+# Si cambia el prompt alcanza con volver a correr el modelo sobre estos
+# artefactos (backfill/reextract.py). Si cambia la implementacion de una
+# etapa, se sube su version en STAGE_VERSIONS y los artefactos viejos dejan
+# de usarse sin necesidad de borrarlos.
+
+logger = logging.getLogger()
+
+ARTIFACT_STORE_BUCKET = os.environ.get("ARTIFACT_STORE_BUCKET")
+ARTIFACT_STORE_PREFIX = os.environ.get("ARTIFACT_STORE_PREFIX", "artifacts/")
+MANIFEST_NAME = "manifest.json"
+SOURCES_DIR = "fuentes"
+STAGE_PATTERN = re.compile(r"(\w+)-v(\d+)\.json")
+
+# Extractor con el que se genero la fila de cada fuente
+EXTRACTORS = ("claude", "textract", "cascade")
+
+# Bloques de Textract, bloques de imagen listos para Claude y texto por pagina
+STAGE_VERSIONS = {
+    "textract": 1,
+    "images": 1,
+    "text": 1,
+}
+
+
+def document_hash(file_content):
+    return hashlib.sha256(file_content).hexdigest()
+
+
+class ArtifactStore:
+    def __init__(self, s3_client, bucket, prefix=ARTIFACT_STORE_PREFIX, versions=None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.versions = versions or STAGE_VERSIONS
+
+    def key(self, doc_hash, stage_name):
+        return f"{self.prefix}{doc_hash}/{stage_name}-v{self.versions[stage_name]}.json"
+
+    def manifest_key(self, doc_hash):
+        return f"{self.prefix}{doc_hash}/{MANIFEST_NAME}"
+
+    def _read(self, key):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def _write(self, key, data):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=json.dumps(data, ensure_ascii=False).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def get(self, doc_hash, stage_name):
+        return self._read(self.key(doc_hash, stage_name))
+
+    def put(self, doc_hash, stage_name, data):
+        key = self.key(doc_hash, stage_name)
+        self._write(key, data)
+        logger.info(f"Artefacto guardado en s3://{self.bucket}/{key}")
+        return key
+
+    def get_or_create(self, doc_hash, stage_name, build):
+        """Devuelve el artefacto guardado o lo genera con build() y lo guarda."""
+        data = self.get(doc_hash, stage_name)
+        if data is None:
+            data = build()
+            self.put(doc_hash, stage_name, data)
+        return data
+
+    def source_key(self, doc_hash, uuid):
+        return f"{self.prefix}{doc_hash}/{SOURCES_DIR}/{uuid}.json"
+
+    def doc_hash_of(self, manifest_key):
+        return manifest_key[len(self.prefix):].split("/")[0]
+
+    def _list(self, prefix):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"]
+
+    def get_manifest(self, doc_hash):
+        """
+        Arma el manifest del documento: version vigente (o la mas alta) de
+        cada etapa guardada y las fuentes registradas. None si no hay nada.
+        """
+        marker = self._read(self.manifest_key(doc_hash))
+        if marker is None:
+            return None
+        document_prefix = f"{self.prefix}{doc_hash}/"
+        stored = {}
+        source_keys = []
+        for key in self._list(document_prefix):
+            name = key[len(document_prefix):]
+            if name.startswith(f"{SOURCES_DIR}/"):
+                source_keys.append(key)
+                continue
+            match = STAGE_PATTERN.fullmatch(name)
+            if match and match.group(1) in self.versions:
+                stored.setdefault(match.group(1), set()).add(int(match.group(2)))
+        stages = {
+            stage_name: self.versions[stage_name] if self.versions[stage_name] in found else max(found)
+            for stage_name, found in stored.items()
+        }
+
+        # Los manifests anteriores guardaban las fuentes dentro de manifest.json
+        sources = {source["uuid"]: source for source in marker.get("fuentes", [])}
+        for key in source_keys:
+            source = self._read(key)
+            if source is not None:
+                sources[source["uuid"]] = source
+        return {"documento_hash": doc_hash, "etapas": stages, "fuentes": list(sources.values())}
+
+    def record(self, doc_hash, uuid, s3_uri, id_usuario, extractor):
+        """
+        Registra una fuente del documento: el mismo contenido puede haberse
+        subido con varias claves, cada una con su fila (uuid) en
+        ocr_files_data generada por `extractor` (uno de EXTRACTORS).
+        """
+        if extractor not in EXTRACTORS:
+            raise ValueError(f"Extractor desconocido: {extractor}")
+        source = {"uuid": uuid, "s3_uri": s3_uri, "id_usuario": id_usuario, "extractor": extractor}
+        self._write(self.source_key(doc_hash, uuid), source)
+        # Todas las escrituras del marcador tienen el mismo contenido
+        if self._read(self.manifest_key(doc_hash)) is None:
+            self._write(self.manifest_key(doc_hash), {"documento_hash": doc_hash})
+        return source
+
+    def iterate_manifest_keys(self, start_after=None):
+        """Recorre en orden lexicografico las claves de manifest del almacen."""
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get("Contents", []):
+                if obj["Key"].endswith(f"/{MANIFEST_NAME}"):
+                    yield obj["Key"]
+
+
+_store = None
+
+
+def get_store():
+    """Almacen configurado por ARTIFACT_STORE_BUCKET, o None si no esta habilitado."""
+    global _store
+    if ARTIFACT_STORE_BUCKET and _store is None:
+        _store = ArtifactStore(boto3.client("s3"), ARTIFACT_STORE_BUCKET)
+    return _store
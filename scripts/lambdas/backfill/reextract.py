@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import json
+import os
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Permite ejecutar el script directamente (CLI) ademas de como Lambda
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dynamo_writer import get_writer
+from prompting import load_prompt
+from artifacts import ArtifactStore, ARTIFACT_STORE_BUCKET, EXTRACTORS
+from claude import build_prompt_text, extract_fields
+from ocr.generator_textract import extract_from_blocks
+
+# Backfill de re-extraccion: vuelve a correr solo la etapa del modelo sobre
+# los artefactos guardados (artifacts.py), sin descargar, rasterizar ni
+# llamar a Textract. Cada fila se re-extrae con el extractor que la genero
+# (Claude, Textract o la cascada), salvo que se fuerce uno con --mode. Los
+# manifests se recorren en orden y el avance se guarda en un checkpoint en
+# S3, de modo que una ejecucion interrumpida continua desde el ultimo
+# documento confirmado.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME", "ocr_files_data")
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+FILE_KEY = os.environ.get("FILE_KEY", "prompt_engineering/prompt.txt")
+CHECKPOINT_PREFIX = os.environ.get("BACKFILL_CHECKPOINT_PREFIX", "backfill/")
+DEFAULT_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", "4"))
+# Documentos confirmados entre dos escrituras del checkpoint
+CHECKPOINT_EVERY = int(os.environ.get("BACKFILL_CHECKPOINT_EVERY", "25"))
+# Como Lambda deja de tomar documentos cuando queda menos de este tiempo
+LAMBDA_MARGIN_MS = int(os.environ.get("BACKFILL_LAMBDA_MARGIN_MS", "120000"))
+
+MODES = ("auto",) + EXTRACTORS
+
+
+def prompt_version():
+    """Hash de los prompts actuales: un job por version de prompt."""
+    digest = hashlib.sha256()
+    for key in (FILE_KEY, FILE_KEY.replace(".txt", ".json"), FILE_KEY.replace(".txt", "_textract.txt")):
+        digest.update(load_prompt(BUCKET_NAME, key).encode("utf-8"))
+    return f"prompt-{digest.hexdigest()[:12]}"
+
+
+class Checkpoint:
+    """Avance del job en s3://bucket/<prefijo><job_id>.json."""
+
+    def __init__(self, s3_client, bucket, job_id):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = f"{CHECKPOINT_PREFIX}{job_id}.json"
+        self.state = {
+            "job_id": job_id,
+            "ultima_clave": None,
+            "procesados": 0,
+            "fallidos": [],
+            "completo": False,
+        }
+
+    def load(self):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+            self.state.update(json.loads(response["Body"].read()))
+            logger.info(f"Reanudando desde {self.state['ultima_clave']}")
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+        return self
+
+    def save(self):
+        self.state["actualizado"] = datetime.now().isoformat()
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=json.dumps(self.state).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+    def confirm(self, key, error=None):
+        self.state["ultima_clave"] = key
+        self.state["procesados"] += 1
+        if error:
+            self.state["fallidos"].append({"clave": key, "error": error})
+
+
+def source_extractor(manifest, source, current_versions):
+    """Extractor de la fila; las fuentes registradas sin el se infieren de las etapas."""
+    if source.get("extractor"):
+        return source["extractor"]
+    stages = manifest.get("etapas", {})
+    return "claude" if stages.get("images") == current_versions["images"] else "textract"
+
+
+def reextract(store, manifest, extractor):
+    """Corre `extractor` sobre los artefactos del documento; devuelve los campos."""
+    doc_hash = manifest["documento_hash"]
+    stages = manifest.get("etapas", {})
+    current = store.versions
+
+    if extractor == "claude" and stages.get("images") == current["images"]:
+        content = store.get(doc_hash, "images")
+        content.append({"type": "text", "text": build_prompt_text()})
+        return extract_fields(content)
+    if extractor == "textract" and stages.get("textract") == current["textract"]:
+        return extract_from_blocks(store.get(doc_hash, "textract"))
+    if extractor == "cascade" and stages.get("textract") == current["textract"]:
+        # Importa la rasterizacion (PyMuPDF), solo la necesita este extractor
+        from ocr.cascade import extract_with_cascade
+
+        # Sin el archivo original: si hay que escalar, la cascada usa las
+        # imagenes guardadas y falla si no estan
+        return extract_with_cascade(None, None, store, doc_hash)
+    raise ValueError(f"Sin artefactos vigentes para el extractor {extractor}: {stages}")
+
+
+def update_rows(table_name, sources, result, job_id):
+    """Actualiza los campos extraidos en las filas de ocr_files_data de `sources`."""
+    values = dict(result, version_prompt=job_id, reextraido=datetime.now().isoformat())
+    writer = get_writer(table_name)
+    for source in sources:
+        # No se crean filas nuevas: solo se actualizan las existentes
+        if not writer.update({"uuid": source["uuid"]}, values, only_existing=True):
+            logger.warning(f"La fila {source['uuid']} ya no existe en {table_name}")
+
+
+def process_manifest(store, key, table_name, mode, job_id):
+    """
+    Re-extrae el documento una vez por extractor presente entre sus fuentes
+    (o solo con `mode` si no es "auto") y actualiza las filas de cada uno.
+    """
+    try:
+        manifest = store.get_manifest(store.doc_hash_of(key))
+        groups = {}
+        for source in manifest["fuentes"]:
+            extractor = source_extractor(manifest, source, store.versions) if mode == "auto" else mode
+            groups.setdefault(extractor, []).append(source)
+        for extractor, sources in groups.items():
+            result = reextract(store, manifest, extractor)
+            update_rows(table_name, sources, result, job_id)
+        return None
+    except Exception as e:
+        logger.error(f"Error re-extrayendo {key}: {str(e)}")
+        return str(e)
+
+
+def run_backfill(
+    bucket=ARTIFACT_STORE_BUCKET,
+    table_name=DYNAMODB_TABLE_NAME,
+    job_id=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    mode="auto",
+    limit=None,
+    should_stop=lambda: False,
+    s3_client=None,
+):
+    """
+    Re-extrae todos los documentos del almacen de artefactos con a lo sumo
+    `concurrency` llamadas al modelo en vuelo. El checkpoint avanza hasta el
+    ultimo manifest cuyo procesamiento (y el de todos los anteriores) termino,
+    asi que reanudar nunca saltea documentos.
+    """
+    s3_client = s3_client or boto3.client("s3")
+    store = ArtifactStore(s3_client, bucket)
+    job_id = job_id or prompt_version()
+    checkpoint = Checkpoint(s3_client, bucket, job_id).load()
+    if checkpoint.state["completo"]:
+        logger.info(f"El job {job_id} ya esta completo")
+        return checkpoint.state
+
+    slots = threading.Semaphore(concurrency)
+    window = deque()  # (clave, future) en el orden del listado
+    since_save = 0
+    submitted = 0
+    stopped = False
+    start = time.perf_counter()
+
+    def confirm_done():
+        nonlocal since_save
+        while window and window[0][1].done():
+            key, future = window.popleft()
+            checkpoint.confirm(key, future.result())
+            since_save += 1
+        if since_save >= CHECKPOINT_EVERY:
+            checkpoint.save()
+            since_save = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for key in store.iterate_manifest_keys(start_after=checkpoint.state["ultima_clave"]):
+            if should_stop() or (limit is not None and submitted >= limit):
+                stopped = True
+                break
+            slots.acquire()
+            future = executor.submit(process_manifest, store, key, table_name, mode, job_id)
+            future.add_done_callback(lambda _: slots.release())
+            window.append((key, future))
+            submitted += 1
+            confirm_done()
+
+    confirm_done()
+    checkpoint.state["completo"] = not stopped
+    checkpoint.save()
+
+    elapsed = time.perf_counter() - start
+    report = dict(
+        checkpoint.state,
+        documentos_esta_ejecucion=submitted,
+        elapsed_s=round(elapsed, 3),
+        docs_per_second=round(submitted / elapsed, 2) if elapsed else None,
+    )
+    logger.info(f"Backfill {job_id}: {json.dumps({k: v for k, v in report.items() if k != 'fallidos'})}")
+    return report
+
+
+def lambda_handler(event, context):
+    """
+    Procesa hasta agotar el tiempo de la invocacion; si devuelve
+    "completo": false se vuelve a invocar con el mismo job_id para continuar.
+    """
+    logger.info(f"Received event: {json.dumps(event)}")
+    return run_backfill(
+        job_id=event.get("job_id"),
+        concurrency=int(event.get("concurrency", DEFAULT_CONCURRENCY)),
+        mode=event.get("mode", "auto"),
+        should_stop=lambda: context.get_remaining_time_in_millis() < LAMBDA_MARGIN_MS,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-extrae ocr_files_data desde los artefactos guardados (solo llamadas al modelo)"
+    )
+    parser.add_argument("--bucket", default=ARTIFACT_STORE_BUCKET, required=ARTIFACT_STORE_BUCKET is None)
+    parser.add_argument("--table", default=DYNAMODB_TABLE_NAME)
+    parser.add_argument("--job-id", help="por defecto, el hash de los prompts actuales")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--mode", choices=MODES, default="auto")
+    parser.add_argument("--limit", type=int, help="documentos como maximo en esta ejecucion")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = run_backfill(
+        bucket=args.bucket,
+        table_name=args.table,
+        job_id=args.job_id,
+        concurrency=args.concurrency,
+        mode=args.mode,
+        limit=args.limit,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import os
+import logging
+import boto3
+
+from utils import extract_json
+from prompting import load_prompt, load_template, load_output_tool
+from hedging import HedgedCaller
+
+# Model-call side of the OCR pipeline. It does not depend on PyMuPDF/PIL so the
+# low-memory model stage can import it without loading the rasterization layers.
+
+logger = logging.getLogger()
+
+# Environment variables
+CLAUDE_MODEL = os.environ.get(
+    "CLAUDE_MODEL", "anthropic.claude-3-haiku-20240307-v1:0"
+)  # "anthropic.claude-3-5-sonnet-20240620-v1:0") # anthropic.claude-3-haiku-20240307-v1:0
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+FILE_KEY = os.environ.get("FILE_KEY")
+# "text": free-form JSON extracted from the reply, "tool": forced tool use with a typed schema
+OUTPUT_MODE = os.environ.get("OUTPUT_MODE", "text")
+# Opt-in hedged requests: a second call goes out if the first one is slow
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "false").lower() == "true"
+# Separate from TITAN_HEDGE_MODEL: the cascade loads both modules
+HEDGE_MODEL = os.environ.get("CLAUDE_HEDGE_MODEL", CLAUDE_MODEL)
+HEDGE_REGION = os.environ.get("HEDGE_REGION")
+
+# Replaces the JSON example in the prompt when the schema travels in the tool
+TOOL_MODE_EXAMPLE = "Use the registrar_comprobante tool; each field is described in its input schema."
+# Stands in for the content blocks while the rest of the request body is serialized
+CONTENT_SLOT = json.dumps("__content__").encode("utf-8")
+
+# Initialize AWS clients
+bedrock_client = boto3.client("bedrock-runtime")
+hedge_bedrock_client = (
+    boto3.client("bedrock-runtime", region_name=HEDGE_REGION) if HEDGE_REGION else None
+)
+claude_hedger = HedgedCaller.from_env("claude") if HEDGE_ENABLED else None
+
+
+# Prompt text appended after the images, rendered from the cached template
+def build_prompt_text():
+    template = load_template(BUCKET_NAME, FILE_KEY)
+
+    if OUTPUT_MODE == "tool":
+        return template.render(example=TOOL_MODE_EXAMPLE)
+
+    prompt_json_data = load_prompt(BUCKET_NAME, FILE_KEY.replace(".txt", ".json"))
+    return f"{template.render(example=prompt_json_data)} \n Assistant: {'{'}"
+
+
+def get_output_tool():
+    return load_output_tool(BUCKET_NAME, FILE_KEY.replace(".txt", ".json"))
+
+
+# Appends a text block to a JSON-encoded list of content blocks without decoding
+# it, so the base64 images of a stored artifact are never parsed and re-encoded
+def append_text_block(content_json, text):
+    end = content_json.rindex(b"]")
+    separator = b"," if content_json.find(b"{", 0, end) != -1 else b""
+    block = json.dumps({"type": "text", "text": text}).encode("utf-8")
+    return b"".join((memoryview(content_json)[:end], separator, block, b"]"))
+
+
+# Calls Claude with the full content (images + prompt) and returns the parsed fields.
+# `content` is a list of content blocks or that list already encoded as JSON bytes.
+def extract_fields(content):
+    if OUTPUT_MODE == "tool":
+        return call_claude(content, tool=get_output_tool())
+    return json.loads(extract_json(call_claude(content)))
+
+
+def build_request_body(content_json, tool=None):
+    """
+    Bedrock request body (bytes) with the JSON-encoded content blocks spliced
+    in as they are, in a single copy.
+    """
+    request_body = {
+        "messages": [
+            {
+                "role": "user",
+                "content": "__content__",
+            }
+        ],
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 200000,
+        "temperature": 0.1,
+        "top_k": 2,
+        "top_p": 0.2,
+    }
+    if tool is not None:
+        request_body["tools"] = [tool]
+        request_body["tool_choice"] = {"type": "tool", "name": tool["name"]}
+
+    head, tail = json.dumps(request_body).encode("utf-8").split(CONTENT_SLOT, 1)
+    return b"".join((head, content_json, tail))
+
+
+def call_claude(content, tool=None):
+    """
+    Calls Claude on Bedrock. Without `tool` returns the raw response text;
+    with `tool` forces that tool and returns its already-parsed input.
+    """
+    try:
+        logger.info("Calling Claude with content:")
+        if not isinstance(content, (bytes, bytearray)):
+            content = json.dumps(content).encode("utf-8")
+        body = build_request_body(content, tool)
+
+        if claude_hedger is None:
+            response_json = invoke_claude(bedrock_client, CLAUDE_MODEL, body)
+        else:
+            response_json = claude_hedger.call(
+                lambda: invoke_claude(bedrock_client, CLAUDE_MODEL, body),
+                lambda: invoke_claude(
+                    hedge_bedrock_client or bedrock_client, HEDGE_MODEL, body
+                ),
+            )
+
+        if tool is None:
+            return response_json["content"][0]["text"]
+
+        for block in response_json["content"]:
+            if block["type"] == "tool_use" and block["name"] == tool["name"]:
+                return block["input"]
+        raise ValueError(f"Claude did not call the {tool['name']} tool")
+    except Exception as e:
+        logger.error(f"Error calling Claude: {str(e)}")
+        raise e
+
+
+def invoke_claude(client, model_id, body):
+    response = client.invoke_model(modelId=model_id, body=body)
+    return json.loads(response["body"].read())
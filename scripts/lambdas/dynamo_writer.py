@@ -0,0 +1,439 @@
+import json
+import os
+import logging
+import math
+import uuid as uuid_lib
+from decimal import Decimal
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+# Escritura directa con el cliente de bajo nivel de DynamoDB.
+#
+# Los items se serializan en una sola pasada al formato AttributeValue
+# ({"S": ...}, {"N": ...}, {"M": ...}), calculando a la vez el tamaño de cada
+# atributo segun las reglas de DynamoDB. Si el item supera el limite de
+# 400 KB, los atributos mas grandes se guardan en S3 y el item solo conserva
+# su URI en "campos_en_s3"; resolve_offloaded los vuelve a leer. Cada
+# escritura sube esos atributos con su propio id, asi una escritura rechazada
+# nunca pisa los objetos de la fila vigente, y una escritura aplicada borra
+# los objetos de los punteros que reemplazo. Las escrituras son
+# condicionales: un item no pisa a otro mas nuevo (por ejemplo, segun
+# "timestamp").
+
+logger = logging.getLogger()
+
+# Margen bajo los 400 KB del limite de DynamoDB
+MAX_ITEM_BYTES = int(os.environ.get("DYNAMODB_MAX_ITEM_BYTES", str(380 * 1024)))
+# Limite de DynamoDB. Un update cuyos valores entran en el margen entre
+# MAX_ITEM_BYTES y este limite se escribe sin leer el item
+ITEM_LIMIT_BYTES = 400 * 1024
+# Intentos de un update medido si otra escritura cambia campos_en_s3 entre
+# la lectura y la escritura
+UPDATE_ATTEMPTS = 3
+OFFLOAD_BUCKET = os.environ.get("DYNAMODB_OFFLOAD_BUCKET", os.environ.get("BUCKET_NAME"))
+OFFLOAD_PREFIX = os.environ.get("DYNAMODB_OFFLOAD_PREFIX", "dynamodb-offload/")
+OFFLOADED_ATTRIBUTE = "campos_en_s3"
+
+dynamodb_client = boto3.client("dynamodb")
+s3_client = boto3.client("s3")
+deserializer = TypeDeserializer()
+
+
+class ItemTooLarge(ValueError):
+    pass
+
+
+def number_size(text):
+    """Tamaño de un numero en DynamoDB: ~1 byte cada 2 digitos significativos + 1."""
+    digits = text.lstrip("-").split("e")[0].split("E")[0].replace(".", "").strip("0")
+    return (len(digits) + 1) // 2 + 1
+
+
+def serialize(value):
+    """Devuelve (AttributeValue, tamaño en bytes) de un valor de Python."""
+    if value is None:
+        return {"NULL": True}, 1
+    if isinstance(value, bool):
+        return {"BOOL": value}, 1
+    if isinstance(value, str):
+        return {"S": value}, len(value.encode("utf-8"))
+    if isinstance(value, int):
+        text = str(value)
+        return {"N": text}, number_size(text)
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise ValueError(f"DynamoDB no admite el numero {value}")
+        text = repr(value)
+        return {"N": text}, number_size(text)
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            raise ValueError(f"DynamoDB no admite el numero {value}")
+        text = str(value)
+        return {"N": text}, number_size(text)
+    if isinstance(value, dict):
+        attributes, size = serialize_map(value)
+        return {"M": attributes}, size + 3
+    if isinstance(value, (list, tuple)):
+        elements = []
+        size = 3
+        for element in value:
+            attribute, element_size = serialize(element)
+            elements.append(attribute)
+            size += element_size + 1
+        return {"L": elements}, size
+    if isinstance(value, (bytes, bytearray)):
+        return {"B": bytes(value)}, len(value)
+    if isinstance(value, (set, frozenset)) and value:
+        if all(isinstance(v, str) for v in value):
+            return {"SS": list(value)}, sum(len(v.encode("utf-8")) for v in value)
+        if all(isinstance(v, (int, float, Decimal)) and not isinstance(v, bool) for v in value):
+            texts = [str(v) for v in value]
+            return {"NS": texts}, sum(number_size(t) for t in texts)
+    raise TypeError(f"Tipo no soportado por DynamoDB: {type(value).__name__}")
+
+
+def attribute_size(attribute):
+    """Tamaño en bytes de un AttributeValue ya serializado (mismas reglas que serialize)."""
+    ((kind, value),) = attribute.items()
+    if kind in ("NULL", "BOOL"):
+        return 1
+    if kind == "S":
+        return len(value.encode("utf-8"))
+    if kind == "N":
+        return number_size(value)
+    if kind == "B":
+        return len(value)
+    if kind == "M":
+        return 3 + sum(len(name.encode("utf-8")) + attribute_size(v) + 1 for name, v in value.items())
+    if kind == "L":
+        return 3 + sum(attribute_size(v) + 1 for v in value)
+    if kind == "SS":
+        return sum(len(v.encode("utf-8")) for v in value)
+    if kind == "NS":
+        return sum(number_size(v) for v in value)
+    return sum(len(v) for v in value)  # BS
+
+
+def offloaded_pointers(attributes):
+    """{nombre: URI} de campos_en_s3 en atributos con formato AttributeValue."""
+    return {name: uri["S"] for name, uri in attributes.get(OFFLOADED_ATTRIBUTE, {}).get("M", {}).items()}
+
+
+def resolve_offloaded(item, s3=None):
+    """Reemplaza los punteros de campos_en_s3 del item por los valores guardados en S3."""
+    pointers = item.pop(OFFLOADED_ATTRIBUTE, None) or {}
+    for name, uri in pointers.items():
+        bucket, _, key = uri[len("s3://"):].partition("/")
+        response = (s3 or s3_client).get_object(Bucket=bucket, Key=key)
+        item[name] = json.loads(response["Body"].read())
+    return item
+
+
+def serialize_map(item):
+    """Serializa un dict; devuelve ({nombre: AttributeValue}, tamaño total)."""
+    attributes = {}
+    size = 0
+    for name, value in item.items():
+        attribute, value_size = serialize(value)
+        attributes[name] = attribute
+        size += len(name.encode("utf-8")) + value_size + 1
+    return attributes, size
+
+
+class ItemWriter:
+    def __init__(
+        self,
+        table_name,
+        key_names=("uuid",),
+        client=None,
+        s3=None,
+        offload_bucket=OFFLOAD_BUCKET,
+        offload_prefix=OFFLOAD_PREFIX,
+        max_item_bytes=MAX_ITEM_BYTES,
+        item_limit_bytes=ITEM_LIMIT_BYTES,
+    ):
+        self.table_name = table_name
+        self.key_names = key_names
+        self.client = client or dynamodb_client
+        self.s3 = s3 or s3_client
+        self.offload_bucket = offload_bucket
+        self.offload_prefix = offload_prefix
+        self.max_item_bytes = max_item_bytes
+        self.item_limit_bytes = item_limit_bytes
+        self._update_expressions = {}
+
+    # ------------------------ Tamaño ------------------------
+
+    def plan_offload(self, key, sizes, total, candidates):
+        """
+        Elige, de mayor a menor, los atributos de `candidates` a guardar en S3
+        hasta que el item entre en max_item_bytes. Devuelve ({nombre: clave
+        en S3}, tamaño restante); las claves llevan un id propio de esta
+        escritura.
+        """
+        if total <= self.max_item_bytes:
+            return {}, total
+        if not self.offload_bucket:
+            raise ItemTooLarge(
+                f"Item de {total} bytes supera {self.max_item_bytes} y no hay bucket para DYNAMODB_OFFLOAD_BUCKET"
+            )
+        key_path = "/".join(str(key[name]) for name in self.key_names)
+        write_id = uuid_lib.uuid4().hex
+        offloads = {}
+        for name in sorted(candidates, key=sizes.get, reverse=True):
+            if total <= self.max_item_bytes:
+                break
+            offloads[name] = f"{self.offload_prefix}{self.table_name}/{key_path}/{write_id}/{name}.json"
+            total -= sizes[name]
+        return offloads, total
+
+    def prepare(self, item):
+        """
+        Serializa el item y, si supera max_item_bytes, reemplaza los atributos
+        mas grandes (nunca la clave) por su URI en campos_en_s3. Devuelve
+        (atributos, tamaño, {nombre: clave en S3}); los objetos se suben en put.
+        """
+        attributes = {}
+        sizes = {}
+        for name, value in item.items():
+            attributes[name], value_size = serialize(value)
+            sizes[name] = len(name.encode("utf-8")) + value_size
+        candidates = [name for name in sizes if name not in self.key_names]
+        offloads, total = self.plan_offload(item, sizes, sum(sizes.values()), candidates)
+        if not offloads:
+            return attributes, total, offloads
+
+        for name in offloads:
+            del attributes[name]
+        pointer, pointer_size = serialize(self.uris(offloads))
+        attributes[OFFLOADED_ATTRIBUTE] = pointer
+        total += len(OFFLOADED_ATTRIBUTE) + pointer_size
+        if total > self.max_item_bytes:
+            raise ItemTooLarge(f"Item de {total} bytes aun despues de mover atributos a S3")
+        return attributes, total, offloads
+
+    def uris(self, offloads):
+        return {name: f"s3://{self.offload_bucket}/{s3_key}" for name, s3_key in offloads.items()}
+
+    def upload(self, values, offloads):
+        for name, s3_key in offloads.items():
+            self.s3.put_object(
+                Bucket=self.offload_bucket,
+                Key=s3_key,
+                Body=json.dumps(values[name], ensure_ascii=False, default=str).encode("utf-8"),
+                ContentType="application/json",
+            )
+            logger.warning(f"Atributo {name} guardado en s3://{self.offload_bucket}/{s3_key}")
+
+    def discard(self, offloads):
+        """Borra los objetos de una escritura que no se aplico."""
+        for s3_key in offloads.values():
+            self.s3.delete_object(Bucket=self.offload_bucket, Key=s3_key)
+
+    def delete_superseded(self, old_pointers, pointers):
+        """Borra los objetos de los punteros de la fila anterior que ya no estan en `pointers`."""
+        for name, uri in old_pointers.items():
+            if pointers.get(name) == uri:
+                continue
+            bucket, _, s3_key = uri[len("s3://"):].partition("/")
+            try:
+                self.s3.delete_object(Bucket=bucket, Key=s3_key)
+            except Exception as e:
+                # La escritura ya se aplico: el objeto queda huerfano, no se falla
+                logger.error(f"Error al borrar {uri}: {str(e)}")
+
+    # ------------------------ Lectura ------------------------
+
+    def get(self, key):
+        """Item `key` (lectura consistente) con los atributos de S3 resueltos; None si no existe."""
+        response = self.client.get_item(
+            TableName=self.table_name, Key=serialize_map(key)[0], ConsistentRead=True
+        )
+        if "Item" not in response:
+            return None
+        item = {name: deserializer.deserialize(value) for name, value in response["Item"].items()}
+        return resolve_offloaded(item, self.s3)
+
+    # ------------------------ Escritura ------------------------
+
+    def put(self, item, newer_than=None, fence=None):
+        """
+        Escribe el item. Con `newer_than` (nombre de un atributo ordenable,
+        como "timestamp") solo reemplaza una fila existente si el valor nuevo
+        es mayor. Con `fence` (nombre de un atributo numerico, si el item lo
+        tiene) tampoco reemplaza una fila escrita con un fence mayor, aunque
+        su `newer_than` sea menor. Devuelve False si la condicion no se cumplio.
+        """
+        attributes, size, offloads = self.prepare(item)
+        kwargs = {"TableName": self.table_name, "Item": attributes, "ReturnValues": "ALL_OLD"}
+        conditions, names, values = [], {}, {}
+        if newer_than is not None:
+            conditions.append("#order < :order")
+            names["#order"] = newer_than
+            values[":order"] = attributes[newer_than]
+        if fence is not None and fence in attributes:
+            conditions.append("(attribute_not_exists(#fence) OR #fence <= :fence)")
+            names["#fence"] = fence
+            values[":fence"] = attributes[fence]
+        if conditions:
+            kwargs["ConditionExpression"] = "attribute_not_exists(#key) OR (" + " AND ".join(conditions) + ")"
+            kwargs["ExpressionAttributeNames"] = dict(names, **{"#key": self.key_names[0]})
+            kwargs["ExpressionAttributeValues"] = values
+        self.upload(item, offloads)
+        try:
+            response = self.client.put_item(**kwargs)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            self.discard(offloads)
+            logger.warning(f"No se sobrescribe {self.key_of(item)}: ya existe una version mas nueva")
+            return False
+        self.delete_superseded(offloaded_pointers(response.get("Attributes", {})), self.uris(offloads))
+        logger.info(f"Guardado en DynamoDB {self.key_of(item)} ({size} bytes)")
+        return True
+
+    def update_expression(self, names, condition, removed=()):
+        """
+        UpdateExpression, ConditionExpression y nombres de atributos, cacheados
+        por conjunto de campos. `condition` es (only_existing, punteros): con
+        punteros None ningun campo de `names` puede estar en campos_en_s3, con
+        "absent" el item no tiene campos_en_s3 y con "equal" lo tiene igual a
+        :p, el valor leido.
+        """
+        cache_key = (names, condition, removed)
+        if cache_key not in self._update_expressions:
+            only_existing, pointers = condition
+            placeholders = {"#p": OFFLOADED_ATTRIBUTE}
+
+            def placeholder(prefix, i, name):
+                if name == OFFLOADED_ATTRIBUTE:
+                    return "#p"
+                placeholders[f"{prefix}{i}"] = name
+                return f"{prefix}{i}"
+
+            expression = "SET " + ", ".join(
+                f"{placeholder('#f', i, name)} = :v{i}" for i, name in enumerate(names)
+            )
+            if removed:
+                expression += " REMOVE " + ", ".join(
+                    placeholder("#r", i, name) for i, name in enumerate(removed)
+                )
+            conditions = []
+            if only_existing:
+                conditions.append("attribute_exists(#key)")
+                placeholders["#key"] = self.key_names[0]
+            if pointers is None:
+                conditions.extend(f"attribute_not_exists(#p.#f{i})" for i in range(len(names)))
+            elif pointers == "absent":
+                conditions.append("attribute_not_exists(#p)")
+            else:
+                conditions.append("#p = :p")
+            self._update_expressions[cache_key] = (expression, " AND ".join(conditions), placeholders)
+        return self._update_expressions[cache_key]
+
+    def send_update(self, key_attributes, serialized, condition, removed=(), read_pointers=None):
+        """UpdateItem de `serialized` (ya en formato AttributeValue); devuelve la respuesta con UPDATED_OLD."""
+        names = tuple(serialized)
+        expression, condition_expression, placeholders = self.update_expression(names, condition, removed)
+        values = {f":v{i}": serialized[name] for i, name in enumerate(names)}
+        if read_pointers is not None:
+            values[":p"] = read_pointers
+        return self.client.update_item(
+            TableName=self.table_name,
+            Key=key_attributes,
+            UpdateExpression=expression,
+            ConditionExpression=condition_expression,
+            ExpressionAttributeNames=placeholders,
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_OLD",
+        )
+
+    def update(self, key, values, only_existing=False):
+        """
+        Actualiza los atributos de `values` en el item `key`. Con
+        only_existing=True no crea el item si no existe y devuelve False.
+        Si los valores nuevos entran en el margen entre max_item_bytes y el
+        limite de DynamoDB y ninguno esta en campos_en_s3, se escriben sin
+        leer el item. Si no, lee el item y lo mide como put: guarda en S3 los
+        valores nuevos mas grandes si no entra, y descarta los punteros de
+        los atributos que se reemplazan.
+        """
+        key_attributes = serialize_map(key)[0]
+        serialized, sizes = {}, {}
+        for name, value in values.items():
+            serialized[name], value_size = serialize(value)
+            sizes[name] = len(name.encode("utf-8")) + value_size
+
+        if sum(sizes.values()) <= self.item_limit_bytes - self.max_item_bytes:
+            try:
+                self.send_update(key_attributes, serialized, (only_existing, None))
+                return True
+            except ClientError as e:
+                # Un campo con puntero en S3, un item inexistente o uno que ya
+                # no entra en el limite: se resuelve leyendo el item
+                if e.response["Error"]["Code"] not in ("ConditionalCheckFailedException", "ValidationException"):
+                    raise
+
+        for _ in range(UPDATE_ATTEMPTS):
+            current = self.client.get_item(
+                TableName=self.table_name, Key=key_attributes, ConsistentRead=True
+            ).get("Item")
+            if current is None and only_existing:
+                return False
+            if self.sized_update(key, key_attributes, values, serialized, sizes, current or {}, only_existing):
+                return True
+        logger.warning(f"No se actualiza {key}: campos_en_s3 cambio en cada intento")
+        return False
+
+    def sized_update(self, key, key_attributes, values, serialized, sizes, current, only_existing):
+        """
+        Update medido contra `current`, el item leido. La escritura se
+        condiciona a que campos_en_s3 siga como se leyo; devuelve False si
+        cambio, sin dejar objetos en S3.
+        """
+        total = sum(sizes.values()) + sum(
+            len(name.encode("utf-8")) + attribute_size(value)
+            for name, value in current.items()
+            if name not in values and name != OFFLOADED_ATTRIBUTE
+        )
+        candidates = [name for name in values if name not in self.key_names]
+        offloads, total = self.plan_offload(key, sizes, total, candidates)
+
+        pointers = {name: uri for name, uri in offloaded_pointers(current).items() if name not in values}
+        pointers.update(self.uris(offloads))
+        serialized = {name: value for name, value in serialized.items() if name not in offloads}
+        if pointers:
+            serialized[OFFLOADED_ATTRIBUTE], pointer_size = serialize(pointers)
+            total += len(OFFLOADED_ATTRIBUTE) + pointer_size
+        if total > self.max_item_bytes:
+            raise ItemTooLarge(f"Item de {total} bytes aun despues de mover atributos a S3")
+
+        removed = tuple(name for name in offloads if name in current)
+        if not pointers and OFFLOADED_ATTRIBUTE in current:
+            removed += (OFFLOADED_ATTRIBUTE,)
+        read_pointers = current.get(OFFLOADED_ATTRIBUTE)
+        condition = (only_existing, "absent" if read_pointers is None else "equal")
+        self.upload(values, offloads)
+        try:
+            response = self.send_update(key_attributes, serialized, condition, removed, read_pointers)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            self.discard(offloads)
+            return False
+        self.delete_superseded(offloaded_pointers(response.get("Attributes", {})), pointers)
+        return True
+
+    def key_of(self, item):
+        return {name: item.get(name) for name in self.key_names}
+
+
+_writers = {}
+
+
+def get_writer(table_name, key_names=("uuid",)):
+    """Un ItemWriter por tabla y contenedor (reutiliza las expresiones cacheadas)."""
+    if (table_name, key_names) not in _writers:
+        _writers[(table_name, key_names)] = ItemWriter(table_name, key_names)
+    return _writers[(table_name, key_names)]
@@ -0,0 +1,298 @@
+import argparse
+import csv
+import io
+import json
+import os
+import logging
+import sys
+import time
+import uuid as uuid_lib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+
+# Permite ejecutar el script directamente (CLI) ademas de como Lambda
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import decimal_to_number
+from dynamo_writer import resolve_offloaded
+from prompting import FIELD_SCHEMAS
+from validators import parse_amount
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin el solo se exporta CSV
+    pa = None
+    pq = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME", "ocr_files_data")
+EXPORT_BUCKET = os.environ.get("EXPORT_BUCKET", os.environ.get("BUCKET_NAME"))
+EXPORT_PREFIX = os.environ.get("EXPORT_PREFIX", "exports/")
+USER_INDEX_NAME = "id_usuario-index"
+
+DEFAULT_SEGMENTS = int(os.environ.get("EXPORT_SEGMENTS", "8"))
+# Filas en memoria por segmento antes de escribir un archivo
+DEFAULT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+
+LEADING_COLUMNS = ["uuid", "id_usuario", "timestamp", "s3_uri"]
+
+# Schema fijo de Parquet para las columnas conocidas, asi todos los archivos de
+# un export (y de exports distintos) tienen los mismos tipos aunque un chunk
+# traiga, por ejemplo, solo montos enteros o montos como texto. id_usuario es
+# string porque las filas sin usuario guardan "anonimo". Las columnas no
+# conocidas se escriben siempre como string.
+COLUMN_TYPES = dict(
+    [(name, "string") for name in LEADING_COLUMNS]
+    + [
+        (name, "float64" if schema["type"] == "number" else "string")
+        for name, schema in FIELD_SCHEMAS.items()
+    ]
+    + [(f"confianza.{name}", "float64") for name in FIELD_SCHEMAS]
+)
+
+
+def flatten(item, prefix=""):
+    """Aplana mapas anidados (confianza.cuit) y serializa listas como JSON."""
+    row = {}
+    for key, value in item.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            row.update(flatten(value, f"{name}."))
+        elif isinstance(value, (set, frozenset)):
+            row[name] = json.dumps(sorted(value, key=str), default=str)
+        elif isinstance(value, list):
+            row[name] = json.dumps(value, default=str)
+        else:
+            row[name] = value
+    return row
+
+
+def to_row(item):
+    return flatten(decimal_to_number(item))
+
+
+def month_of(row):
+    timestamp = str(row.get("timestamp") or "")
+    return timestamp[:7] if len(timestamp) >= 7 else "unknown"
+
+
+def previous_month(today=None):
+    today = today or datetime.now()
+    year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    return f"{year:04d}-{month:02d}"
+
+
+class ChunkWriter:
+    """
+    Acumula filas por particion (mes) y las escribe como CSV y Parquet en S3
+    cada `chunk_rows` filas, de modo que la memoria queda acotada por segmento.
+    """
+
+    def __init__(self, s3_client, bucket, prefix, segment, formats, chunk_rows):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.segment = segment
+        self.formats = formats
+        self.chunk_rows = chunk_rows
+        self.partitions = {}
+        self.buffered = 0
+        self.parts = 0
+        self.rows = 0
+        self.files = []
+
+    def add(self, row):
+        self.partitions.setdefault(month_of(row), []).append(row)
+        self.buffered += 1
+        self.rows += 1
+        if self.buffered >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        for month, rows in self.partitions.items():
+            if rows:
+                self.write(month, rows)
+        self.partitions = {}
+        self.buffered = 0
+
+    def write(self, month, rows):
+        # Las columnas conocidas se escriben siempre, en el mismo orden
+        present = {name for row in rows for name in row}
+        columns = list(COLUMN_TYPES) + sorted(present - set(COLUMN_TYPES))
+        base_key = f"{self.prefix}month={month}/segment={self.segment:03d}/part-{self.parts:05d}"
+        self.parts += 1
+
+        if "csv" in self.formats:
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+            self.upload(f"{base_key}.csv", buffer.getvalue().encode("utf-8"))
+
+        if "parquet" in self.formats and pa is not None:
+            schema = parquet_schema(columns)
+            table = pa.Table.from_pydict(
+                {
+                    c: parquet_column([row.get(c) for row in rows], COLUMN_TYPES.get(c, "string"))
+                    for c in columns
+                },
+                schema=schema,
+            )
+            buffer = io.BytesIO()
+            pq.write_table(table, buffer, compression="snappy")
+            self.upload(f"{base_key}.parquet", buffer.getvalue())
+
+    def upload(self, key, body):
+        self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=body)
+        self.files.append(f"s3://{self.bucket}/{key}")
+
+
+def parquet_schema(columns):
+    return pa.schema([(c, getattr(pa, COLUMN_TYPES.get(c, "string"))()) for c in columns])
+
+
+def parquet_column(values, column_type="string"):
+    """
+    Convierte los valores al tipo fijo de la columna: float64 interpreta
+    montos como "1.234,56" (None si no es un numero) y string serializa
+    cualquier otro valor.
+    """
+    if column_type == "float64":
+        return [None if v is None or isinstance(v, bool) else parse_amount(v) for v in values]
+    return [None if v is None else str(v) for v in values]
+
+
+def iterate_pages(table, **kwargs):
+    """Recorre un Scan o Query paginado devolviendo cada pagina de items."""
+    operation = table.query if "KeyConditionExpression" in kwargs else table.scan
+    while True:
+        response = operation(**kwargs)
+        yield response.get("Items", [])
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def export_segment(table_name, segment, total_segments, writer, month=None, id_usuario=None):
+    # Los resources de boto3 no son thread-safe: una sesion por segmento
+    table = boto3.session.Session().resource("dynamodb").Table(table_name)
+
+    if id_usuario is not None:
+        kwargs = {
+            "IndexName": USER_INDEX_NAME,
+            "KeyConditionExpression": Key("id_usuario").eq(id_usuario),
+        }
+    else:
+        kwargs = {"Segment": segment, "TotalSegments": total_segments}
+    if month:
+        kwargs["FilterExpression"] = Attr("timestamp").begins_with(month)
+
+    for items in iterate_pages(table, **kwargs):
+        for item in items:
+            # Los atributos que no entraban en el item se leen de S3
+            writer.add(to_row(resolve_offloaded(item, writer.s3_client)))
+    writer.flush()
+    return writer
+
+
+def run_export(
+    table_name=DYNAMODB_TABLE_NAME,
+    bucket=EXPORT_BUCKET,
+    segments=DEFAULT_SEGMENTS,
+    month=None,
+    id_usuario=None,
+    formats=("csv", "parquet"),
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+):
+    """
+    Exporta `ocr_files_data` a s3://bucket/exports/<id>/month=YYYY-MM/...
+
+    Con `id_usuario` consulta el GSI id_usuario-index en lugar de escanear
+    la tabla; si no, ejecuta un Scan paralelo de `segments` segmentos.
+    """
+    if "parquet" in formats and pa is None:
+        logger.warning("pyarrow no esta instalado: se exporta solo CSV")
+
+    export_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid_lib.uuid4().hex[:8]}"
+    prefix = f"{EXPORT_PREFIX}{export_id}/"
+    if id_usuario is not None:
+        segments = 1
+
+    s3_client = boto3.client("s3")  # los clientes si son thread-safe
+    writers = [
+        ChunkWriter(s3_client, bucket, prefix, segment, formats, chunk_rows)
+        for segment in range(segments)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [
+            executor.submit(
+                export_segment, table_name, segment, segments, writers[segment], month, id_usuario
+            )
+            for segment in range(segments)
+        ]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    rows = sum(writer.rows for writer in writers)
+    report = {
+        "export_prefix": f"s3://{bucket}/{prefix}",
+        "segments": segments,
+        "month": month,
+        "rows": rows,
+        "files": sum(len(writer.files) for writer in writers),
+        "rows_per_segment": [writer.rows for writer in writers],
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None,
+    }
+    logger.info(f"Export finalizado: {json.dumps(report)}")
+    return report
+
+
+def lambda_handler(event, context):
+    logger.info(f"Received event: {json.dumps(event)}")
+    month = event.get("month")
+    if month == "previous":
+        month = previous_month()
+    return run_export(
+        segments=int(event.get("segments", DEFAULT_SEGMENTS)),
+        month=month,
+        id_usuario=event.get("id_usuario"),
+        formats=tuple(event.get("formats", ("csv", "parquet"))),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta ocr_files_data a CSV/Parquet en S3")
+    parser.add_argument("--table", default=DYNAMODB_TABLE_NAME)
+    parser.add_argument("--bucket", default=EXPORT_BUCKET, required=EXPORT_BUCKET is None)
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument("--month", help="YYYY-MM o 'previous'")
+    parser.add_argument("--id-usuario", type=int, help="consulta el GSI de un solo usuario")
+    parser.add_argument("--formats", default="csv,parquet")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    report = run_export(
+        table_name=args.table,
+        bucket=args.bucket,
+        segments=args.segments,
+        month=previous_month() if args.month == "previous" else args.month,
+        id_usuario=args.id_usuario,
+        formats=tuple(args.formats.split(",")),
+        chunk_rows=args.chunk_rows,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "RindegastORT")
+
+
+class HedgedCaller:
+    """
+    Hedging de llamadas lentas para recortar la latencia de cola.
+
+    Si la llamada primaria no respondio luego de `delay()` (el percentil
+    configurado de las latencias de las llamadas primarias observadas en el
+    contenedor, o
+    `initial_delay_s` hasta juntar `min_samples`), se lanza una segunda llamada
+    y gana la primera respuesta exitosa. La perdedora se abandona: su hilo
+    termina en segundo plano y su resultado se descarta.
+
+    El presupuesto es un token bucket: cada llamada suma `budget_ratio` tokens
+    (hasta `budget_burst`) y cada hedge consume uno, por lo que a largo plazo
+    los hedges no superan `budget_ratio` de las llamadas.
+    """
+
+    def __init__(
+        self,
+        name,
+        percentile=95,
+        initial_delay_s=10.0,
+        min_delay_s=1.0,
+        budget_ratio=0.1,
+        budget_burst=1.0,
+        window=200,
+        min_samples=20,
+        emit_metrics=True,
+    ):
+        self.name = name
+        self.percentile = percentile
+        self.initial_delay_s = initial_delay_s
+        self.min_delay_s = min_delay_s
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.min_samples = min_samples
+        self.emit_metrics = emit_metrics
+
+        self._latencies = deque(maxlen=window)
+        self._tokens = budget_burst
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0,
+            "hedges_sent": 0,
+            "hedges_won": 0,
+            "hedges_denied": 0,
+        }
+
+    @classmethod
+    def from_env(cls, name):
+        return cls(
+            name,
+            percentile=float(os.environ.get("HEDGE_PERCENTILE", "95")),
+            initial_delay_s=float(os.environ.get("HEDGE_INITIAL_DELAY_S", "10")),
+            min_delay_s=float(os.environ.get("HEDGE_MIN_DELAY_S", "1")),
+            budget_ratio=float(os.environ.get("HEDGE_BUDGET_RATIO", "0.1")),
+        )
+
+    def delay(self):
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_delay_s
+        # Rango mas cercano: la menor muestra que cubre el p% de la ventana
+        index = min(len(samples) - 1, max(0, math.ceil(len(samples) * self.percentile / 100.0) - 1))
+        return max(self.min_delay_s, samples[index])
+
+    def hedge_rate(self):
+        with self._lock:
+            calls = self.stats["calls"]
+            return self.stats["hedges_sent"] / calls if calls else 0.0
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.stats["hedges_sent"] += 1
+                return True
+            self.stats["hedges_denied"] += 1
+            return False
+
+    def observe(self, latency_s):
+        """Agrega la latencia de una llamada primaria a la ventana del percentil."""
+        with self._lock:
+            self._latencies.append(latency_s)
+
+    def _record(self, latency_s, hedged, hedge_won):
+        with self._lock:
+            self.stats["calls"] += 1
+            self._tokens = min(self.budget_burst, self._tokens + self.budget_ratio)
+            if hedge_won:
+                self.stats["hedges_won"] += 1
+        if self.emit_metrics:
+            self._emit(latency_s, hedged, hedge_won)
+
+    def _emit(self, latency_s, hedged, hedge_won):
+        # CloudWatch Embedded Metric Format: debe ser una linea JSON cruda en stdout
+        metrics = {
+            "HedgeSent": int(hedged),
+            "HedgeWon": int(hedge_won),
+            "HedgeRate": self.hedge_rate(),
+            "CallLatency": latency_s * 1000,
+        }
+        print(
+            json.dumps(
+                {
+                    "_aws": {
+                        "Timestamp": int(time.time() * 1000),
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": METRICS_NAMESPACE,
+                                "Dimensions": [["Operation"]],
+                                "Metrics": [
+                                    {"Name": "HedgeSent", "Unit": "Count"},
+                                    {"Name": "HedgeWon", "Unit": "Count"},
+                                    {"Name": "HedgeRate", "Unit": "None"},
+                                    {"Name": "CallLatency", "Unit": "Milliseconds"},
+                                ],
+                            }
+                        ],
+                    },
+                    "Operation": self.name,
+                    **metrics,
+                }
+            )
+        )
+
+    def call(self, primary, hedge=None):
+        """
+        Ejecuta `primary()` y, si tarda mas que `delay()`, tambien `hedge()`
+        (por defecto la misma funcion). Devuelve el primer resultado exitoso;
+        si todas las llamadas lanzadas fallan, relanza el error de la primaria.
+        """
+        hedge = hedge or primary
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary_future = executor.submit(primary)
+            # Solo la primaria alimenta el percentil, aun si termina despues de
+            # que gane el hedge: la latencia total de una llamada con hedge
+            # (demora + hedge) sesgaria la ventana y con ella la demora
+            primary_future.add_done_callback(
+                lambda future: future.exception() is None
+                and self.observe(time.perf_counter() - start)
+            )
+            done, _ = wait([primary_future], timeout=self.delay())
+
+            hedged = False
+            pending = {primary_future}
+            if not done and self._take_token():
+                hedged = True
+                pending.add(executor.submit(hedge))
+
+            errors = {}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        hedge_won = future is not primary_future
+                        self._record(time.perf_counter() - start, hedged, hedge_won)
+                        return future.result()
+                    errors[future] = future.exception()
+
+            self._record(time.perf_counter() - start, hedged, False)
+            raise errors.get(primary_future) or next(iter(errors.values()))
+        finally:
+            # No esperamos a la llamada perdedora
+            executor.shutdown(wait=False)
@@ -0,0 +1,304 @@
+import json
+import os
+import logging
+import time
+import hashlib
+import functools
+import threading
+import uuid as uuid_lib
+import boto3
+from botocore.exceptions import ClientError
+
+# Single-flight por documento: un lease condicional en DynamoDB, con clave
+# sha256(bucket/key) mas la version del objeto (VersionId o ETag), garantiza
+# que solo una invocacion procese cada version del objeto. Los reintentos del
+# cliente (timeout de 29 s de API Gateway) esperan el resultado o reciben un
+# estado pendiente, en lugar de volver a pagar Textract y Bedrock; una nueva
+# subida a la misma clave se procesa de nuevo.
+#
+# Cada lease lleva un fence (el instante en que se tomo, en ms) que los
+# handlers guardan en la fila de ocr_files_data con una escritura
+# condicional: una invocacion cuyo lease vencio y fue tomado por otra ya no
+# puede pisar la fila de la nueva duenia.
+
+logger = logging.getLogger()
+
+IDEMPOTENCY_TABLE_NAME = os.environ.get("IDEMPOTENCY_TABLE_NAME")
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL")
+# Duracion del lease; debe superar el timeout de la funcion (300 s)
+LEASE_SECONDS = int(os.environ.get("IDEMPOTENCY_LEASE_SECONDS", "330"))
+# Tiempo durante el cual se devuelve el resultado guardado sin reprocesar
+RESULT_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_RESULT_TTL_SECONDS", "3600"))
+# Espera maxima de un duplicado por el resultado (0 = responder pendiente enseguida)
+WAIT_SECONDS = float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "20"))
+POLL_INTERVAL_SECONDS = float(os.environ.get("IDEMPOTENCY_POLL_INTERVAL_SECONDS", "1"))
+# Intentos de tomar el lease cuando el registro desaparece entre el put y el get
+ACQUIRE_ATTEMPTS = 3
+# Atributo de la fila de ocr_files_data con el fence del lease que la escribio
+FENCE_ATTRIBUTE = "lease_fence"
+
+IN_PROGRESS = "EN_PROCESO"
+COMPLETED = "COMPLETO"
+
+
+s3_client = boto3.client("s3")
+
+_local = threading.local()
+
+
+class Lease:
+    def __init__(self, uuid, token, fence):
+        self.uuid = uuid
+        self.token = token
+        self.fence = fence
+
+
+class IdempotencyStore:
+    def __init__(self, table, lease_seconds=LEASE_SECONDS, result_ttl=RESULT_TTL_SECONDS, clock=time.time):
+        self.table = table
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.clock = clock
+
+    @classmethod
+    def from_env(cls):
+        dynamodb = boto3.resource("dynamodb", endpoint_url=DYNAMODB_ENDPOINT_URL)
+        return cls(dynamodb.Table(IDEMPOTENCY_TABLE_NAME))
+
+    def acquire(self, uuid):
+        """
+        Intenta tomar el lease del documento. Devuelve (Lease, None) si esta
+        invocacion debe procesarlo, o (None, registro) con el registro actual
+        (en proceso o completo) si otra invocacion ya lo tiene.
+
+        Un lease vencido (la invocacion duena murio por timeout) se toma con
+        un token y un fence nuevos, de modo que la duena anterior ya no puede
+        completarlo ni escribir la fila.
+        """
+        for _ in range(ACQUIRE_ATTEMPTS):
+            lease = self._put_lease(uuid)
+            if lease is not None:
+                return lease, None
+            record = self.get(uuid)
+            if record is not None:
+                return None, record
+            # Se libero entre el put y el get: se vuelve a intentar
+        logger.warning(f"No se pudo tomar el lease de {uuid} tras {ACQUIRE_ATTEMPTS} intentos")
+        return None, {"uuid": uuid, "estado": IN_PROGRESS}
+
+    def _put_lease(self, uuid):
+        now = self.clock()
+        token = uuid_lib.uuid4().hex
+        fence = int(now * 1000)
+        now = int(now)
+        try:
+            self.table.put_item(
+                Item={
+                    "uuid": uuid,
+                    "estado": IN_PROGRESS,
+                    "token": token,
+                    "fence": fence,
+                    "lease_expires_at": now + self.lease_seconds,
+                    "expires_at": now + self.lease_seconds + self.result_ttl,
+                },
+                ConditionExpression=(
+                    "attribute_not_exists(#uuid) OR #expires_at < :now"
+                    " OR (#estado = :in_progress AND #lease_expires_at < :now)"
+                ),
+                ExpressionAttributeNames={
+                    "#uuid": "uuid",
+                    "#estado": "estado",
+                    "#expires_at": "expires_at",
+                    "#lease_expires_at": "lease_expires_at",
+                },
+                ExpressionAttributeValues={":now": now, ":in_progress": IN_PROGRESS},
+            )
+            return Lease(uuid, token, fence)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            return None
+
+    def get(self, uuid):
+        response = self.table.get_item(Key={"uuid": uuid}, ConsistentRead=True)
+        return response.get("Item")
+
+    def complete(self, lease, result):
+        """Guarda el resultado; falla silenciosamente si el lease fue tomado por otra invocacion."""
+        now = int(self.clock())
+        try:
+            self.table.update_item(
+                Key={"uuid": lease.uuid},
+                UpdateExpression="SET #estado = :completed, #resultado = :resultado, #expires_at = :expires_at",
+                ConditionExpression="#token = :token",
+                ExpressionAttributeNames={
+                    "#estado": "estado",
+                    "#resultado": "resultado",
+                    "#expires_at": "expires_at",
+                    "#token": "token",
+                },
+                ExpressionAttributeValues={
+                    ":completed": COMPLETED,
+                    ":resultado": json.dumps(result, default=str),
+                    ":expires_at": now + self.result_ttl,
+                    ":token": lease.token,
+                },
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            logger.warning(f"Lease de {lease.uuid} tomado por otra invocacion; no se guarda el resultado")
+            return False
+
+    def release(self, lease):
+        """Libera el lease tras un error para que un reintento pueda procesar el documento."""
+        try:
+            self.table.delete_item(
+                Key={"uuid": lease.uuid},
+                ConditionExpression="#token = :token",
+                ExpressionAttributeNames={"#token": "token"},
+                ExpressionAttributeValues={":token": lease.token},
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+    def wait(self, uuid, timeout, interval=POLL_INTERVAL_SECONDS):
+        """Consulta el registro hasta que este completo o pase `timeout` segundos."""
+        deadline = time.monotonic() + timeout
+        record = self.get(uuid)
+        while record is not None and record["estado"] != COMPLETED and time.monotonic() < deadline:
+            time.sleep(interval)
+            record = self.get(uuid)
+        return record
+
+
+def event_object(event):
+    try:
+        return event["s3"]
+    except KeyError:
+        return json.loads(event["body"])["s3"]
+
+
+def document_uuid(event):
+    """Mismo uuid que usan los handlers: sha256 de bucket/key."""
+    s3 = event_object(event)
+    return hashlib.sha256(f"{s3['bucket']}/{s3['key']}".encode()).hexdigest()
+
+
+def object_version(s3):
+    """VersionId (bucket versionado) o ETag del objeto; None si no se puede leer."""
+    version = s3.get("versionId") or s3.get("eTag")
+    if version:
+        return version
+    try:
+        response = s3_client.head_object(Bucket=s3["bucket"], Key=s3["key"])
+    except ClientError as e:
+        logger.warning(f"No se pudo leer la version de s3://{s3['bucket']}/{s3['key']}: {str(e)}")
+        return None
+    return response.get("VersionId") or response.get("ETag", "").strip('"') or None
+
+
+def lease_key(event):
+    """Clave del lease: el uuid del documento mas la version del objeto."""
+    uuid = document_uuid(event)
+    version = object_version(event_object(event))
+    return f"{uuid}#{version}" if version else uuid
+
+
+def current_lease():
+    """Lease de la invocacion en curso (dentro de single_flight), o None."""
+    return getattr(_local, "lease", None)
+
+
+def fenced(item):
+    """Agrega al item el fence del lease en curso, si lo hay (ver FENCE_ATTRIBUTE)."""
+    lease = current_lease()
+    return dict(item, **{FENCE_ATTRIBUTE: lease.fence}) if lease is not None else item
+
+
+def is_error_response(result):
+    return isinstance(result, dict) and isinstance(result.get("statusCode"), int) and result["statusCode"] >= 400
+
+
+def pending_response(uuid):
+    """Respuesta 202 en el formato de proxy de API Gateway / Function URL."""
+    return {
+        "statusCode": 202,
+        "headers": {
+            "Content-Type": "application/json",
+            "Retry-After": str(max(1, int(POLL_INTERVAL_SECONDS * 5))),
+        },
+        "body": json.dumps({"uuid": uuid, "estado": IN_PROGRESS}),
+    }
+
+
+_store = None
+
+
+def release(lease):
+    """Libera el lease sin ocultar el error del handler si la liberacion falla."""
+    try:
+        _store.release(lease)
+    except Exception as e:
+        # El lease vence solo luego de IDEMPOTENCY_LEASE_SECONDS
+        logger.error(f"Error al liberar el lease de {lease.uuid}: {str(e)}")
+
+
+def single_flight(handler):
+    """
+    Decorador para handlers de Lambda: solo una invocacion concurrente procesa
+    cada documento; las demas devuelven el resultado guardado, lo esperan hasta
+    IDEMPOTENCY_WAIT_SECONDS o responden 202. Sin IDEMPOTENCY_TABLE_NAME no hace nada.
+
+    Debe ser el decorador externo: los controles que rechazan la solicitud
+    (admission_control) solo se aplican a la invocacion que tomo el lease, y
+    sus respuestas de error no se guardan como resultado.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _store
+        if not IDEMPOTENCY_TABLE_NAME or event.get("warmup"):
+            return handler(event, context)
+        if _store is None:
+            _store = IdempotencyStore.from_env()
+
+        try:
+            uuid = lease_key(event)
+        except (KeyError, TypeError, ValueError):
+            # Evento invalido: el handler informa el error como siempre
+            return handler(event, context)
+
+        lease, record = _store.acquire(uuid)
+        if lease is None:
+            if record["estado"] != COMPLETED and WAIT_SECONDS > 0:
+                record = _store.wait(uuid, WAIT_SECONDS) or record
+            if record["estado"] == COMPLETED:
+                logger.info(f"Documento {uuid} ya procesado: se devuelve el resultado guardado")
+                return json.loads(record["resultado"])
+            logger.info(f"Documento {uuid} en proceso por otra invocacion")
+            return pending_response(uuid)
+
+        _local.lease = lease
+        try:
+            result = handler(event, context)
+        except Exception:
+            release(lease)
+            raise
+        finally:
+            _local.lease = None
+
+        if is_error_response(result):
+            # Un 429 o 4xx/5xx no es el resultado del documento: que reintenten
+            release(lease)
+            return result
+        try:
+            _store.complete(lease, result)
+        except Exception as e:
+            # La fila ya esta guardada; los duplicados reprocesaran al vencer el lease
+            logger.error(f"Error al completar el lease de {uuid}: {str(e)}")
+        return result
+
+    return wrapper
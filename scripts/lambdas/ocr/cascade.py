@@ -0,0 +1,158 @@
+import json
+import os
+import logging
+import hashlib
+from datetime import datetime
+
+from utils import send_sns_message, decimal_to_number
+from dynamo_writer import get_writer
+from prompting import load_prompt
+from validators import validate_field
+from tracing import sanitize_event, start_trace, stage, annotate, record_error, finish_trace
+from admission import admission_control
+from idempotency import single_flight
+from claude import build_prompt_text, extract_fields
+from artifacts import get_store, document_hash
+import rasterization
+from ocr import generator, generator_textract
+
+# Cascada de modelos: primero Textract + Titan (barato y rapido), y solo si
+# algun campo queda por debajo del umbral de confianza se llama a Claude con
+# las imagenes del documento. El resultado final combina ambos, tomando de
+# Claude unicamente los campos debiles.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+FILE_KEY = os.environ.get("FILE_KEY")
+DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME")
+FAIL_TOPIC_ARN = os.environ.get("FAIL_TOPIC_ARN")
+# Confianza minima (0-1) para aceptar un campo del camino barato
+CASCADE_THRESHOLD = float(os.environ.get("CASCADE_THRESHOLD", "0.7"))
+# Si esta fraccion de campos o mas es debil, se toma el documento completo de Claude
+CASCADE_DOCUMENT_RATIO = float(os.environ.get("CASCADE_DOCUMENT_RATIO", "0.5"))
+# Confianza asumida cuando el modelo no informa una para el campo
+DEFAULT_CONFIDENCE = 0.8
+
+
+@single_flight
+@admission_control
+def lambda_handler(event, context):
+    if event.get("warmup"):
+        generator_textract.warm_up()
+        return generator.warm_up()
+
+    logger.info(f"Received event: {json.dumps(sanitize_event(event))}")
+    start_trace("cascade", event)
+
+    try:
+        try:
+            bucket = event["s3"]["bucket"]
+            key = event["s3"]["key"]
+            id_usuario = event.get("id_usuario", "anonimo")
+        except:
+            body = json.loads(event["body"])
+            bucket = body["s3"]["bucket"]
+            key = body["s3"]["key"]
+            id_usuario = body.get("id_usuario", "anonimo")
+
+        uuid = hashlib.sha256(f"{bucket}/{key}".encode()).hexdigest()
+
+        with stage("download"):
+            file_content = rasterization.download_file_from_s3(bucket, key)
+        _, file_extension = os.path.splitext(key)
+        file_extension = file_extension.lower()
+        annotate(extension=file_extension, size_bytes=len(file_content))
+
+        store = get_store()
+        doc_hash = document_hash(file_content) if store else None
+        result = extract_with_cascade(file_content, file_extension, store, doc_hash)
+        if store:
+            store.record(doc_hash, uuid, f"s3://{bucket}/{key}", id_usuario, "cascade")
+
+        dynamo_item = {
+            "uuid": uuid,
+            "s3_uri": f"s3://{bucket}/{key}",
+            "timestamp": datetime.now().isoformat(),
+            "id_usuario": id_usuario,
+        }
+        dynamo_item.update(result)
+
+        with stage("dynamodb"):
+            saved = generator.save_to_dynamodb(DYNAMODB_TABLE_NAME, dynamo_item)
+        if not saved:
+            # Otra invocacion ya guardo una version mas nueva: se devuelve esa fila
+            logger.warning(f"Resultado de {uuid} descartado, se devuelve la fila guardada")
+            return decimal_to_number(get_writer(DYNAMODB_TABLE_NAME).get({"uuid": uuid}))
+
+        return result
+
+    except Exception as e:
+        record_error(e)
+        logger.error(f"Error in lambda_handler: {str(e)}")
+        send_sns_message(
+            f"Error in lambda_handler: {str(e)}",
+            FAIL_TOPIC_ARN,
+            f"Error: lambda cascade",
+        )
+        raise e
+    finally:
+        finish_trace()
+
+
+def extract_with_cascade(file_content, file_extension, store=None, doc_hash=None):
+    fields = list(json.loads(load_prompt(BUCKET_NAME, FILE_KEY.replace(".txt", ".json"))))
+
+    cheap_result = generator_textract.extract_with_textract(
+        file_content, with_confidence=True, store=store, doc_hash=doc_hash
+    )
+    scores = score_fields(cheap_result, fields)
+    weak_fields = [name for name in fields if scores[name] < CASCADE_THRESHOLD]
+    logger.info(f"Confianza por campo: {scores}, campos debiles: {weak_fields}")
+    annotate(weak_fields=len(weak_fields))
+
+    if not weak_fields:
+        return dict(cheap_result, campos_escalados=[])
+
+    content = rasterization.get_image_blocks(file_content, file_extension, store, doc_hash)
+    content.append({"type": "text", "text": build_prompt_text()})
+    with stage("vision_model"):
+        vision_result = extract_fields(content)
+
+    if len(weak_fields) >= CASCADE_DOCUMENT_RATIO * len(fields):
+        escalated = vision_result
+    else:
+        escalated = {name: vision_result[name] for name in weak_fields if name in vision_result}
+
+    return dict(cheap_result, **escalated, campos_escalados=weak_fields)
+
+
+def field_confidence(result, name):
+    """Confianza informada por el modelo para el campo, normalizada a 0-1."""
+    confidences = result.get("confianza")
+    value = confidences.get(name) if isinstance(confidences, dict) else None
+    if value is None:
+        value = result.get(f"{name}_confianza", result.get(f"confianza_{name}"))
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value / 100.0 if value > 1 else value
+
+
+def score_fields(result, fields):
+    """
+    Puntaje de 0 a 1 por campo: 0 si esta vacio o falla su validador
+    (CUIT, fecha, importe, etc.), y si no la confianza informada por el
+    modelo (o DEFAULT_CONFIDENCE si no la informa).
+    """
+    scores = {}
+    for name in fields:
+        valid = validate_field(name, result.get(name))
+        if valid is False:
+            scores[name] = 0.0
+            continue
+        confidence = field_confidence(result, name)
+        scores[name] = DEFAULT_CONFIDENCE if confidence is None else confidence
+    return scores
@@ -12,7 +12,15 @@ from botocore.exceptions import ClientError
 # import fitz  # PyMuPDF
 # from PIL import Image
 
-from utils import send_sns_message, read_prompt_from_s3, extract_json
+from utils import send_sns_message, extract_json, decimal_to_number
+from dynamo_writer import get_writer
+from prompting import load_prompt, load_template
+from hedging import HedgedCaller
+from textract_serializer import serialize_textract, budget_chars
+from tracing import sanitize_event, start_trace, stage, annotate, record_error, finish_trace
+from admission import admission_control
+from idempotency import single_flight, fenced, FENCE_ATTRIBUTE
+from artifacts import get_store, document_hash
 
 # Configurar logging
 logger = logging.getLogger()
@@ -20,21 +28,42 @@ logger.setLevel(logging.INFO)
 
 # Variables de entorno
 TITAN_MODEL = os.environ.get("TITAN_MODEL", "amazon.titan-text-premier-v1:0")
+# "compact": serializador deduplicado/filtrado por confianza, "legacy": todos los pares y tablas
+TEXTRACT_SERIALIZER = os.environ.get("TEXTRACT_SERIALIZER", "compact")
+TEXTRACT_MIN_CONFIDENCE = float(os.environ.get("TEXTRACT_MIN_CONFIDENCE", "50"))
+# Presupuesto del prompt completo; se usa el mas estricto de los dos (0 = sin limite)
+PROMPT_MAX_CHARS = int(os.environ.get("PROMPT_MAX_CHARS", "0"))
+PROMPT_MAX_TOKENS = int(os.environ.get("PROMPT_MAX_TOKENS", "24000"))
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 FILE_KEY = os.environ.get("FILE_KEY")
 DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME")
 FAIL_TOPIC_ARN = os.environ.get("FAIL_TOPIC_ARN")
+# Hedging opcional: si la primera llamada tarda, se lanza una segunda
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "false").lower() == "true"
+# Distinta de CLAUDE_HEDGE_MODEL: la cascada carga ambos modulos
+HEDGE_MODEL = os.environ.get("TITAN_HEDGE_MODEL", TITAN_MODEL)
+HEDGE_REGION = os.environ.get("HEDGE_REGION")
 
 # Inicializar clientes de AWS
 s3_client = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
 sns_client = boto3.client("sns")
 bedrock_client = boto3.client("bedrock-runtime")
+textract_client = boto3.client("textract")
+hedge_bedrock_client = (
+    boto3.client("bedrock-runtime", region_name=HEDGE_REGION) if HEDGE_REGION else None
+)
+titan_hedger = HedgedCaller.from_env("titan") if HEDGE_ENABLED else None
 
 
 # Handler de Lambda
+@single_flight
+@admission_control
 def lambda_handler(event, context):
-    logger.info(f"Received event: {json.dumps(event)}")
+    if event.get("warmup"):
+        return warm_up()
+
+    logger.info(f"Received event: {json.dumps(sanitize_event(event))}")
+    start_trace("generator_textract", event)
 
     try:
         try:
@@ -56,12 +85,15 @@ def lambda_handler(event, context):
         file_name = f"{bucket}/{key}"
         uuid = hashlib.sha256(file_name.encode()).hexdigest()
 
-        # Cliente de Textract
-        textract_client = boto3.client("textract")
-
         try:
-            response = s3_client.get_object(Bucket=bucket, Key=key)
-            stream = io.BytesIO(response["Body"].read())
+            with stage("download"):
+                response = s3_client.get_object(Bucket=bucket, Key=key)
+                stream = io.BytesIO(response["Body"].read())
+            _, file_extension = os.path.splitext(key)
+            annotate(
+                extension=file_extension.lower(),
+                size_bytes=stream.getbuffer().nbytes,
+            )
         except ClientError as e:
             logger.error(f"Error al obtener el documento de S3: {e}")
             raise e
@@ -69,55 +101,13 @@ def lambda_handler(event, context):
             logger.error(f"Error inesperado: {e}")
             raise e
 
-        # Llamar a Amazon Textract para analizar el documento
-        try:
-            textract_response = textract_client.analyze_document(
-                Document={"Bytes": stream.read()}, FeatureTypes=["FORMS", "TABLES"]
-            )
-        except ClientError as e:
-            logger.error(f"Error al analizar el documento con Textract: {e}")
-            raise e
-
-        # Mapear los IDs de los bloques
-        blocks = textract_response["Blocks"]
-        block_map = {}
-        for block in blocks:
-            block_map[block["Id"]] = block
-
-        # Extraer los pares clave-valor
-        kvs = get_kv_relationships(blocks, block_map)
-
-        # Convertir los pares clave-valor a texto
-        kv_text = ""
-        for key_text, value_text in kvs.items():
-            kv_text += f"{key_text}: {value_text}\n"
-
-        # Extraer el texto de las tablas (opcional)
-        table_text = extract_tables(blocks, block_map)
-
-        # Preparar el texto extraído
-        extracted_text = kv_text + "\n" + table_text
-
-        # Leer el prompt y los datos de ejemplo desde S3
-        prompt_json_data = read_prompt_from_s3(
-            BUCKET_NAME, FILE_KEY.replace(".txt", ".json")
-        )
-        prompt = read_prompt_from_s3(
-            BUCKET_NAME, FILE_KEY.replace(".txt", "_textract.txt")
-        )
-
-        print(f"##### Textract result: {extracted_text}")
-
-        # Preparar el texto de entrada para el modelo Titan
-        input_text = f"{prompt.replace('<textract_example>', extracted_text).replace('<example>', prompt_json_data)}\nAssistant: {{"
-
-        # Llamar al modelo Titan
-        logger.info("Llamando al modelo Titan")
-        titan_response = extract_json(call_titan(input_text))
-        # print(f"######## Respuesta text: {titan_response}")
-
-        json_titan_response = json.loads(titan_response)
-        print(f"######## Respuesta JSON: {json_titan_response}")
+        document_bytes = stream.read()
+        # Con el almacen de artefactos se reutilizan los bloques de Textract guardados
+        store = get_store()
+        doc_hash = document_hash(document_bytes) if store else None
+        json_titan_response = extract_with_textract(document_bytes, store=store, doc_hash=doc_hash)
+        if store:
+            store.record(doc_hash, uuid, f"s3://{bucket}/{key}", id_usuario, "textract")
 
         # Preparar el elemento para guardar en DynamoDB
         dynamo_item = {
@@ -129,11 +119,17 @@ def lambda_handler(event, context):
         dynamo_item.update(json_titan_response)
 
         # Guardar el resultado en DynamoDB
-        save_to_dynamodb(DYNAMODB_TABLE_NAME, dynamo_item)
+        with stage("dynamodb"):
+            saved = save_to_dynamodb(DYNAMODB_TABLE_NAME, dynamo_item)
+        if not saved:
+            # Otra invocacion ya guardo una version mas nueva: se devuelve esa fila
+            logger.warning(f"Resultado de {uuid} descartado, se devuelve la fila guardada")
+            return decimal_to_number(get_writer(DYNAMODB_TABLE_NAME).get({"uuid": uuid}))
 
         return json_titan_response
 
     except Exception as e:
+        record_error(e)
         logger.error(f"Error in lambda_handler: {str(e)}")
         send_sns_message(
             f"Error in lambda_handler: {str(e)}",
@@ -141,14 +137,113 @@ def lambda_handler(event, context):
             f"Error: lambda generator",
         )
         raise e
+    finally:
+        finish_trace()
+
+
+# Textract + Titan sobre el documento; devuelve los campos extraidos (dict)
+def extract_with_textract(document_bytes, with_confidence=False, store=None, doc_hash=None):
+    blocks = analyze_document(document_bytes, store, doc_hash)
+    return extract_from_blocks(blocks, with_confidence)
+
+
+# Bloques de Textract del documento, leidos del almacen de artefactos si ya estan
+def analyze_document(document_bytes, store=None, doc_hash=None):
+    if store is not None:
+        with stage("artifacts"):
+            blocks = store.get(doc_hash, "textract")
+        if blocks is not None:
+            annotate(artifact_hit=True)
+            return blocks
+
+    # Llamar a Amazon Textract para analizar el documento
+    try:
+        with stage("textract"):
+            textract_response = textract_client.analyze_document(
+                Document={"Bytes": document_bytes}, FeatureTypes=["FORMS", "TABLES"]
+            )
+    except ClientError as e:
+        logger.error(f"Error al analizar el documento con Textract: {e}")
+        raise e
+    blocks = textract_response["Blocks"]
+
+    if store is not None:
+        with stage("artifacts"):
+            store.put(doc_hash, "textract", blocks)
+    return blocks
+
+
+# Titan sobre los bloques de Textract (tambien usado por el backfill)
+def extract_from_blocks(blocks, with_confidence=False):
+    # Mapear los IDs de los bloques
+    block_map = {}
+    for block in blocks:
+        block_map[block["Id"]] = block
+    annotate(
+        pages=sum(1 for block in blocks if block["BlockType"] == "PAGE"),
+        blocks=len(blocks),
+    )
+
+    # Leer el prompt y los datos de ejemplo (cacheados por contenedor)
+    prompt_json_data = load_prompt(BUCKET_NAME, FILE_KEY.replace(".txt", ".json"))
+    prompt = load_template(BUCKET_NAME, FILE_KEY.replace(".txt", "_textract.txt"))
+    if with_confidence:
+        prompt_json_data = example_with_confidence(prompt_json_data)
+
+    # Preparar el texto extraído
+    with stage("serialize"):
+        extracted_text = serialize_blocks(blocks, block_map, prompt, prompt_json_data)
+
+    print(f"##### Textract result: {extracted_text}")
+
+    # Preparar el texto de entrada para el modelo Titan
+    input_text = f"{prompt.render(textract_example=extracted_text, example=prompt_json_data)}\nAssistant: {{"
+
+    annotate(prompt_chars=len(input_text))
+
+    # Llamar al modelo Titan
+    logger.info("Llamando al modelo Titan")
+    with stage("model"):
+        titan_response = extract_json(call_titan(input_text))
+    # print(f"######## Respuesta text: {titan_response}")
+
+    json_titan_response = json.loads(titan_response)
+    print(f"######## Respuesta JSON: {json_titan_response}")
+    return json_titan_response
+
+
+_confidence_examples = {}
+
+
+def example_with_confidence(prompt_json_data):
+    """Agrega al ejemplo un objeto "confianza" con un valor por campo."""
+    if prompt_json_data not in _confidence_examples:
+        fields = json.loads(prompt_json_data)
+        fields["confianza"] = {
+            name: "Confianza de la extraccion de este campo, numero entre 0 y 1"
+            for name in fields
+        }
+        _confidence_examples[prompt_json_data] = json.dumps(
+            fields, ensure_ascii=False, indent=4
+        )
+    return _confidence_examples[prompt_json_data]
+
+
+# Evento de warm-up: carga los prompts en cache sin hacer OCR
+def warm_up():
+    load_prompt(BUCKET_NAME, FILE_KEY.replace(".txt", ".json"))
+    load_template(BUCKET_NAME, FILE_KEY.replace(".txt", "_textract.txt"))
+    logger.info("Warm-up completado")
+    return {"warmup": True}
 
 
 # Función para guardar en DynamoDB
 def save_to_dynamodb(table_name, item_content):
     try:
-        table = dynamodb.Table(table_name)
-        response = table.put_item(Item=item_content)
-        logger.info(f"Guardado en DynamoDB: {response}")
+        # No pisa una fila mas nueva del mismo uuid ni una escrita con un lease mas nuevo
+        return get_writer(table_name).put(
+            fenced(item_content), newer_than="timestamp", fence=FENCE_ATTRIBUTE
+        )
     except Exception as e:
         logger.error(f"Error al guardar en DynamoDB: {str(e)}")
         raise e
@@ -170,15 +265,17 @@ def call_titan(input_text):
             },
         }
 
-        response = bedrock_client.invoke_model(
-            modelId=TITAN_MODEL,
-            accept="application/json",
-            contentType="application/json",
-            body=json.dumps(request_body).encode("utf-8"),
-        )
+        body = json.dumps(request_body).encode("utf-8")
 
-        response_body = response["body"].read()
-        response_json = json.loads(response_body)
+        if titan_hedger is None:
+            response_json = invoke_titan(bedrock_client, TITAN_MODEL, body)
+        else:
+            response_json = titan_hedger.call(
+                lambda: invoke_titan(bedrock_client, TITAN_MODEL, body),
+                lambda: invoke_titan(
+                    hedge_bedrock_client or bedrock_client, HEDGE_MODEL, body
+                ),
+            )
 
         generated_text = response_json.get("results", [{}])[0].get("outputText", "")
         # print(f"####### raw_result: {generated_text}")
@@ -189,9 +286,45 @@ def call_titan(input_text):
         raise e
 
 
+def invoke_titan(client, model_id, body):
+    response = client.invoke_model(
+        modelId=model_id,
+        accept="application/json",
+        contentType="application/json",
+        body=body,
+    )
+    return json.loads(response["body"].read())
+
+
 # ------------------------ TEXTRACT -------------------------------
 
 
+def serialize_blocks(blocks, block_map, prompt, prompt_json_data):
+    """Convierte los bloques de Textract en el texto que se inserta en el prompt."""
+    if TEXTRACT_SERIALIZER == "legacy":
+        kv_text = ""
+        for key_text, value_text in get_kv_relationships(blocks, block_map).items():
+            kv_text += f"{key_text}: {value_text}\n"
+        return kv_text + "\n" + extract_tables(blocks, block_map)
+
+    # El presupuesto aplica al prompt completo: se descuenta el texto fijo
+    max_chars = budget_chars(PROMPT_MAX_CHARS, PROMPT_MAX_TOKENS)
+    if max_chars is not None:
+        overhead = len(prompt.render(textract_example="", example=prompt_json_data))
+        max_chars = max(0, max_chars - overhead)
+
+    extracted_text, stats = serialize_textract(
+        blocks, min_confidence=TEXTRACT_MIN_CONFIDENCE, max_chars=max_chars
+    )
+    logger.info(f"Serializacion de Textract: {stats}")
+    annotate(
+        textract_raw_chars=stats["raw_chars"],
+        textract_chars=stats["compact_chars"],
+        textract_reduction_pct=stats["reduction_pct"],
+    )
+    return extracted_text
+
+
 def get_kv_relationships(blocks, block_map):
     kvs = {}
     for block in blocks:
@@ -0,0 +1,92 @@
+import json
+import os
+import logging
+import boto3
+from datetime import datetime
+
+from utils import send_sns_message, decimal_to_number
+from admission import release_admission
+from dynamo_writer import get_writer
+from tracing import sanitize_event, start_trace, stage, record_error, finish_trace
+from claude import OUTPUT_MODE, append_text_block, build_prompt_text, get_output_tool, extract_fields
+
+# Etapa 2 del pipeline: llamada al modelo y escritura en DynamoDB (I/O, baja memoria).
+# No importa PyMuPDF ni PIL: solo lee el artefacto generado por rasterize.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME")
+FAIL_TOPIC_ARN = os.environ.get("FAIL_TOPIC_ARN")
+
+# Errores que la state machine reintenta (add_retry de ExtractTask): el
+# reintento conserva el lugar de admision
+RETRIED_ERRORS = ("ThrottlingException", "ModelTimeoutException")
+
+s3_client = boto3.client("s3")
+
+
+def lambda_handler(event, context):
+    if event.get("warmup"):
+        build_prompt_text()
+        if OUTPUT_MODE == "tool":
+            get_output_tool()
+        return {"warmup": True}
+
+    logger.info(f"Received event: {json.dumps(sanitize_event(event))}")
+    start_trace("pipeline_extract", event)
+    retried = False
+
+    try:
+        artifact = event["artifact"]
+        with stage("download"):
+            response = s3_client.get_object(Bucket=artifact["bucket"], Key=artifact["key"])
+            # El prompt se agrega a los bytes del artefacto: las imagenes en
+            # base64 no se parsean ni se vuelven a serializar
+            content = append_text_block(response["Body"].read(), build_prompt_text())
+
+        logger.info("Llamando a Claude")
+        with stage("model"):
+            json_claude_response = extract_fields(content)
+
+        dynamo_item = {
+            "uuid": event["uuid"],
+            "s3_uri": f"s3://{event['s3']['bucket']}/{event['s3']['key']}",
+            "timestamp": datetime.now().isoformat(),
+            "id_usuario": event.get("id_usuario", "anonimo"),
+        }
+        dynamo_item.update(json_claude_response)
+
+        with stage("dynamodb"):
+            saved = save_to_dynamodb(DYNAMODB_TABLE_NAME, dynamo_item)
+        if not saved:
+            # Otra ejecucion ya guardo una version mas nueva: se devuelve esa fila
+            logger.warning(f"Resultado de {event['uuid']} descartado, se devuelve la fila guardada")
+            return decimal_to_number(get_writer(DYNAMODB_TABLE_NAME).get({"uuid": event["uuid"]}))
+
+        return json_claude_response
+
+    except Exception as e:
+        retried = type(e).__name__ in RETRIED_ERRORS
+        record_error(e)
+        logger.error(f"Error in lambda_handler: {str(e)}")
+        send_sns_message(
+            f"Error in lambda_handler: {str(e)}",
+            FAIL_TOPIC_ARN,
+            f"Error: lambda pipeline extract",
+        )
+        raise e
+    finally:
+        if not retried:
+            # Si se agotan los reintentos el lugar vence por TTL
+            release_admission(event.get("admision"))
+        finish_trace()
+
+
+def save_to_dynamodb(table_name, item_content):
+    try:
+        # No pisa una fila mas nueva del mismo uuid
+        return get_writer(table_name).put(item_content, newer_than="timestamp")
+    except Exception as e:
+        logger.error(f"Error al guardar en DynamoDB: {str(e)}")
+        raise e
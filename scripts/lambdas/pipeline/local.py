@@ -0,0 +1,17 @@
+from pipeline import rasterize, extract
+
+# Ejecuta las etapas del pipeline en secuencia, igual que la state machine,
+# para pruebas locales:
+#
+#     import sys; sys.path.insert(0, "scripts/lambdas")
+#     from pipeline.local import run_pipeline
+#     run_pipeline({"s3": {"bucket": "...", "key": "factura.pdf"}, "id_usuario": 1})
+
+STAGES = (rasterize.lambda_handler, extract.lambda_handler)
+
+
+def run_pipeline(event, context=None, stages=STAGES):
+    payload = event
+    for handler in stages:
+        payload = handler(payload, context)
+    return payload
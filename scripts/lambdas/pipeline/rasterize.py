@@ -0,0 +1,101 @@
+import json
+import os
+import logging
+import hashlib
+import boto3
+
+from utils import send_sns_message
+from admission import admit, release_admission
+from tracing import sanitize_event, start_trace, stage, annotate, record_error, finish_trace
+from artifacts import get_store, document_hash
+from rasterization import download_file_from_s3, process_file, encode_images_for_claude, get_image_blocks
+
+# Etapa 1 del pipeline: descarga, rasterizacion y encoding (CPU, alta memoria).
+# Deja los bloques de imagen listos para Claude como artefacto en S3. Solo
+# importa rasterization: ni claude ni hedging ni los clientes de Bedrock.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+ARTIFACTS_BUCKET = os.environ.get("ARTIFACTS_BUCKET", os.environ.get("BUCKET_NAME"))
+ARTIFACTS_PREFIX = os.environ.get("ARTIFACTS_PREFIX", "pipeline/")
+FAIL_TOPIC_ARN = os.environ.get("FAIL_TOPIC_ARN")
+
+s3_client = boto3.client("s3")
+
+
+def lambda_handler(event, context):
+    logger.info(f"Received event: {json.dumps(sanitize_event(event))}")
+    # La ruta POST /pipeline no pasa por admission_control: la admision se
+    # toma aca y QuotaExceeded la reintenta la state machine. El ticket viaja
+    # en la salida y lo libera extract
+    ticket = admit(event)
+    start_trace("pipeline_rasterize", event)
+
+    try:
+        try:
+            bucket = event["s3"]["bucket"]
+            key = event["s3"]["key"]
+            id_usuario = event.get("id_usuario", "anonimo")
+        except:
+            body = json.loads(event["body"])
+            bucket = body["s3"]["bucket"]
+            key = body["s3"]["key"]
+            id_usuario = body.get("id_usuario", "anonimo")
+
+        uuid = hashlib.sha256(f"{bucket}/{key}".encode()).hexdigest()
+
+        with stage("download"):
+            file_content = download_file_from_s3(bucket, key)
+
+        _, file_extension = os.path.splitext(key)
+        file_extension = file_extension.lower()
+        annotate(extension=file_extension, size_bytes=len(file_content))
+
+        store = get_store()
+        if store:
+            # Los bloques quedan en el almacen de artefactos y extract los lee de ahi
+            doc_hash = document_hash(file_content)
+            get_image_blocks(file_content, file_extension, store, doc_hash)
+            store.record(doc_hash, uuid, f"s3://{bucket}/{key}", id_usuario, "claude")
+            artifact = {"bucket": store.bucket, "key": store.key(doc_hash, "images")}
+        else:
+            with stage("rasterize"):
+                images = process_file(file_content, file_extension)
+            annotate(images=len(images))
+
+            with stage("encode"):
+                images_content = encode_images_for_claude(images)
+
+            artifact_key = f"{ARTIFACTS_PREFIX}{uuid}/images.json"
+            with stage("upload"):
+                s3_client.put_object(
+                    Bucket=ARTIFACTS_BUCKET,
+                    Key=artifact_key,
+                    Body=json.dumps(images_content).encode("utf-8"),
+                    ContentType="application/json",
+                )
+            logger.info(f"Artefacto guardado en s3://{ARTIFACTS_BUCKET}/{artifact_key}")
+            artifact = {"bucket": ARTIFACTS_BUCKET, "key": artifact_key}
+
+        # Salida liviana: Step Functions limita el payload entre estados a 256 KB
+        return {
+            "uuid": uuid,
+            "s3": {"bucket": bucket, "key": key},
+            "id_usuario": id_usuario,
+            "artifact": artifact,
+            "admision": ticket,
+        }
+
+    except Exception as e:
+        release_admission(ticket)
+        record_error(e)
+        logger.error(f"Error in lambda_handler: {str(e)}")
+        send_sns_message(
+            f"Error in lambda_handler: {str(e)}",
+            FAIL_TOPIC_ARN,
+            f"Error: lambda pipeline rasterize",
+        )
+        raise e
+    finally:
+        finish_trace()
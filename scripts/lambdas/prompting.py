@@ -0,0 +1,103 @@
+import json
+import re
+
+from utils import read_prompt_from_s3
+
+# Nombre de la herramienta que el modelo debe invocar en el modo "tool"
+OUTPUT_TOOL_NAME = "registrar_comprobante"
+
+PLACEHOLDER_PATTERN = re.compile(r"<(example|textract_example)>")
+
+# Tipos de cada campo de prompt.json; los que no figuran se tratan como string
+FIELD_SCHEMAS = {
+    "fecha_impresion": {"type": "string"},
+    "monto_total": {"type": "number"},
+    "iva": {"type": "string", "enum": ["I", "N", "E", "M", "S"]},
+    "razon_social": {"type": "string"},
+    "punto_de_venta": {"type": "string"},
+    "numero_comprobante": {"type": "string"},
+    "tipo_factura": {"type": "string"},
+    "cuit": {"type": "string"},
+    "categoria": {"type": "string"},
+}
+
+# Cache por proceso: los contenedores de Lambda reutilizan estos valores entre invocaciones
+_templates = {}
+_tools = {}
+
+
+class PromptTemplate:
+    """
+    Plantilla de prompt compilada una unica vez.
+
+    El texto se divide en fragmentos literales y placeholders (<example>,
+    <textract_example>) al construirla, de modo que render() solo une strings
+    en lugar de recorrer el prompt completo con .replace en cada llamada.
+    """
+
+    def __init__(self, text):
+        self.parts = PLACEHOLDER_PATTERN.split(text)
+
+    def render(self, **values):
+        # Los indices impares de parts son los nombres de los placeholders
+        return "".join(
+            values.get(part, f"<{part}>") if i % 2 else part
+            for i, part in enumerate(self.parts)
+        )
+
+
+def load_prompt(bucket_name, file_key):
+    """Lee un archivo de prompt desde S3 una sola vez por proceso."""
+    cache_key = (bucket_name, file_key)
+    if cache_key not in _templates:
+        _templates[cache_key] = read_prompt_from_s3(bucket_name, file_key)
+    return _templates[cache_key]
+
+
+def load_template(bucket_name, file_key):
+    cache_key = (bucket_name, file_key, "template")
+    if cache_key not in _templates:
+        _templates[cache_key] = PromptTemplate(load_prompt(bucket_name, file_key))
+    return _templates[cache_key]
+
+
+def build_output_schema(prompt_json_data):
+    """
+    Convierte prompt.json (campo -> descripcion) en un JSON schema tipado.
+
+    Ademas de los campos, el schema incluye un objeto opcional "confianza" con
+    un valor entre 0 y 1 por campo.
+    """
+    fields = json.loads(prompt_json_data)
+
+    properties = {}
+    for name, description in fields.items():
+        schema = dict(FIELD_SCHEMAS.get(name, {"type": "string"}))
+        schema["description"] = description
+        properties[name] = schema
+
+    properties["confianza"] = {
+        "type": "object",
+        "description": "Confianza de la extraccion de cada campo, entre 0 y 1.",
+        "properties": {
+            name: {"type": "number", "minimum": 0, "maximum": 1} for name in fields
+        },
+    }
+
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(fields),
+    }
+
+
+def load_output_tool(bucket_name, file_key):
+    """Devuelve la definicion de la herramienta de salida para prompt.json."""
+    cache_key = (bucket_name, file_key)
+    if cache_key not in _tools:
+        _tools[cache_key] = {
+            "name": OUTPUT_TOOL_NAME,
+            "description": "Registra los campos extraidos de un comprobante.",
+            "input_schema": build_output_schema(load_prompt(bucket_name, file_key)),
+        }
+    return _tools[cache_key]
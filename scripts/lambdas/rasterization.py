@@ -0,0 +1,191 @@
+import logging
+import base64
+import boto3
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from tracing import stage, annotate
+
+# Download, rasterization and encoding of the documents for Claude. It does not
+# import the model, admission or idempotency modules, so the rasterize stage of
+# the pipeline loads only PyMuPDF/PIL and the S3 client.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Initialize AWS clients
+s3_client = boto3.client("s3")
+
+
+# Asynchronous function to download file from S3
+def download_file_from_s3(bucket, key):
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        file_content = response["Body"].read()
+        file_size = len(file_content)
+        logger.info(f"Downloaded file size: {file_size} bytes")
+        return file_content
+    except Exception as e:
+        logger.error(f"Error downloading file from S3: {str(e)}")
+        raise
+
+
+# Asynchronous function to process the file based on its extension
+def process_file(file_content, file_extension):
+    images = []
+
+    if file_extension == ".pdf":
+        logger.info("File is a PDF, converting pages to images")
+        images = convert_pdf_to_images(file_content)
+    elif file_extension in [".jpg", ".jpeg", ".png"]:
+        logger.info("File is an image")
+        annotate(pages=1)
+        images.append(file_content)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+    return images
+
+
+# Renders the PDF pages, stacking `pages_per_image` pages per image. The pages
+# are composed directly into a PyMuPDF pixmap and kept as raw pixels: they
+# are encoded only once, in encode_images_for_claude.
+def convert_pdf_to_images(pdf_content, max_images=20, pages_per_image=2):
+    try:
+        pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
+
+        total_pages = pdf_document.page_count
+        logger.info(f"Total pages in PDF: {total_pages}")
+        annotate(pages=total_pages)
+
+        pages_to_process = min(total_pages, max_images * pages_per_image)
+        logger.info(f"Processing {pages_to_process} pages")
+
+        images = []
+
+        for start_page in range(0, pages_to_process, pages_per_image):
+            end_page = min(start_page + pages_per_image, pages_to_process)
+            pixmaps = [pdf_document[page_num].get_pixmap() for page_num in range(start_page, end_page)]
+
+            total_height = sum(pix.height for pix in pixmaps)
+            max_width = max(pix.width for pix in pixmaps)
+            combined_image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, max_width, total_height), False)
+            combined_image.clear_with(0)
+
+            y_offset = 0
+            for pix in pixmaps:
+                pix.set_origin(0, y_offset)
+                combined_image.copy(pix, pix.irect)
+                y_offset += pix.height
+
+            images.append(combined_image)
+            logger.info(f"Created image of {max_width}x{total_height} pixels")
+
+        logger.info(f"Created {len(images)} combined images")
+        return images
+    except Exception as e:
+        logger.error(f"Error converting PDF to images: {str(e)}")
+        raise e
+
+
+# Image blocks for Claude; with the artifact store they are built only once per document
+def get_image_blocks(file_content, file_extension, store=None, doc_hash=None):
+    if store is not None:
+        with stage("artifacts"):
+            images_content = store.get(doc_hash, "images")
+        if images_content is not None:
+            annotate(artifact_hit=True)
+            return images_content
+
+    with stage("rasterize"):
+        images = process_file(file_content, file_extension)
+    annotate(images=len(images))
+    with stage("encode"):
+        images_content = encode_images_for_claude(images)
+
+    if store is not None:
+        with stage("artifacts"):
+            store.put(doc_hash, "images", images_content)
+            store.put(doc_hash, "text", extract_text_layer(file_content, file_extension))
+    return images_content
+
+
+# Text layer of each PDF page (empty for scanned pages and images)
+def extract_text_layer(file_content, file_extension):
+    if file_extension != ".pdf":
+        return []
+    with fitz.open(stream=file_content, filetype="pdf") as pdf_document:
+        return [page.get_text() for page in pdf_document]
+
+
+# Encodes the images as base64 content blocks under the Bedrock size limit.
+# Rendered pages (pixmaps) are encoded once as PNG; uploaded JPEG/PNG files are
+# sent as they are. Only images over the limit are decoded and resized.
+def encode_images_for_claude(images):
+    content = []
+
+    max_size_base64_bytes = 5 * 1024 * 1024  # 5 MB
+    max_original_size_bytes = int(max_size_base64_bytes / 1.33)
+
+    for i, image in enumerate(images):
+        if isinstance(image, fitz.Pixmap):
+            img_format = "PNG"
+            image_data = image.tobytes("png")
+        else:
+            # Image.open only reads the header here; the pixels are not decoded
+            img_format = Image.open(BytesIO(image)).format or "PNG"
+            image_data = image
+        quality = 100
+        optimization_attempts = 0
+
+        img_base64 = base64.b64encode(image_data).decode("utf-8")
+        img_base64_size = len(img_base64)
+        img = None
+
+        while img_base64_size > max_size_base64_bytes and optimization_attempts < 10:
+            if img is None:
+                img = to_pil_image(image)
+            scale_factor = ((max_size_base64_bytes / img_base64_size) ** 0.5) * (
+                max_size_base64_bytes / img_base64_size
+            )
+            new_width = int(img.width * scale_factor)
+            new_height = int(img.height * scale_factor)
+
+            img = img.resize((new_width, new_height), Image.LANCZOS)
+            img_byte_arr = BytesIO()
+            img.save(img_byte_arr, format=img_format, optimize=True, quality=quality)
+            img_base64 = base64.b64encode(img_byte_arr.getvalue()).decode("utf-8")
+            img_base64_size = len(img_base64)
+
+            optimization_attempts += 1
+            logger.info(
+                f"Optimized image {i + 1}: attempt {optimization_attempts}, size {img_base64_size} bytes"
+            )
+
+        if optimization_attempts >= 10:
+            logger.error(f"Failed to optimize image {i + 1} below size limit")
+            raise Exception(f"Image {i + 1} exceeds size limit after optimization")
+
+        logger.info(f"Appending image {i + 1} with size {img_base64_size} bytes")
+
+        content.append(
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": f"image/{img_format.lower()}",
+                    "data": img_base64,
+                },
+            }
+        )
+
+    return content
+
+
+# Decodes an image for resizing: a rendered pixmap or the bytes of an uploaded file
+def to_pil_image(image):
+    if isinstance(image, fitz.Pixmap):
+        return Image.frombytes("RGB", (image.width, image.height), image.samples)
+    return Image.open(BytesIO(image))
@@ -0,0 +1,297 @@
+import re
+
+# Aproximacion de caracteres por token para presupuestos expresados en tokens
+CHARS_PER_TOKEN = 4
+
+# Palabras que indican filas/campos relevantes para los datos del comprobante
+RELEVANT_KEYWORDS = (
+    "total",
+    "importe",
+    "iva",
+    "cuit",
+    "fecha",
+    "vencimiento",
+    "factura",
+    "comprobante",
+    "ticket",
+    "punto de venta",
+    "p.v",
+    "razon social",
+    "razón social",
+    "subtotal",
+    "neto",
+)
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize(text):
+    return _whitespace.sub(" ", text).strip().lower()
+
+
+def is_relevant(text):
+    text = normalize(text)
+    return any(keyword in text for keyword in RELEVANT_KEYWORDS)
+
+
+class CompactSerializer:
+    """
+    Serializa la respuesta de Textract en un texto compacto para el prompt.
+
+    - Descarta palabras con confianza menor a `min_confidence`.
+    - Omite pares clave-valor vacios o repetidos y celdas de tabla que
+      repiten un par clave-valor ya presente como campo de formulario.
+    - Elimina filas y columnas vacias y filas duplicadas.
+    - Renderiza las tablas como markdown sin relleno (a|b), que no ocupa
+      mas que las filas separadas por tabuladores del formato anterior.
+    - Si el texto supera `max_chars`, descarta primero el contenido menos
+      relevante (filas de tabla sin palabras clave, empezando por el final)
+      y rearma los separadores de las tablas que quedan.
+    """
+
+    def __init__(self, blocks, min_confidence=50.0):
+        self.blocks = blocks
+        self.block_map = {block["Id"]: block for block in blocks}
+        self.min_confidence = min_confidence
+        self.stats = {
+            "raw_chars": 0,
+            "compact_chars": 0,
+            "low_confidence_words": 0,
+            "deduplicated_cells": 0,
+            "dropped_rows": 0,
+            "truncated_items": 0,
+        }
+
+    # ------------------------ Lectura de bloques ------------------------
+
+    def get_text(self, block):
+        """Devuelve (texto filtrado por confianza, texto completo)."""
+        kept, raw = [], []
+        for rel in block.get("Relationships", []):
+            if rel["Type"] != "CHILD":
+                continue
+            for child_id in rel["Ids"]:
+                child = self.block_map[child_id]
+                if child["BlockType"] == "WORD":
+                    word = child["Text"]
+                elif child["BlockType"] == "SELECTION_ELEMENT":
+                    if child.get("SelectionStatus") != "SELECTED":
+                        continue
+                    word = "X"
+                else:
+                    continue
+                raw.append(word)
+                if child.get("Confidence", 100.0) >= self.min_confidence:
+                    kept.append(word)
+                else:
+                    self.stats["low_confidence_words"] += 1
+        return " ".join(kept), " ".join(raw)
+
+    def key_values(self):
+        pairs = []
+        for block in self.blocks:
+            if block["BlockType"] != "KEY_VALUE_SET" or "KEY" not in block.get(
+                "EntityTypes", []
+            ):
+                continue
+            value_block = None
+            for rel in block.get("Relationships", []):
+                if rel["Type"] == "VALUE" and rel["Ids"]:
+                    value_block = self.block_map[rel["Ids"][0]]
+                    break
+            if value_block is None:
+                continue
+            key, raw_key = self.get_text(block)
+            value, raw_value = self.get_text(value_block)
+            self.stats["raw_chars"] += len(raw_key) + len(raw_value) + 3
+            if key and value:
+                pairs.append((key, value))
+        return pairs
+
+    def tables(self):
+        tables = []
+        for block in self.blocks:
+            if block["BlockType"] != "TABLE":
+                continue
+            cells = {}
+            for rel in block.get("Relationships", []):
+                if rel["Type"] != "CHILD":
+                    continue
+                for child_id in rel["Ids"]:
+                    cell = self.block_map[child_id]
+                    if cell["BlockType"] == "CELL":
+                        text, raw = self.get_text(cell)
+                        self.stats["raw_chars"] += len(raw) + 1
+                        cells[(cell["RowIndex"], cell["ColumnIndex"])] = text
+            if not cells:
+                continue
+            n_rows = max(row for row, _ in cells)
+            n_cols = max(col for _, col in cells)
+            self.stats["raw_chars"] += len("Tabla:\n") + n_rows + 1
+            tables.append(
+                [
+                    [cells.get((row, col), "") for col in range(1, n_cols + 1)]
+                    for row in range(1, n_rows + 1)
+                ]
+            )
+        return tables
+
+    # ------------------------ Compactacion ------------------------
+
+    def compact_table(self, rows, pairs):
+        """
+        Vacia las celdas que repiten un par clave-valor completo del formulario:
+        dos celdas contiguas (clave, valor) o una celda "clave valor" /
+        "clave: valor". Un valor suelto igual a algun valor del formulario
+        (por ejemplo "1" o "21%") se conserva.
+        """
+        seen_keys = {key for key, _ in pairs}
+        joined = {f"{key} {value}" for key, value in pairs} | {f"{key}: {value}" for key, value in pairs}
+        for row in rows:
+            for i, cell in enumerate(row):
+                if not cell:
+                    continue
+                if i + 1 < len(row) and (normalize(cell), normalize(row[i + 1])) in pairs:
+                    row[i] = row[i + 1] = ""
+                    self.stats["deduplicated_cells"] += 2
+                elif normalize(cell) in joined:
+                    row[i] = ""
+                    self.stats["deduplicated_cells"] += 1
+            # Filas que solo conservan etiquetas ya presentes como campos
+            if all(not cell or normalize(cell) in seen_keys for cell in row):
+                row[:] = [""] * len(row)
+
+        non_empty_cols = [
+            i for i in range(len(rows[0])) if any(row[i] for row in rows)
+        ]
+        compacted, seen_rows = [], set()
+        for row in rows:
+            row = [row[i] for i in non_empty_cols]
+            signature = tuple(normalize(cell) for cell in row)
+            if not any(row) or signature in seen_rows:
+                self.stats["dropped_rows"] += 1
+                continue
+            seen_rows.add(signature)
+            compacted.append(row)
+        return compacted
+
+    def items(self):
+        """
+        Devuelve la lista ordenada de (relevancia, texto, tabla) a renderizar.
+        Relevancia: 3 campos de formulario, 2 encabezados y filas con palabras
+        clave, 1 resto de las filas. `tabla` es None para los campos y
+        (indice de tabla, indice de fila, separador) para las tablas; la linea
+        en blanco previa a cada tabla tiene indice de fila -1 y el separador
+        del encabezado se agrega al renderizar (ver render).
+        """
+        items = []
+        pairs = set()
+        for key, value in self.key_values():
+            pair = (normalize(key), normalize(value))
+            if pair in pairs:
+                continue
+            pairs.add(pair)
+            items.append((3, f"{key}: {value}", None))
+
+        for table_index, rows in enumerate(self.tables()):
+            rows = self.compact_table(rows, pairs)
+            if not rows:
+                continue
+            separator = "|".join(["---"] * len(rows[0])) if len(rows) > 1 else ""
+            items.append((2, "", (table_index, -1, "")))
+            for index, row in enumerate(rows):
+                line = "|".join(row)
+                relevance = 2 if index == 0 or is_relevant(line) else 1
+                items.append((relevance, line, (table_index, index, separator if index == 0 else "")))
+        return items
+
+    @staticmethod
+    def lines(item, following):
+        """
+        Lineas que emite `item` cuando el siguiente item conservado es
+        `following` (None al final). La linea en blanco y el separador ---|---
+        de una tabla solo se emiten si le sigue una fila conservada de esa
+        tabla, asi el recorte no deja separadores huerfanos.
+        """
+        _, text, table = item
+        if table is None or table[1] > 0:
+            return [text]
+        next_table = following[2] if following is not None else None
+        continued = next_table is not None and next_table[0] == table[0] and next_table[1] > table[1]
+        if table[1] == -1:
+            return [text] if continued else []
+        return [text, table[2]] if table[2] and continued else [text]
+
+    @classmethod
+    def render(cls, items):
+        """Une las lineas de los items conservados."""
+        lines = []
+        for position, item in enumerate(items):
+            following = items[position + 1] if position + 1 < len(items) else None
+            lines.extend(cls.lines(item, following))
+        return "\n".join(lines)
+
+    def serialize(self, max_chars=None):
+        items = self.items()
+
+        text = self.render(items)
+        if max_chars is not None and len(text) > max_chars:
+            # Se descartan primero los items menos relevantes, desde el final.
+            # Los items conservados forman una lista enlazada y el largo se
+            # actualiza al descartar cada uno: solo cambian sus lineas y las
+            # del item anterior (la linea en blanco y el separador de una
+            # tabla dependen del item que les sigue).
+            count = len(items)
+            following = list(range(1, count + 1))
+            previous = list(range(-1, count - 1))
+
+            def emitted(i):
+                lines = self.lines(items[i], items[following[i]] if following[i] < count else None)
+                return sum(len(line) for line in lines), len(lines)
+
+            sizes = [emitted(i) for i in range(count)]
+            chars = sum(size[0] for size in sizes)
+            lines = sum(size[1] for size in sizes)
+            order = sorted(range(count), key=lambda i: (items[i][0], -i))
+            dropped = set()
+            for i in order:
+                if chars + max(lines - 1, 0) <= max_chars:
+                    break
+                dropped.add(i)
+                chars -= sizes[i][0]
+                lines -= sizes[i][1]
+                before, after = previous[i], following[i]
+                if after < count:
+                    previous[after] = before
+                if before >= 0:
+                    following[before] = after
+                    chars -= sizes[before][0]
+                    lines -= sizes[before][1]
+                    sizes[before] = emitted(before)
+                    chars += sizes[before][0]
+                    lines += sizes[before][1]
+            text = self.render([item for j, item in enumerate(items) if j not in dropped])
+            self.stats["truncated_items"] = len(dropped)
+
+        if max_chars is not None:
+            text = text[:max_chars]
+
+        self.stats["compact_chars"] = len(text)
+        raw = self.stats["raw_chars"]
+        self.stats["reduction_pct"] = (
+            round(100.0 * (raw - len(text)) / raw, 1) if raw else 0.0
+        )
+        return text
+
+
+def budget_chars(max_chars=None, max_tokens=None):
+    """Convierte un presupuesto en caracteres y/o tokens al limite mas estricto."""
+    limits = [limit for limit in (max_chars, max_tokens and max_tokens * CHARS_PER_TOKEN) if limit]
+    return min(limits) if limits else None
+
+
+def serialize_textract(blocks, min_confidence=50.0, max_chars=None):
+    """Devuelve (texto compacto, estadisticas) para la lista de bloques."""
+    serializer = CompactSerializer(blocks, min_confidence=min_confidence)
+    text = serializer.serialize(max_chars=max_chars)
+    return text, serializer.stats
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+# Las trazas se emiten como una linea "TRACE {...}" en CloudWatch Logs cuando
+# TRACE_ENABLED=true, o a los sinks registrados (por ejemplo el harness de replay)
+TRACE_ENABLED = os.environ.get("TRACE_ENABLED", "false").lower() == "true"
+TRACE_PREFIX = "TRACE "
+
+_local = threading.local()
+_sinks = []
+
+
+def sanitize_event(value):
+    """
+    Devuelve la forma de un evento sin sus valores.
+
+    Los diccionarios conservan sus claves, las listas su primer elemento y el
+    resto de los valores se reemplazan por el nombre de su tipo. Los "body" de
+    API Gateway (JSON serializado) se decodifican para conservar su forma.
+    """
+    if isinstance(value, dict):
+        shape = {}
+        for k, v in value.items():
+            if k == "body" and isinstance(v, str):
+                try:
+                    shape[k] = {"json": sanitize_event(json.loads(v))}
+                    continue
+                except ValueError:
+                    pass
+            shape[k] = sanitize_event(v)
+        return shape
+    if isinstance(value, list):
+        return [sanitize_event(value[0])] if value else []
+    return type(value).__name__
+
+
+class InvocationTrace:
+    def __init__(self, handler, event):
+        self.handler = handler
+        self.event_shape = sanitize_event(event)
+        self.document = {}
+        self.stages = {}
+        self.error = None
+        self._start = time.perf_counter()
+
+    def to_dict(self):
+        return {
+            "handler": self.handler,
+            "event_shape": self.event_shape,
+            "document": self.document,
+            "stages_ms": self.stages,
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 3),
+            "error": self.error,
+        }
+
+
+def add_sink(sink):
+    """Registra un callable que recibe cada traza finalizada (dict)."""
+    _sinks.append(sink)
+
+
+def start_trace(handler, event):
+    _local.trace = InvocationTrace(handler, event)
+    return _local.trace
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def stage(name):
+    """Mide la duracion de una etapa del handler en milisegundos."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace = current_trace()
+        if trace is not None:
+            elapsed = (time.perf_counter() - start) * 1000
+            trace.stages[name] = round(trace.stages.get(name, 0) + elapsed, 3)
+
+
+def annotate(**document):
+    """Agrega metadatos del documento (tamaño, paginas, etc.) a la traza actual."""
+    trace = current_trace()
+    if trace is not None:
+        trace.document.update(document)
+
+
+def record_error(error):
+    trace = current_trace()
+    if trace is not None:
+        trace.error = type(error).__name__
+
+
+def finish_trace():
+    trace = current_trace()
+    _local.trace = None
+    if trace is None or not (TRACE_ENABLED or _sinks):
+        return None
+
+    record = trace.to_dict()
+    if TRACE_ENABLED:
+        logger.info(TRACE_PREFIX + json.dumps(record))
+    for sink in _sinks:
+        sink(record)
+    return record
@@ -53,28 +53,12 @@ def update_to_dynamodb(id, table_name, update_dict):
     Returns:
         Imprime el resultado de la operación de actualización y cualquier error.
     """
-    dynamodb = boto3.resource("dynamodb")
-    table = dynamodb.Table(table_name)
-
-    update_dict = float_to_decimal(update_dict)
-
-    # Construir la expresión de actualización y los valores de atributos
-    update_expression = "SET " + ", ".join(f"#{k} = :{k}" for k in update_dict.keys())
-    expression_attribute_names = {f"#{k}": k for k in update_dict.keys()}
-    expression_attribute_values = {f":{k}": v for k, v in update_dict.items()}
+    # La expresión de actualización se cachea por conjunto de campos
+    from dynamo_writer import get_writer
 
     try:
-        response = table.update_item(
-            Key={"scanId": id},
-            UpdateExpression=update_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues="UPDATED_NEW",
-        )
+        get_writer(table_name, key_names=("scanId",)).update({"scanId": id}, update_dict)
         print(f"Actualización exitosa para el id {id}.")
-        print(
-            response
-        )  # Imprime la respuesta para ver el resultado de la actualización
 
     except Exception as e:
         print(f"Error al actualizar DynamoDB: {str(e)}")
@@ -196,3 +180,16 @@ def float_to_decimal(obj):
     elif isinstance(obj, list):
         return [float_to_decimal(v) for v in obj]
     return obj
+
+
+def decimal_to_number(obj):
+    """Inversa de float_to_decimal: Decimal -> int si es entero, si no float."""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    elif isinstance(obj, dict):
+        return {k: decimal_to_number(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [decimal_to_number(v) for v in obj]
+    elif isinstance(obj, (set, frozenset)):
+        return {decimal_to_number(v) for v in obj}
+    return obj
@@ -0,0 +1,127 @@
+import re
+import unicodedata
+from datetime import datetime
+
+# Validadores deterministas de los campos de prompt.json. Cada validador
+# devuelve True/False; los campos sin validador no se evaluan (None).
+
+CUIT_WEIGHTS = (5, 4, 3, 2, 7, 6, 5, 4, 3, 2)
+CUIT_PREFIXES = ("20", "23", "24", "25", "26", "27", "30", "33", "34")
+DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y", "%Y-%m-%d", "%d-%m-%y", "%d/%m/%y")
+IVA_VALUES = {"I", "N", "E", "M", "S"}
+TIPO_FACTURA_VALUES = {"A", "B", "C", "M", "E", "T"}
+# Nombres de comprobante que prompt.json admite ademas de la letra, solos o
+# seguidos de ella ("Tique Factura B"), sin acentos y en minusculas
+TIPO_FACTURA_NAMES = {
+    "factura",
+    "tique",
+    "ticket",
+    "tique factura",
+    "recibo",
+    "liquidacion de servicios",
+}
+# Importe con punto como separador de miles: "1.234", "12.345.678"
+THOUSANDS_PATTERN = re.compile(r"-?[1-9]\d{0,2}(\.\d{3})+")
+
+
+def digits(value):
+    return re.sub(r"\D", "", str(value))
+
+
+def is_valid_cuit(value):
+    """Verifica el digito verificador del CUIT (modulo 11)."""
+    number = digits(value)
+    if len(number) != 11 or number[:2] not in CUIT_PREFIXES:
+        return False
+    total = sum(int(d) * w for d, w in zip(number[:10], CUIT_WEIGHTS))
+    check = 11 - total % 11
+    if check == 11:
+        check = 0
+    elif check == 10:
+        return False
+    return check == int(number[10])
+
+
+def parse_date(value):
+    text = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def is_valid_date(value, today=None):
+    date = parse_date(value)
+    if date is None:
+        return False
+    today = today or datetime.now()
+    return 2000 <= date.year <= today.year + 1
+
+
+def parse_amount(value):
+    """
+    Interpreta importes en formato argentino ("$ 1.234,56") o con punto
+    decimal ("1234.56"). Devuelve None si no es un numero.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    text = re.sub(r"[^\d,.\-]", "", str(value))
+    if not text:
+        return None
+    if "," in text and "." in text:
+        # El ultimo separador es el decimal
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text:
+        text = text.replace(",", ".")
+    elif text.count(".") > 1 or THOUSANDS_PATTERN.fullmatch(text):
+        # "1.234.567" o "1.234": el punto separa miles (un decimal de tres
+        # cifras no aparece en importes)
+        text = text.replace(".", "")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def normalize_name(value):
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.lower().split())
+
+
+def is_valid_tipo_factura(value):
+    name = normalize_name(value)
+    if name.upper() in TIPO_FACTURA_VALUES or name in TIPO_FACTURA_NAMES:
+        return True
+    base, _, letter = name.rpartition(" ")
+    return base in TIPO_FACTURA_NAMES and letter.upper() in TIPO_FACTURA_VALUES
+
+
+def is_valid_amount(value):
+    amount = parse_amount(value)
+    return amount is not None and amount > 0
+
+
+FIELD_VALIDATORS = {
+    "cuit": is_valid_cuit,
+    "fecha_impresion": is_valid_date,
+    "monto_total": is_valid_amount,
+    "iva": lambda value: str(value).strip().upper() in IVA_VALUES,
+    "tipo_factura": is_valid_tipo_factura,
+    "punto_de_venta": lambda value: 0 < len(digits(value)) <= 5,
+    "numero_comprobante": lambda value: 0 < len(digits(value)) <= 8,
+}
+
+
+def validate_field(name, value):
+    if value in (None, ""):
+        return False
+    validator = FIELD_VALIDATORS.get(name)
+    if validator is None:
+        return None
+    return bool(validator(value))
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Replay de trazas de invocacion contra los handlers de OCR con dobles locales.
+
+Las trazas se capturan en los handlers con TRACE_ENABLED=true (lineas
+"TRACE {...}" en CloudWatch Logs). Este script acepta un export de logs o un
+JSONL con una traza por linea, reconstruye eventos con la misma forma y
+documentos sinteticos del mismo tamaño/paginas, y los reproduce con la
+concurrencia indicada reportando throughput, percentiles y tasa de error.
+
+Ejemplo:
+    python scripts/loadtest/replay.py traces.jsonl --target generator \\
+        --concurrency 8 --requests 200 --executor process
+"""
+import argparse
+import contextlib
+import hashlib
+import importlib
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LAMBDAS_DIR = os.path.join(ROOT_DIR, "scripts", "lambdas")
+PROMPTS_DIR = os.path.join(ROOT_DIR, "prompt_engineering")
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, LAMBDAS_DIR)
+
+import stubs  # noqa: E402
+
+# target -> (modulo del handler, modulos cuyos clientes de AWS se reemplazan)
+TARGETS = {
+    "generator": ("ocr.generator", ("ocr.generator", "rasterization", "claude", "dynamo_writer")),
+    "generator_textract": (
+        "ocr.generator_textract",
+        ("ocr.generator_textract", "dynamo_writer"),
+    ),
+    "cascade": (
+        "ocr.cascade",
+        (
+            "ocr.cascade",
+            "ocr.generator",
+            "ocr.generator_textract",
+            "rasterization",
+            "claude",
+            "dynamo_writer",
+        ),
+    ),
+    "pipeline": (
+        "pipeline.local",
+        ("rasterization", "claude", "pipeline.rasterize", "pipeline.extract", "dynamo_writer"),
+    ),
+}
+REPLAY_BUCKET = "replay-data-bucket"
+TRACE_PREFIX = "TRACE "
+
+# Valores por defecto para las hojas del evento segun el tipo registrado
+DEFAULT_LEAVES = {
+    "str": "replay",
+    "int": 0,
+    "float": 0.0,
+    "bool": False,
+    "NoneType": None,
+}
+
+_worker = {}
+_local = threading.local()
+
+
+# ------------------------ Trazas -------------------------------
+
+
+def load_traces(path):
+    """Lee trazas desde un JSONL o un export de CloudWatch Logs."""
+    traces = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if TRACE_PREFIX in line:
+                line = line[line.index(TRACE_PREFIX) + len(TRACE_PREFIX) :]
+            if not line.startswith("{"):
+                continue
+            try:
+                traces.append(json.loads(line))
+            except ValueError:
+                continue
+    return traces
+
+
+def materialize(shape, bucket, key):
+    """Reconstruye un evento a partir de su forma, inyectando bucket y key."""
+    if isinstance(shape, dict):
+        if set(shape) == {"json"}:
+            return json.dumps(materialize(shape["json"], bucket, key))
+        event = {k: materialize(v, bucket, key) for k, v in shape.items()}
+        if "s3" in event and isinstance(event["s3"], dict):
+            event["s3"]["bucket"] = bucket
+            event["s3"]["key"] = key
+        return event
+    if isinstance(shape, list):
+        return [materialize(v, bucket, key) for v in shape]
+    return DEFAULT_LEAVES.get(shape, "replay")
+
+
+def document_key(document):
+    extension = document.get("extension") or ".pdf"
+    signature = f"{extension}:{document.get('size_bytes')}:{document.get('pages')}"
+    digest = hashlib.sha256(signature.encode()).hexdigest()[:16]
+    return f"replay/{digest}{extension}"
+
+
+def stage_samples(traces, stage):
+    return [t.get("stages_ms", {}).get(stage) for t in traces]
+
+
+# ------------------------ Workers -------------------------------
+
+
+def _capture(record):
+    _local.records.append(record)
+
+
+def setup_worker(target, traces, options):
+    """Importa el handler y reemplaza sus clientes de AWS por los dobles."""
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("BUCKET_NAME", REPLAY_BUCKET)
+    os.environ.setdefault("FILE_KEY", "prompt_engineering/prompt.txt")
+    os.environ.setdefault("DYNAMODB_TABLE_NAME", "ocr_files_data")
+    os.environ.setdefault("FAIL_TOPIC_ARN", "arn:aws:sns:us-east-1:000000000000:fail_topic")
+
+    handler_module, patched_modules = TARGETS[target]
+    module = importlib.import_module(handler_module)
+    tracing = importlib.import_module("tracing")
+    tracing.add_sink(_capture)
+
+    s3 = stubs.FakeS3Client()
+    s3.load_directory(REPLAY_BUCKET, PROMPTS_DIR, "prompt_engineering/")
+    decodable = target != "generator_textract"
+    for trace in traces:
+        document = trace.get("document", {})
+        key = document_key(document)
+        if (REPLAY_BUCKET, key) not in s3.objects:
+            s3.put_object(
+                REPLAY_BUCKET,
+                key,
+                stubs.synthesize_document(
+                    document.get("extension") or ".pdf",
+                    document.get("size_bytes"),
+                    document.get("pages"),
+                    decodable=decodable,
+                ),
+            )
+
+    scale = options["latency_scale"]
+    model_latency = stubs.LatencyModel(
+        stage_samples(traces, "model"), scale=scale, default_ms=options["default_model_ms"]
+    )
+    textract_latency = stubs.LatencyModel(
+        stage_samples(traces, "textract"), scale=scale, default_ms=1500.0
+    )
+    pages = max([t.get("document", {}).get("pages") or 1 for t in traces] or [1])
+
+    fakes = {
+        "s3_client": s3,
+        "dynamodb": stubs.FakeDynamoDBResource(),
+        "dynamodb_client": stubs.FakeDynamoDBClient(),
+        "sns_client": stubs.FakeSNSClient(),
+        "bedrock_client": stubs.FakeBedrockClient(
+            model_latency, error_rate=options["error_rate"]
+        ),
+        "textract_client": stubs.FakeTextractClient(textract_latency, pages=pages),
+        "send_sns_message": lambda *args, **kwargs: None,
+    }
+    for name in patched_modules:
+        patched = importlib.import_module(name)
+        for attribute, fake in fakes.items():
+            if hasattr(patched, attribute):
+                setattr(patched, attribute, fake)
+
+    prompting = importlib.import_module("prompting")
+    prompting.read_prompt_from_s3 = lambda bucket, key: s3.get_object(
+        Bucket=bucket, Key=key
+    )["Body"].read().decode("utf-8")
+
+    if target == "pipeline":
+        _worker["handler"] = module.run_pipeline
+    else:
+        _worker["handler"] = module.lambda_handler
+
+
+def invoke(index, event):
+    _local.records = []
+    start = time.perf_counter()
+    error = None
+    try:
+        _worker["handler"](event, None)
+    except Exception as e:
+        error = type(e).__name__
+    latency_ms = (time.perf_counter() - start) * 1000
+    # El pipeline emite una traza por etapa: se prefijan con el nombre del handler
+    records = _local.records
+    if len(records) == 1:
+        stages_ms = records[0].get("stages_ms", {})
+    else:
+        stages_ms = {
+            f"{record['handler']}.{name}": value
+            for record in records
+            for name, value in record.get("stages_ms", {}).items()
+        }
+    return {
+        "index": index,
+        "latency_ms": latency_ms,
+        "error": error,
+        "stages_ms": stages_ms,
+    }
+
+
+def _maxrss_mb():
+    # ru_maxrss esta en KB en Linux
+    usage = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return round(usage / 1024, 1)
+
+
+# ------------------------ Reporte -------------------------------
+
+
+def percentile(values, p):
+    """Percentil por rango mas cercano."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return round(ordered[min(rank, len(ordered)) - 1], 3)
+
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+def build_report(results, wall_s, target, concurrency):
+    latencies = [r["latency_ms"] for r in results]
+    errors = Counter(r["error"] for r in results if r["error"])
+    stages = defaultdict(list)
+    for r in results:
+        for name, value in r["stages_ms"].items():
+            stages[name].append(value)
+
+    total = len(results)
+    return {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": sum(errors.values()),
+        "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+        "errors_by_type": dict(errors),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(total / wall_s, 3) if wall_s else None,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+        "max_rss_mb": _maxrss_mb(),
+    }
+
+
+# ------------------------ Main -------------------------------
+
+
+def run(traces, target, concurrency, requests, executor, options):
+    events = []
+    for i in range(requests):
+        trace = traces[i % len(traces)]
+        key = document_key(trace.get("document", {}))
+        shape = trace.get("event_shape") or {"s3": {"bucket": "str", "key": "str"}}
+        events.append(materialize(shape, REPLAY_BUCKET, key))
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(
+            max_workers=concurrency,
+            initializer=setup_worker,
+            initargs=(target, traces, options),
+        )
+    else:
+        setup_worker(target, traces, options)
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    with pool:
+        start = time.perf_counter()
+        results = list(pool.map(invoke, range(len(events)), events))
+        wall_s = time.perf_counter() - start
+
+    return build_report(results, wall_s, target, concurrency)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("traces", help="JSONL de trazas o export de CloudWatch Logs")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="generator_textract")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=None, help="default: una por traza")
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--default-model-ms", type=float, default=8000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true", help="no silenciar stdout de los handlers")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.traces)
+    handler_name = {"pipeline": "generator", "cascade": "generator_textract"}.get(
+        args.target, args.target
+    )
+    matching = [t for t in traces if t.get("handler") == handler_name]
+    traces = matching or traces
+    if not traces:
+        parser.error(f"No se encontraron trazas en {args.traces}")
+
+    options = {
+        "latency_scale": args.latency_scale,
+        "default_model_ms": args.default_model_ms,
+        "error_rate": args.error_rate,
+    }
+    requests = args.requests or len(traces)
+
+    with open(os.devnull, "w") as devnull:
+        redirect = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        with redirect:
+            report = run(traces, args.target, args.concurrency, requests, args.executor, options)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
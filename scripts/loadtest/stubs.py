@@ -0,0 +1,287 @@
+"""
+Dobles locales de S3, DynamoDB, SNS, Bedrock y Textract para el harness de replay.
+
+Bedrock y Textract simulan latencia muestreando la distribucion de tiempos
+registrada en las trazas, de modo que los handlers ejercitan su camino real
+(rasterizacion, encoding, parseo) sin llamar a AWS.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+
+class LatencyModel:
+    """Muestrea latencias (ms) de una distribucion empirica."""
+
+    def __init__(self, samples_ms, scale=1.0, default_ms=0.0, seed=None):
+        self.samples_ms = [s for s in samples_ms if s is not None] or [default_ms]
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            return self._rng.choice(self.samples_ms) * self.scale
+
+    def sleep(self):
+        time.sleep(self.sample() / 1000.0)
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        self.objects[(Bucket, Key)] = Body
+        return {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        try:
+            data = self.objects[(Bucket, Key)]
+        except KeyError:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": f"s3://{Bucket}/{Key}"}}, "GetObject")
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        data = self.get_object(Bucket, Key)["Body"].getvalue()
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "ContentLength": len(data)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", StartAfter="", **kwargs):
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        return {"Contents": [{"Key": key} for key in keys if key > (StartAfter or "")]}
+
+    def get_paginator(self, operation_name):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield getattr(client, operation_name)(**kwargs)
+
+        return Paginator()
+
+    def load_directory(self, bucket, directory, prefix):
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    self.put_object(bucket, prefix + name, f.read())
+
+
+class FakeTable:
+    def __init__(self, name):
+        self.name = name
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def put_item(self, Item, **kwargs):
+        with self._lock:
+            self.items[Item.get("uuid", len(self.items))] = Item
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_item(self, Key, **kwargs):
+        item = self.items.get(next(iter(Key.values())))
+        return {"Item": item} if item is not None else {}
+
+
+class FakeDynamoDBResource:
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        return self.tables.setdefault(name, FakeTable(name))
+
+
+class FakeDynamoDBClient:
+    """Cliente de bajo nivel (dynamo_writer): guarda los items en formato AttributeValue."""
+
+    def __init__(self):
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def put_item(self, TableName, Item, ReturnValues="NONE", **kwargs):
+        with self._lock:
+            table = self.tables.setdefault(TableName, {})
+            key = json.dumps(Item.get("uuid"), sort_keys=True)
+            old = table.get(key)
+            table[key] = Item
+        response = {"ResponseMetadata": {"HTTPStatusCode": 200}}
+        if ReturnValues == "ALL_OLD" and old is not None:
+            response["Attributes"] = old
+        return response
+
+    def update_item(self, TableName, Key, **kwargs):
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_item(self, TableName, Key, **kwargs):
+        item = self.tables.get(TableName, {}).get(json.dumps(Key.get("uuid"), sort_keys=True))
+        return {"Item": item} if item is not None else {}
+
+
+class FakeSNSClient:
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, **kwargs):
+        self.messages.append(kwargs)
+        return {"MessageId": str(len(self.messages))}
+
+
+SAMPLE_RESULT = {
+    "fecha_impresion": "01-01-2024",
+    "monto_total": "1000.00",
+    "iva": "I",
+    "razon_social": "Comercio de prueba",
+    "punto_de_venta": "0001",
+    "numero_comprobante": "00000001",
+    "tipo_factura": "B",
+    "cuit": "30-00000000-7",
+    "categoria": "Servicios",
+}
+
+
+class FakeBedrockClient:
+    """
+    Responde con el formato de Claude (messages) o de Titan segun el modelId,
+    luego de dormir una latencia muestreada. error_rate inyecta fallas.
+    """
+
+    def __init__(self, latency, error_rate=0.0, result=None, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.result = result or SAMPLE_RESULT
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.latency.sleep()
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            raise RuntimeError("ThrottlingException (simulada)")
+
+        text = json.dumps(self.result)
+        request = json.loads(body)
+        if "titan" in modelId:
+            payload = {"results": [{"outputText": text}]}
+        elif request.get("tools"):
+            tool_name = request["tools"][0]["name"]
+            payload = {
+                "content": [
+                    {"type": "tool_use", "id": "toolu_replay", "name": tool_name, "input": self.result}
+                ]
+            }
+        else:
+            payload = {"content": [{"type": "text", "text": text}]}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+
+class FakeTextractClient:
+    """Devuelve bloques sinteticos (PAGE, KEY_VALUE_SET, TABLE) por pagina."""
+
+    def __init__(self, latency, pages=1, fields=None):
+        self.latency = latency
+        self.pages = pages
+        self.fields = fields or SAMPLE_RESULT
+
+    def analyze_document(self, Document, FeatureTypes=None, **kwargs):
+        self.latency.sleep()
+        return {"Blocks": synthetic_blocks(self.pages, self.fields)}
+
+
+def synthetic_blocks(pages, fields):
+    blocks = []
+    counter = [0]
+
+    def add(block):
+        counter[0] += 1
+        block["Id"] = str(counter[0])
+        blocks.append(block)
+        return block["Id"]
+
+    def words(text):
+        return [
+            add({"BlockType": "WORD", "Text": word, "Confidence": 99.0})
+            for word in str(text).split()
+        ]
+
+    for page in range(1, pages + 1):
+        add({"BlockType": "PAGE", "Page": page})
+        for name, value in fields.items():
+            value_id = add(
+                {
+                    "BlockType": "KEY_VALUE_SET",
+                    "EntityTypes": ["VALUE"],
+                    "Relationships": [{"Type": "CHILD", "Ids": words(value)}],
+                }
+            )
+            add(
+                {
+                    "BlockType": "KEY_VALUE_SET",
+                    "EntityTypes": ["KEY"],
+                    "Relationships": [
+                        {"Type": "CHILD", "Ids": words(name)},
+                        {"Type": "VALUE", "Ids": [value_id]},
+                    ],
+                }
+            )
+        cells = []
+        for row, (name, value) in enumerate(fields.items(), start=1):
+            for col, text in enumerate((name, value), start=1):
+                cells.append(
+                    add(
+                        {
+                            "BlockType": "CELL",
+                            "RowIndex": row,
+                            "ColumnIndex": col,
+                            "Relationships": [{"Type": "CHILD", "Ids": words(text)}],
+                        }
+                    )
+                )
+        add({"BlockType": "TABLE", "Relationships": [{"Type": "CHILD", "Ids": cells}]})
+    return blocks
+
+
+def synthesize_document(extension, size_bytes, pages, decodable=True):
+    """
+    Genera un documento con la extension, tamaño y cantidad de paginas
+    aproximados de la traza. Si decodable=False (Textract no decodifica
+    localmente) devuelve bytes aleatorios del tamaño registrado.
+    """
+    size_bytes = int(size_bytes or 100 * 1024)
+    if not decodable:
+        return os.urandom(size_bytes)
+
+    if extension == ".pdf":
+        import fitz  # PyMuPDF
+
+        document = fitz.open()
+        for page_num in range(int(pages or 1)):
+            page = document.new_page()
+            page.insert_text((72, 72), f"Comprobante de prueba - pagina {page_num + 1}")
+        data = document.tobytes()
+        # Relleno con comentarios PDF despues de %%EOF para igualar el tamaño
+        if len(data) < size_bytes:
+            data += b"\n%" + b"0" * (size_bytes - len(data) - 2)
+        return data
+
+    from PIL import Image
+
+    # Ruido RGB: practicamente incompresible, el archivo queda cerca del tamaño original
+    side = max(16, int((size_bytes / 3) ** 0.5))
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    output = io.BytesIO()
+    image_format = "JPEG" if extension in (".jpg", ".jpeg") else "PNG"
+    image.save(output, format=image_format)
+    return output.getvalue()
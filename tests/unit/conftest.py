@@ -0,0 +1,51 @@
+import os
+import sys
+import uuid
+
+import boto3
+import pytest
+
+# Los modulos de las lambdas se importan como en el runtime de Lambda,
+# con scripts/lambdas como raiz del codigo.
+LAMBDAS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts", "lambdas"
+)
+sys.path.insert(0, os.path.abspath(LAMBDAS_DIR))
+# Los dobles de AWS del harness de replay (stubs.py) tambien se usan en los tests
+LOADTEST_DIR = os.path.join(LAMBDAS_DIR, "..", "loadtest")
+sys.path.insert(0, os.path.abspath(LOADTEST_DIR))
+
+# Los tests con tablas reales corren contra DynamoDB Local, por ejemplo:
+#   docker run -p 8000:8000 amazon/dynamodb-local
+#   DYNAMODB_ENDPOINT_URL=http://localhost:8000 pytest tests/unit
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL")
+
+
+@pytest.fixture
+def local_table():
+    """Crea tablas temporales en DynamoDB Local: local_table(partition_key)."""
+    if not DYNAMODB_ENDPOINT_URL:
+        pytest.skip("DYNAMODB_ENDPOINT_URL no configurado (DynamoDB Local)")
+    dynamodb = boto3.resource(
+        "dynamodb",
+        endpoint_url=DYNAMODB_ENDPOINT_URL,
+        region_name="us-east-1",
+        aws_access_key_id="local",
+        aws_secret_access_key="local",
+    )
+    tables = []
+
+    def create(partition_key):
+        table = dynamodb.create_table(
+            TableName=f"test-{uuid.uuid4().hex[:8]}",
+            KeySchema=[{"AttributeName": partition_key, "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": partition_key, "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        table.wait_until_exists()
+        tables.append(table)
+        return table
+
+    yield create
+    for table in tables:
+        table.delete()
@@ -0,0 +1,168 @@
+import json
+
+import pytest
+
+import admission
+from admission import AdmissionController, QuotaExceeded, request_identity
+
+LIMITS = {
+    "interactiva": {"inflight": 2, "per_minute": 5, "retry_after": 5},
+    "lote": {"inflight": 2, "per_minute": 10, "global_inflight": 3, "retry_after": 30},
+}
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def table(local_table):
+    return local_table("pk")
+
+
+def test_inflight_quota_is_released(table):
+    controller = AdmissionController(table, LIMITS, clock=Clock())
+    first = controller.acquire(1)
+    controller.acquire(1)
+    with pytest.raises(QuotaExceeded) as excinfo:
+        controller.acquire(1)
+    assert excinfo.value.retry_after == 5
+
+    # Otro usuario no se ve afectado
+    controller.acquire(2)
+
+    controller.release(first)
+    controller.acquire(1)
+
+
+def test_per_minute_quota_resets_next_minute(table):
+    clock = Clock(now=1_700_000_040.0)
+    controller = AdmissionController(table, LIMITS, clock=clock)
+    for _ in range(5):
+        controller.release(controller.acquire(1))
+    with pytest.raises(QuotaExceeded) as excinfo:
+        controller.acquire(1)
+    assert 1 <= excinfo.value.retry_after <= 60
+
+    clock.now += 60
+    controller.acquire(1)
+
+
+def test_inflight_rejections_do_not_consume_the_per_minute_quota(table):
+    controller = AdmissionController(table, LIMITS, clock=Clock(now=1_700_000_040.0))
+    tickets = [controller.acquire(1), controller.acquire(1)]
+    for _ in range(10):
+        with pytest.raises(QuotaExceeded) as excinfo:
+            controller.acquire(1)
+        assert excinfo.value.retry_after == 5
+
+    # Solo las 2 admitidas contaron: quedan 3 en el minuto
+    for ticket in tickets:
+        controller.release(ticket)
+    for _ in range(3):
+        controller.release(controller.acquire(1))
+    with pytest.raises(QuotaExceeded):
+        controller.acquire(1)
+
+
+def test_bulk_lane_is_capped_globally_but_interactive_is_not(table):
+    controller = AdmissionController(table, LIMITS, clock=Clock(), global_inflight=5)
+    controller.acquire(1, "lote")
+    controller.acquire(2, "lote")
+    controller.acquire(3, "lote")
+    with pytest.raises(QuotaExceeded):
+        controller.acquire(4, "lote")
+
+    # El carril interactivo conserva su capacidad, aun con el pool global lleno
+    for user in range(4, 8):
+        controller.acquire(user, "interactiva")
+
+
+def test_interactive_load_pushes_out_the_bulk_lane(table):
+    controller = AdmissionController(table, LIMITS, clock=Clock(), global_inflight=4)
+    # Las interactivas ocupan los lugares 3, 2 y 1 del pool global
+    interactive = [controller.acquire(user, "interactiva") for user in (1, 2, 3)]
+    assert [pk for ticket in interactive for pk, _ in ticket if pk.startswith("inflight#*")] == [
+        "inflight#*#3",
+        "inflight#*#2",
+        "inflight#*#1",
+    ]
+
+    # El lote solo puede usar los lugares 0-2: queda uno
+    controller.acquire(10, "lote")
+    with pytest.raises(QuotaExceeded):
+        controller.acquire(11, "lote")
+
+    controller.release(interactive[0])
+    with pytest.raises(QuotaExceeded):
+        controller.acquire(11, "lote")  # el lugar 3 no es del lote
+    controller.release(interactive[1])
+    controller.acquire(11, "lote")
+
+
+def test_leaked_slots_expire_individually(table):
+    clock = Clock()
+    controller = AdmissionController(table, LIMITS, clock=clock)
+    controller.acquire(1)  # nunca se libera (timeout)
+
+    # El trafico posterior del usuario no extiende el vencimiento del lugar perdido
+    clock.now += 300
+    for _ in range(3):
+        controller.release(controller.acquire(1))
+    live = controller.acquire(1)
+
+    clock.now += 100
+    # Vencio solo el lugar perdido: queda uno libre, no se reinicia todo
+    controller.acquire(1)
+    with pytest.raises(QuotaExceeded):
+        controller.acquire(1)
+
+    controller.release(live)
+    controller.acquire(1)
+
+
+def test_release_does_not_free_a_slot_taken_over_after_expiry(table):
+    clock = Clock()
+    controller = AdmissionController(table, LIMITS, clock=clock)
+    stale = controller.acquire(1)
+    controller.acquire(1)
+
+    clock.now += 3600
+    controller.acquire(1)
+    controller.acquire(1)
+    # La invocacion vencida termina tarde: no libera lugares ajenos
+    controller.release(stale)
+    with pytest.raises(QuotaExceeded):
+        controller.acquire(1)
+
+
+def test_pipeline_stages_carry_the_ticket_between_executions(table, monkeypatch):
+    monkeypatch.setattr(admission, "QUOTAS_TABLE_NAME", table.name)
+    monkeypatch.setattr(admission, "_controller", AdmissionController(table, LIMITS, clock=Clock()))
+    event = {"s3": {"bucket": "b", "key": "k"}, "id_usuario": 4}
+
+    # El ticket pasa entre estados como JSON
+    tickets = [json.loads(json.dumps(admission.admit(event))) for _ in range(2)]
+    with pytest.raises(QuotaExceeded):
+        admission.admit(event)
+
+    admission.release_admission(tickets[0])
+    admission.release_admission(None)
+    admission.admit(event)
+
+
+def test_quota_exceeded_response_and_identity():
+    response = QuotaExceeded("Limite alcanzado", 7).to_response()
+    assert response["statusCode"] == 429
+    assert response["headers"]["Retry-After"] == "7"
+    assert json.loads(response["body"])["retry_after"] == 7
+
+    # El carril sale del punto de entrada; "prioridad" en el payload se ignora
+    body = json.dumps({"s3": {"bucket": "b", "key": "k"}, "id_usuario": 9, "prioridad": "lote"})
+    assert request_identity({"body": body, "requestContext": {}}) == (9, "interactiva")
+    assert request_identity({"s3": {}, "id_usuario": 3, "prioridad": "interactiva"}) == (3, "lote")
+    assert request_identity({"s3": {}}) == ("anonimo", "lote")
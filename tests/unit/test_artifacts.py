@@ -0,0 +1,66 @@
+from artifacts import ArtifactStore, document_hash
+from stubs import FakeS3Client
+
+
+def test_artifacts_are_keyed_by_document_hash_and_stage_version():
+    s3 = FakeS3Client()
+    doc_hash = document_hash(b"%PDF-1.4 factura")
+    store = ArtifactStore(s3, "bucket", "artifacts/", {"textract": 1})
+
+    calls = []
+    build = lambda: calls.append(1) or [{"BlockType": "PAGE"}]
+    assert store.get_or_create(doc_hash, "textract", build) == [{"BlockType": "PAGE"}]
+    assert store.get_or_create(doc_hash, "textract", build) == [{"BlockType": "PAGE"}]
+    assert len(calls) == 1
+    assert ("bucket", f"artifacts/{doc_hash}/textract-v1.json") in s3.objects
+
+    # Una version nueva de la etapa no reutiliza los artefactos anteriores
+    bumped = ArtifactStore(s3, "bucket", "artifacts/", {"textract": 2})
+    assert bumped.get(doc_hash, "textract") is None
+
+
+def test_manifest_records_every_source_once():
+    s3 = FakeS3Client()
+    store = ArtifactStore(s3, "bucket", "artifacts/", {"textract": 1, "images": 1})
+    store.put("abc", "textract", [])
+    store.put("abc", "images", [])
+    store.record("abc", "uuid-1", "s3://in/a.pdf", 1, "textract")
+    store.record("abc", "uuid-1", "s3://in/a.pdf", 1, "textract")
+    # Otra subida del mismo contenido, registrada por otro contenedor
+    ArtifactStore(s3, "bucket", "artifacts/", {"textract": 1, "images": 1}).record(
+        "abc", "uuid-2", "s3://in/copia.pdf", 2, "claude"
+    )
+
+    manifest = store.get_manifest("abc")
+    assert manifest["etapas"] == {"textract": 1, "images": 1}
+    assert sorted((source["uuid"], source["extractor"]) for source in manifest["fuentes"]) == [
+        ("uuid-1", "textract"),
+        ("uuid-2", "claude"),
+    ]
+    assert store.get_manifest("otro") is None
+
+
+def test_manifest_keeps_sources_of_the_previous_format():
+    s3 = FakeS3Client()
+    store = ArtifactStore(s3, "bucket", "artifacts/", {"textract": 1, "images": 1})
+    store._write(
+        store.manifest_key("abc"),
+        {"documento_hash": "abc", "etapas": {"textract": 1}, "fuentes": [{"uuid": "viejo", "s3_uri": "s3://in/v.pdf"}]},
+    )
+    store.put("abc", "textract", [])
+    store.record("abc", "nuevo", "s3://in/n.pdf", 1, "cascade")
+
+    manifest = store.get_manifest("abc")
+    assert sorted(source["uuid"] for source in manifest["fuentes"]) == ["nuevo", "viejo"]
+
+
+def test_iterate_manifest_keys_resumes_after_checkpoint():
+    store = ArtifactStore(FakeS3Client(), "bucket", "artifacts/", {"textract": 1})
+    for doc_hash in ("aaa", "bbb", "ccc"):
+        store.put(doc_hash, "textract", [])
+        store.record(doc_hash, doc_hash, f"s3://in/{doc_hash}", 1, "textract")
+
+    keys = list(store.iterate_manifest_keys())
+    assert keys == [f"artifacts/{h}/manifest.json" for h in ("aaa", "bbb", "ccc")]
+    assert list(store.iterate_manifest_keys(start_after=keys[0])) == keys[1:]
+    assert [store.doc_hash_of(key) for key in keys] == ["aaa", "bbb", "ccc"]
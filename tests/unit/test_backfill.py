@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+
+import boto3
+import pytest
+
+# Los modulos de las lambdas crean clientes de boto3 al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from artifacts import ArtifactStore  # noqa: E402
+from backfill import reextract  # noqa: E402
+from backfill.reextract import Checkpoint, process_manifest, run_backfill, update_rows  # noqa: E402
+from dynamo_writer import ItemWriter  # noqa: E402
+from stubs import FakeS3Client  # noqa: E402
+
+VERSIONS = {"textract": 1, "images": 1, "text": 1}
+
+
+class RecordingWriter:
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.updates = {}
+
+    def update(self, key, values, only_existing=False):
+        if key["uuid"] in self.missing:
+            return False
+        self.updates[key["uuid"]] = values
+        return True
+
+
+@pytest.fixture
+def store():
+    return ArtifactStore(FakeS3Client(), "bucket", "artifacts/", VERSIONS)
+
+
+@pytest.fixture
+def models(monkeypatch):
+    monkeypatch.setattr(reextract, "build_prompt_text", lambda: "prompt")
+    monkeypatch.setattr(reextract, "extract_fields", lambda content: {"cuit": "claude", "paginas": len(content)})
+    monkeypatch.setattr(reextract, "extract_from_blocks", lambda blocks: {"cuit": "textract"})
+    writer = RecordingWriter()
+    monkeypatch.setattr(reextract, "get_writer", lambda table_name: writer)
+    return writer
+
+
+def test_each_row_is_reextracted_with_its_original_extractor(store, models):
+    store.put("abc", "textract", [{"BlockType": "PAGE"}])
+    store.put("abc", "images", [{"type": "image"}])
+    store.record("abc", "uuid-claude", "s3://in/a.pdf", 1, "claude")
+    store.record("abc", "uuid-textract", "s3://in/b.pdf", 2, "textract")
+    # Fuente del formato anterior, sin extractor: hay imagenes, asi que Claude
+    store._write(
+        store.manifest_key("abc"),
+        {"documento_hash": "abc", "fuentes": [{"uuid": "uuid-viejo", "s3_uri": "s3://in/c.pdf"}]},
+    )
+
+    assert process_manifest(store, store.manifest_key("abc"), "tabla", "auto", "job-1") is None
+    assert {uuid: values["cuit"] for uuid, values in models.updates.items()} == {
+        "uuid-claude": "claude",
+        "uuid-textract": "textract",
+        "uuid-viejo": "claude",
+    }
+    assert models.updates["uuid-claude"]["paginas"] == 2  # imagen + prompt
+
+    # Un modo explicito re-extrae todas las filas con ese extractor
+    assert process_manifest(store, store.manifest_key("abc"), "tabla", "textract", "job-2") is None
+    assert {values["cuit"] for values in models.updates.values()} == {"textract"}
+    assert {values["version_prompt"] for values in models.updates.values()} == {"job-2"}
+
+
+def test_missing_artifacts_are_reported_as_a_failure(store, models):
+    store.put("abc", "textract", [])
+    store.record("abc", "uuid-claude", "s3://in/a.pdf", 1, "claude")
+
+    error = process_manifest(store, store.manifest_key("abc"), "tabla", "auto", "job")
+    assert "claude" in error
+    assert models.updates == {}
+
+
+def test_cascade_rows_are_reextracted_with_the_cascade(store, models, monkeypatch):
+    pytest.importorskip("fitz")
+    from ocr import cascade
+
+    calls = []
+    monkeypatch.setattr(
+        cascade,
+        "extract_with_cascade",
+        lambda file_content, extension, store, doc_hash: calls.append(doc_hash) or {"cuit": "cascada"},
+    )
+    store.put("abc", "textract", [])
+    store.record("abc", "uuid-cascada", "s3://in/a.pdf", 1, "cascade")
+
+    assert process_manifest(store, store.manifest_key("abc"), "tabla", "auto", "job") is None
+    assert calls == ["abc"]
+    assert models.updates["uuid-cascada"]["cuit"] == "cascada"
+
+
+def test_update_rows_only_touches_existing_rows(local_table, monkeypatch):
+    table = local_table("uuid")
+    client = boto3.client(
+        "dynamodb",
+        endpoint_url=table.meta.client.meta.endpoint_url,
+        region_name="us-east-1",
+        aws_access_key_id="local",
+        aws_secret_access_key="local",
+    )
+    monkeypatch.setattr(reextract, "get_writer", lambda name: ItemWriter(name, client=client, s3=FakeS3Client()))
+    table.put_item(Item={"uuid": "a", "timestamp": "2024-09-01T10:00:00", "cuit": "viejo"})
+
+    update_rows(table.name, [{"uuid": "a"}, {"uuid": "borrada"}], {"cuit": "nuevo"}, "job-1")
+
+    row = table.get_item(Key={"uuid": "a"})["Item"]
+    assert row["cuit"] == "nuevo" and row["version_prompt"] == "job-1"
+    assert row["timestamp"] == "2024-09-01T10:00:00" and "reextraido" in row
+    assert "Item" not in table.get_item(Key={"uuid": "borrada"})
+
+
+class CheckpointLog(FakeS3Client):
+    """Guarda cada version escrita del checkpoint."""
+
+    def __init__(self):
+        super().__init__()
+        self.saves = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if Key.startswith("backfill/"):
+            self.saves.append(json.loads(Body))
+        return super().put_object(Bucket, Key, Body, **kwargs)
+
+
+def add_documents(s3, doc_hashes):
+    store = ArtifactStore(s3, "bucket", "artifacts/", VERSIONS)
+    for doc_hash in doc_hashes:
+        store.put(doc_hash, "textract", [])
+        store.record(doc_hash, doc_hash, f"s3://in/{doc_hash}", 1, "textract")
+    return [store.manifest_key(doc_hash) for doc_hash in doc_hashes]
+
+
+def test_checkpoint_never_passes_a_document_still_in_flight(monkeypatch):
+    s3 = CheckpointLog()
+    keys = add_documents(s3, ["aaa", "bbb", "ccc"])
+    monkeypatch.setattr(reextract, "CHECKPOINT_EVERY", 1)
+    last_done = threading.Event()
+
+    def process(store, key, table_name, mode, job_id):
+        # El primer documento termina despues que los siguientes
+        if key == keys[0]:
+            last_done.wait(timeout=5)
+        elif key == keys[-1]:
+            last_done.set()
+
+    monkeypatch.setattr(reextract, "process_manifest", process)
+    report = run_backfill(bucket="bucket", table_name="tabla", job_id="job", concurrency=3, s3_client=s3)
+
+    assert report["completo"] and report["procesados"] == 3
+    for state in s3.saves:
+        assert state["ultima_clave"] == keys[state["procesados"] - 1]
+
+
+def test_interrupted_job_resumes_from_the_checkpoint(monkeypatch):
+    s3 = FakeS3Client()
+    keys = add_documents(s3, ["aaa", "bbb", "ccc"])
+    processed = []
+
+    def process(store, key, table_name, mode, job_id):
+        processed.append(key)
+        return "sin imagenes" if key == keys[1] else None
+
+    monkeypatch.setattr(reextract, "process_manifest", process)
+
+    first = run_backfill(bucket="bucket", table_name="tabla", job_id="job", limit=2, s3_client=s3)
+    assert not first["completo"]
+    assert first["ultima_clave"] == keys[1] and processed == keys[:2]
+
+    second = run_backfill(bucket="bucket", table_name="tabla", job_id="job", s3_client=s3)
+    assert second["completo"] and processed == keys
+    assert second["procesados"] == 3
+    assert second["fallidos"] == [{"clave": keys[1], "error": "sin imagenes"}]
+
+    # Un job completo no vuelve a procesar nada
+    assert run_backfill(bucket="bucket", table_name="tabla", job_id="job", s3_client=s3)["completo"]
+    assert processed == keys
+    assert Checkpoint(s3, "bucket", "job").load().state["procesados"] == 3
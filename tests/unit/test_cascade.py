@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("fitz")
+
+# Los modulos del generador crean clientes de boto3 al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import rasterization  # noqa: E402
+from ocr import cascade, generator_textract  # noqa: E402
+from ocr.cascade import DEFAULT_CONFIDENCE, score_fields  # noqa: E402
+
+FIELDS = ["cuit", "monto_total", "iva", "razon_social"]
+
+CHEAP = {
+    "cuit": "30-00000000-7",
+    "monto_total": "1.500,00",
+    "iva": "I",
+    "razon_social": "Comercio SA",
+    "confianza": {"cuit": 0.95, "monto_total": 0.9, "iva": 0.9, "razon_social": 0.9},
+}
+
+VISION = {
+    "cuit": "30-00000000-7",
+    "monto_total": "1500.00",
+    "iva": "E",
+    "razon_social": "Comercio Sociedad Anonima",
+    "categoria": "Comida",
+}
+
+
+def test_score_fields_combines_validators_and_reported_confidence():
+    result = {
+        "cuit": "30-00000000-1",  # digito verificador invalido
+        "monto_total": "1.234,56",
+        "iva": "I",
+        "razon_social": "Comercio SA",
+        "tipo_factura": "B",
+        "confianza": {"monto_total": 93, "iva": 0.4},
+        "razon_social_confianza": "0.65",
+    }
+    scores = score_fields(result, FIELDS + ["tipo_factura", "categoria"])
+
+    assert scores == {
+        "cuit": 0.0,
+        "monto_total": pytest.approx(0.93),  # porcentaje normalizado
+        "iva": 0.4,
+        "razon_social": 0.65,
+        "tipo_factura": DEFAULT_CONFIDENCE,
+        "categoria": 0.0,  # vacio
+    }
+
+
+@pytest.fixture
+def cascade_calls(monkeypatch):
+    calls = {"vision": []}
+    monkeypatch.setattr(cascade, "FILE_KEY", "prompt_engineering/prompt.txt")
+    monkeypatch.setattr(cascade, "load_prompt", lambda bucket, key: json.dumps(dict.fromkeys(FIELDS, "")))
+    monkeypatch.setattr(cascade, "build_prompt_text", lambda: "prompt")
+    monkeypatch.setattr(
+        rasterization, "get_image_blocks", lambda *args: [{"type": "image", "source": {}}]
+    )
+
+    def extract_fields(content):
+        calls["vision"].append(content)
+        return dict(VISION)
+
+    monkeypatch.setattr(cascade, "extract_fields", extract_fields)
+
+    def use_cheap_result(result):
+        monkeypatch.setattr(
+            generator_textract, "extract_with_textract", lambda *args, **kwargs: dict(result)
+        )
+
+    calls["cheap"] = use_cheap_result
+    return calls
+
+
+def test_confident_result_is_not_escalated(cascade_calls):
+    cascade_calls["cheap"](CHEAP)
+
+    result = cascade.extract_with_cascade(b"%PDF", ".pdf")
+    assert result == dict(CHEAP, campos_escalados=[])
+    assert cascade_calls["vision"] == []
+
+
+def test_only_weak_fields_are_taken_from_the_vision_model(cascade_calls):
+    cascade_calls["cheap"](dict(CHEAP, iva="Z"))
+
+    result = cascade.extract_with_cascade(b"%PDF", ".pdf")
+
+    (content,) = cascade_calls["vision"]
+    assert content[-1] == {"type": "text", "text": "prompt"}
+    assert result["campos_escalados"] == ["iva"]
+    assert result["iva"] == "E"
+    # Los campos confiables y los que Claude no debia corregir quedan del camino barato
+    assert result["razon_social"] == "Comercio SA"
+    assert result["monto_total"] == "1.500,00"
+    assert "categoria" not in result
+
+
+def test_mostly_weak_documents_take_the_whole_vision_result(cascade_calls, monkeypatch):
+    monkeypatch.setattr(cascade, "CASCADE_DOCUMENT_RATIO", 0.5)
+    weak = dict(CHEAP, iva="Z", confianza={"cuit": 0.95, "monto_total": 0.2})
+    cascade_calls["cheap"](weak)
+
+    result = cascade.extract_with_cascade(b"%PDF", ".pdf")
+
+    assert result["campos_escalados"] == ["monto_total", "iva"]
+    assert {name: result[name] for name in VISION} == VISION
+    # La confianza del camino barato se conserva para auditar la escalacion
+    assert result["confianza"] == weak["confianza"]
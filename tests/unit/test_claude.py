@@ -0,0 +1,100 @@
+import io
+import json
+import os
+
+import pytest
+
+# claude crea el cliente de bedrock-runtime al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import claude  # noqa: E402
+import prompting  # noqa: E402
+
+FIELDS = {"monto_total": "Total", "cuit": "CUIT del emisor"}
+
+
+class RecordingBedrock:
+    def __init__(self, content):
+        self.content = content
+        self.requests = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.requests.append(json.loads(body))
+        return {"body": io.BytesIO(json.dumps({"content": self.content}).encode("utf-8"))}
+
+
+@pytest.fixture
+def model(monkeypatch):
+    files = {
+        "prompt.txt": "Extrae los campos.\n<example>",
+        "prompt.json": json.dumps(FIELDS),
+    }
+    monkeypatch.setattr(prompting, "read_prompt_from_s3", lambda bucket, key: files[key])
+    monkeypatch.setattr(prompting, "_templates", {})
+    monkeypatch.setattr(prompting, "_tools", {})
+    monkeypatch.setattr(claude, "BUCKET_NAME", "bucket")
+    monkeypatch.setattr(claude, "FILE_KEY", "prompt.txt")
+    monkeypatch.setattr(claude, "claude_hedger", None)
+
+    def respond(*content):
+        client = RecordingBedrock(list(content))
+        monkeypatch.setattr(claude, "bedrock_client", client)
+        return client
+
+    return respond
+
+
+def test_tool_mode_returns_the_tool_input_without_parsing_text(model, monkeypatch):
+    monkeypatch.setattr(claude, "OUTPUT_MODE", "tool")
+    fields = {"monto_total": 1234.5, "cuit": "30-00000000-7", "confianza": {"cuit": 0.9}}
+    client = model(
+        {"type": "text", "text": "Registro el comprobante."},
+        {"type": "tool_use", "id": "toolu_1", "name": prompting.OUTPUT_TOOL_NAME, "input": fields},
+    )
+
+    content = [{"type": "text", "text": claude.build_prompt_text()}]
+    assert claude.extract_fields(content) == fields
+
+    (request,) = client.requests
+    assert request["tool_choice"] == {"type": "tool", "name": prompting.OUTPUT_TOOL_NAME}
+    assert request["tools"][0]["input_schema"]["properties"]["monto_total"]["type"] == "number"
+    # El ejemplo JSON del prompt se reemplaza por la referencia a la herramienta
+    prompt = request["messages"][0]["content"][0]["text"]
+    assert claude.TOOL_MODE_EXAMPLE in prompt and "CUIT del emisor" not in prompt
+
+
+def test_tool_mode_fails_when_the_tool_is_not_called(model, monkeypatch):
+    monkeypatch.setattr(claude, "OUTPUT_MODE", "tool")
+    model({"type": "text", "text": '{"monto_total": 10}'})
+
+    with pytest.raises(ValueError, match=prompting.OUTPUT_TOOL_NAME):
+        claude.extract_fields([{"type": "text", "text": "prompt"}])
+
+
+def test_text_mode_extracts_the_json_from_the_reply(model, monkeypatch):
+    monkeypatch.setattr(claude, "OUTPUT_MODE", "text")
+    client = model({"type": "text", "text": 'Aqui esta: {"monto_total": "10", "cuit": "x"} listo'})
+
+    assert claude.extract_fields([{"type": "text", "text": claude.build_prompt_text()}]) == {
+        "monto_total": "10",
+        "cuit": "x",
+    }
+    (request,) = client.requests
+    assert "tools" not in request
+    assert "CUIT del emisor" in request["messages"][0]["content"][0]["text"]
+
+
+def test_encoded_content_is_spliced_without_decoding(model, monkeypatch):
+    monkeypatch.setattr(claude, "OUTPUT_MODE", "tool")
+    client = model({"type": "tool_use", "id": "toolu_1", "name": prompting.OUTPUT_TOOL_NAME, "input": {}})
+    images = [{"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": "iVBORw0"}}]
+
+    content = claude.append_text_block(json.dumps(images).encode("utf-8"), "prompt")
+    assert json.loads(content) == images + [{"type": "text", "text": "prompt"}]
+    assert json.loads(claude.append_text_block(b"[]", "prompt")) == [{"type": "text", "text": "prompt"}]
+
+    claude.extract_fields(content)
+    claude.extract_fields(images + [{"type": "text", "text": "prompt"}])
+    spliced, encoded = client.requests
+    assert spliced == encoded
+    assert spliced["messages"][0]["content"][-1] == {"type": "text", "text": "prompt"}
@@ -0,0 +1,243 @@
+import json
+import os
+from decimal import Decimal
+
+import boto3
+import pytest
+from boto3.dynamodb.types import TypeDeserializer
+
+# dynamo_writer crea clientes de boto3 al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from dynamo_writer import ItemTooLarge, ItemWriter, attribute_size, serialize, serialize_map  # noqa: E402
+from stubs import FakeS3Client  # noqa: E402
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    def put_item(self, **kwargs):
+        self.calls.append(kwargs)
+        return {}
+
+    def update_item(self, **kwargs):
+        self.calls.append(kwargs)
+        return {}
+
+    def get_item(self, **kwargs):
+        return {}
+
+
+def local_client(table):
+    # El cliente de bajo nivel propio, sin los hooks de serializacion del resource
+    return boto3.client(
+        "dynamodb",
+        endpoint_url=table.meta.client.meta.endpoint_url,
+        region_name="us-east-1",
+        aws_access_key_id="local",
+        aws_secret_access_key="local",
+    )
+
+
+def test_serialize_matches_boto3_types():
+    item = {
+        "uuid": "abc",
+        "monto_total": 1234.56,
+        "cantidad": 3,
+        "exento": False,
+        "observaciones": None,
+        "confianza": {"cuit": 0.93, "fecha": Decimal("0.5")},
+        "items": [{"descripcion": "Cafe", "precio": 2.5}, "sin precio"],
+        "etiquetas": {"viaje"},
+    }
+    attributes, _ = serialize_map(item)
+    deserializer = TypeDeserializer()
+    restored = {name: deserializer.deserialize(value) for name, value in attributes.items()}
+
+    assert restored["monto_total"] == Decimal("1234.56")
+    assert restored["confianza"] == {"cuit": Decimal("0.93"), "fecha": Decimal("0.5")}
+    assert restored["items"][0]["precio"] == Decimal("2.5")
+    assert restored["exento"] is False and restored["observaciones"] is None
+    assert restored["etiquetas"] == {"viaje"}
+    assert all(attribute_size(serialize(value)[0]) == serialize(value)[1] for value in item.values())
+
+
+def test_serialize_rejects_values_dynamodb_cannot_store():
+    with pytest.raises(ValueError):
+        serialize(float("nan"))
+    with pytest.raises(TypeError):
+        serialize(object())
+
+
+def test_oversized_attributes_are_offloaded_to_s3():
+    client, s3 = RecordingClient(), FakeS3Client()
+    writer = ItemWriter("ocr_files_data", client=client, s3=s3, offload_bucket="bucket", max_item_bytes=1024)
+    raw = "x" * 4000
+    writer.put({"uuid": "abc", "timestamp": "2024-09-01T10:00:00", "respuesta_cruda": raw})
+
+    (call,) = client.calls
+    stored = call["Item"]
+    assert "respuesta_cruda" not in stored
+    uri = stored["campos_en_s3"]["M"]["respuesta_cruda"]["S"]
+    # Cada escritura usa su propio id en la clave
+    assert uri.startswith("s3://bucket/dynamodb-offload/ocr_files_data/abc/")
+    assert uri.endswith("/respuesta_cruda.json")
+    (key,) = [key for _, key in s3.objects]
+    assert uri == f"s3://bucket/{key}" and json.loads(s3.objects[("bucket", key)]) == raw
+
+    no_bucket = ItemWriter("ocr_files_data", client=client, s3=s3, offload_bucket=None, max_item_bytes=1024)
+    with pytest.raises(ItemTooLarge):
+        no_bucket.put({"uuid": "abc", "respuesta_cruda": raw})
+
+
+def test_update_expressions_are_cached_per_field_set():
+    client = RecordingClient()
+    writer = ItemWriter("ocr_files_data", client=client, s3=FakeS3Client())
+    writer.update({"uuid": "a"}, {"cuit": "30-00000000-7", "monto_total": 10.5})
+    writer.update({"uuid": "b"}, {"cuit": "20-00000000-1", "monto_total": 7})
+
+    # Valores chicos: sin GetItem, condicionados a que no tengan puntero en S3
+    first, second = client.calls
+    assert first["UpdateExpression"] is second["UpdateExpression"] == "SET #f0 = :v0, #f1 = :v1"
+    assert first["ConditionExpression"] == "attribute_not_exists(#p.#f0) AND attribute_not_exists(#p.#f1)"
+    assert second["ExpressionAttributeValues"] == {
+        ":v0": {"S": "20-00000000-1"},
+        ":v1": {"N": "7"},
+    }
+
+
+def test_newer_timestamp_wins(local_table):
+    table = local_table("uuid")
+    writer = ItemWriter(table.name, client=local_client(table), s3=FakeS3Client())
+
+    assert writer.put({"uuid": "abc", "timestamp": "2024-09-01T10:00:00", "cuit": "nuevo"}, newer_than="timestamp")
+    assert not writer.put({"uuid": "abc", "timestamp": "2024-08-01T10:00:00", "cuit": "viejo"}, newer_than="timestamp")
+    assert table.get_item(Key={"uuid": "abc"})["Item"]["cuit"] == "nuevo"
+
+    assert not writer.update({"uuid": "otro"}, {"cuit": "x"}, only_existing=True)
+    assert "Item" not in table.get_item(Key={"uuid": "otro"})
+
+
+def test_owner_of_an_expired_lease_cannot_overwrite_the_row(local_table):
+    table = local_table("uuid")
+    writer = ItemWriter(table.name, client=local_client(table), s3=FakeS3Client())
+
+    def put(timestamp, fence, cuit):
+        item = {"uuid": "abc", "timestamp": timestamp, "lease_fence": fence, "cuit": cuit}
+        return writer.put(item, newer_than="timestamp", fence="lease_fence")
+
+    assert put("2024-09-01T10:00:00", 2000, "nueva")
+    # La invocacion vieja termina despues (timestamp mayor) con un fence menor
+    assert not put("2024-09-01T10:05:00", 1000, "vieja")
+    assert table.get_item(Key={"uuid": "abc"})["Item"]["cuit"] == "nueva"
+    assert put("2024-09-01T10:06:00", 3000, "reintento")
+
+
+def test_rejected_write_keeps_the_offloaded_objects_of_the_current_row(local_table):
+    table = local_table("uuid")
+    s3 = FakeS3Client()
+    writer = ItemWriter(
+        table.name, client=local_client(table), s3=s3, offload_bucket="bucket", max_item_bytes=1024
+    )
+
+    def put(timestamp, raw):
+        return writer.put({"uuid": "abc", "timestamp": timestamp, "respuesta_cruda": raw}, newer_than="timestamp")
+
+    assert put("2024-09-01T10:00:00", "n" * 4000)
+    assert not put("2024-08-01T10:00:00", "v" * 4000)
+
+    # La escritura rechazada borra sus objetos y no toca los de la fila vigente
+    assert len(s3.objects) == 1
+    assert writer.get({"uuid": "abc"})["respuesta_cruda"] == "n" * 4000
+    assert writer.get({"uuid": "otro"}) is None
+
+    # Una escritura aplicada borra los objetos de la fila que reemplaza
+    assert put("2024-09-02T10:00:00", "m" * 4000)
+    assert len(s3.objects) == 1
+    assert writer.get({"uuid": "abc"})["respuesta_cruda"] == "m" * 4000
+
+
+def test_update_is_sized_and_replaces_stale_pointers(local_table):
+    table = local_table("uuid")
+    s3 = FakeS3Client()
+    writer = ItemWriter(
+        table.name,
+        client=local_client(table),
+        s3=s3,
+        offload_bucket="bucket",
+        max_item_bytes=1024,
+        item_limit_bytes=2048,
+    )
+    writer.put({"uuid": "abc", "timestamp": "2024-09-01T10:00:00", "respuesta_cruda": "x" * 4000})
+
+    # Un valor chico vuelve a la fila y se descartan el puntero y el objeto viejos
+    assert writer.update({"uuid": "abc"}, {"respuesta_cruda": "corta"}, only_existing=True)
+    row = table.get_item(Key={"uuid": "abc"})["Item"]
+    assert row["respuesta_cruda"] == "corta" and "campos_en_s3" not in row
+    assert not s3.objects
+
+    # Un valor que no entra se guarda en S3 y se borra el valor en linea
+    assert writer.update({"uuid": "abc"}, {"respuesta_cruda": "y" * 4000, "cuit": "30-00000000-7"})
+    row = table.get_item(Key={"uuid": "abc"})["Item"]
+    assert "respuesta_cruda" not in row and set(row["campos_en_s3"]) == {"respuesta_cruda"}
+    assert writer.get({"uuid": "abc"})["respuesta_cruda"] == "y" * 4000
+
+    assert writer.update({"uuid": "abc"}, {"respuesta_cruda": "z" * 4000})
+    assert len(s3.objects) == 1
+    assert writer.get({"uuid": "abc"})["respuesta_cruda"] == "z" * 4000
+
+    # Un valor chico sin puntero se escribe sin leer y conserva los punteros
+    assert writer.update({"uuid": "abc"}, {"cuit": "20-00000000-1"})
+    row = writer.get({"uuid": "abc"})
+    assert row["cuit"] == "20-00000000-1" and row["respuesta_cruda"] == "z" * 4000
+
+    no_bucket = ItemWriter(
+        table.name,
+        client=local_client(table),
+        s3=FakeS3Client(),
+        offload_bucket=None,
+        max_item_bytes=1024,
+        item_limit_bytes=2048,
+    )
+    with pytest.raises(ItemTooLarge):
+        no_bucket.update({"uuid": "abc"}, {"cuit": "z" * 4000})
+
+
+def test_sized_update_is_conditioned_on_the_pointers_it_read(local_table):
+    table = local_table("uuid")
+    s3 = FakeS3Client()
+
+    def writer(client):
+        return ItemWriter(
+            table.name, client=client, s3=s3, offload_bucket="bucket", max_item_bytes=1024, item_limit_bytes=2048
+        )
+
+    other = writer(local_client(table))
+    other.put({"uuid": "abc", "timestamp": "2024-09-01T10:00:00"})
+
+    class RacingClient:
+        """Otra escritura mueve un campo a S3 entre la primera lectura y la escritura."""
+
+        def __init__(self, client):
+            self.client = client
+            self.reads = 0
+
+        def get_item(self, **kwargs):
+            response = self.client.get_item(**kwargs)
+            self.reads += 1
+            if self.reads == 1:
+                other.update({"uuid": "abc"}, {"items": "i" * 4000})
+            return response
+
+        def update_item(self, **kwargs):
+            return self.client.update_item(**kwargs)
+
+    racing = RacingClient(local_client(table))
+    assert writer(racing).update({"uuid": "abc"}, {"respuesta_cruda": "r" * 4000})
+
+    # El primer intento no pisa el puntero de la otra escritura: se vuelve a leer
+    assert racing.reads == 2
+    row = writer(local_client(table)).get({"uuid": "abc"})
+    assert row["items"] == "i" * 4000 and row["respuesta_cruda"] == "r" * 4000
+    assert len(s3.objects) == 2
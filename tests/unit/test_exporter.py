@@ -0,0 +1,161 @@
+import io
+import os
+from decimal import Decimal
+
+import boto3
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+# utils crea clientes de boto3 al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import stubs  # noqa: E402
+from export import exporter  # noqa: E402
+from export.exporter import COLUMN_TYPES, ChunkWriter, flatten, parquet_column, to_row  # noqa: E402
+from utils import decimal_to_number  # noqa: E402
+
+
+def test_decimal_to_number_recurses_into_every_container():
+    item = {
+        "monto_total": Decimal("1500"),
+        "confianza": {"cuit": Decimal("0.93")},
+        "items": [{"precio": Decimal("2.5")}],
+        "montos": {Decimal("1"), Decimal("2.5")},
+    }
+    assert decimal_to_number(item) == {
+        "monto_total": 1500,
+        "confianza": {"cuit": 0.93},
+        "items": [{"precio": 2.5}],
+        "montos": {1, 2.5},
+    }
+    assert isinstance(decimal_to_number(item)["monto_total"], int)
+
+
+def test_flatten_nests_maps_and_serializes_collections():
+    row = flatten(
+        {
+            "uuid": "abc",
+            "confianza": {"cuit": 0.9, "detalle": {"ocr": 0.5}},
+            "items": [{"descripcion": "Cafe"}],
+            "etiquetas": {"viaje", "comida"},
+        }
+    )
+    assert row == {
+        "uuid": "abc",
+        "confianza.cuit": 0.9,
+        "confianza.detalle.ocr": 0.5,
+        "items": '[{"descripcion": "Cafe"}]',
+        # Los sets se ordenan: la misma fila exporta siempre el mismo texto
+        "etiquetas": '["comida", "viaje"]',
+    }
+    assert to_row({"montos": {Decimal("2"), Decimal("1")}}) == {"montos": "[1, 2]"}
+
+
+def test_parquet_column_casts_to_the_declared_type():
+    assert parquet_column([1500, 12.5, "1.234,56", None, "sin monto"], "float64") == [
+        1500.0,
+        12.5,
+        1234.56,
+        None,
+        None,
+    ]
+    assert parquet_column([7, "anonimo", None, True]) == ["7", "anonimo", None, "True"]
+    assert COLUMN_TYPES["monto_total"] == "float64"
+    assert COLUMN_TYPES["confianza.monto_total"] == "float64"
+    assert COLUMN_TYPES["id_usuario"] == "string"
+
+
+def read_parquet(s3, key):
+    return pq.read_table(io.BytesIO(s3.objects[("bucket", key)]))
+
+
+def test_chunk_writer_uses_the_same_schema_in_every_file():
+    s3 = stubs.FakeS3Client()
+    writer = ChunkWriter(s3, "bucket", "exports/x/", 0, ("csv", "parquet"), chunk_rows=2)
+    rows = [
+        # Primer chunk: montos enteros, sin confianza ni usuario numerico
+        {"uuid": "a", "id_usuario": 7, "timestamp": "2024-09-01T10:00:00", "monto_total": 1500},
+        {"uuid": "b", "id_usuario": 8, "timestamp": "2024-09-02T10:00:00", "monto_total": 20},
+        # Segundo chunk: montos como texto, confianza y una columna nueva
+        {
+            "uuid": "c",
+            "id_usuario": "anonimo",
+            "timestamp": "2024-09-03T10:00:00",
+            "monto_total": "1.234,56",
+            "confianza.monto_total": 0.5,
+            "reextraido": "2024-10-01",
+        },
+    ]
+    for row in rows:
+        writer.add(row)
+    writer.flush()
+
+    parquet_keys = [key for _, key in s3.objects if key.endswith(".parquet")]
+    assert len(parquet_keys) == 2 and len(writer.files) == 4
+    first, second = (read_parquet(s3, key) for key in sorted(parquet_keys))
+
+    for name in COLUMN_TYPES:
+        assert first.schema.field(name).type == second.schema.field(name).type
+    assert first.schema.field("monto_total").type == pa.float64()
+    assert first.schema.field("id_usuario").type == pa.string()
+    assert second.schema.field("reextraido").type == pa.string()
+    assert second.column("monto_total").to_pylist() == [1234.56]
+    assert first.column("confianza.monto_total").to_pylist() == [None, None]
+
+    csv_text = s3.objects[("bucket", sorted(writer.files)[0].split("bucket/")[1])].decode("utf-8")
+    assert csv_text.splitlines()[0].startswith("uuid,id_usuario,timestamp,s3_uri,")
+
+
+def test_run_export_scans_the_table_into_partitioned_files(monkeypatch):
+    moto = pytest.importorskip("moto")
+    for name, value in (("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test")):
+        monkeypatch.setenv(name, value)
+
+    with moto.mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="ocr_files_data",
+            KeySchema=[{"AttributeName": "uuid", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "uuid", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        for i in range(5):
+            table.put_item(
+                Item={
+                    "uuid": f"doc-{i}",
+                    "id_usuario": i,
+                    "timestamp": f"2024-0{8 + i % 2}-0{i + 1}T10:00:00",
+                    "monto_total": Decimal(i * 100) if i % 2 else f"{i},50",
+                    "confianza": {"monto_total": Decimal("0.9")},
+                }
+            )
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="exports")
+        # Una fila con un atributo guardado en S3 por dynamo_writer
+        s3.put_object(Bucket="exports", Key="dynamodb-offload/doc-5/razon_social.json", Body=b'"muy largo"')
+        table.put_item(
+            Item={
+                "uuid": "doc-5",
+                "timestamp": "2024-09-30T10:00:00",
+                "campos_en_s3": {"razon_social": "s3://exports/dynamodb-offload/doc-5/razon_social.json"},
+            }
+        )
+
+        report = exporter.run_export(
+            table_name="ocr_files_data", bucket="exports", segments=2, month="2024-09", chunk_rows=1
+        )
+
+        assert report["rows"] == 3
+        keys = [obj["Key"] for obj in s3.list_objects_v2(Bucket="exports", Prefix="exports/")["Contents"]]
+        parquet = [key for key in keys if key.endswith(".parquet")]
+        assert parquet and all("/month=2024-09/" in key for key in keys)
+        tables = [
+            pq.read_table(io.BytesIO(s3.get_object(Bucket="exports", Key=key)["Body"].read()))
+            for key in parquet
+        ]
+        assert all(t.schema.equals(tables[0].schema) for t in tables)
+        assert sorted(v for t in tables for v in t.column("monto_total").to_pylist() if v) == [100.0, 300.0]
+        assert "muy largo" in [v for t in tables for v in t.column("razon_social").to_pylist()]
+        assert not any("campos_en_s3.razon_social" in t.column_names for t in tables)
@@ -0,0 +1,50 @@
+import base64
+import io
+import os
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+# rasterization crea el cliente de S3 al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from rasterization import convert_pdf_to_images, encode_images_for_claude  # noqa: E402
+
+
+def sample_pdf(pages):
+    document = fitz.open()
+    for page_num in range(pages):
+        page = document.new_page(width=200 + 50 * page_num, height=300)
+        page.insert_text((20, 40), f"Comprobante pagina {page_num + 1}")
+    return document.tobytes()
+
+
+def decode(block):
+    return Image.open(io.BytesIO(base64.b64decode(block["source"]["data"])))
+
+
+def test_pages_are_composed_and_encoded_once():
+    pdf = sample_pdf(3)
+    content = encode_images_for_claude(convert_pdf_to_images(pdf))
+    assert [block["source"]["media_type"] for block in content] == ["image/png", "image/png"]
+
+    # Mismos pixeles que pegar cada pagina en un lienzo negro con PIL
+    document = fitz.open(stream=pdf, filetype="pdf")
+    pages = [document[i].get_pixmap() for i in range(2)]
+    expected = Image.new("RGB", (max(p.width for p in pages), sum(p.height for p in pages)))
+    y_offset = 0
+    for pix in pages:
+        expected.paste(Image.frombytes("RGB", (pix.width, pix.height), pix.samples), (0, y_offset))
+        y_offset += pix.height
+    assert decode(content[0]).convert("RGB").tobytes() == expected.tobytes()
+
+
+def test_uploaded_images_are_sent_without_reencoding():
+    upload = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 10, 10)).save(upload, format="JPEG", quality=90)
+
+    (block,) = encode_images_for_claude([upload.getvalue()])
+    assert block["source"]["media_type"] == "image/jpeg"
+    assert base64.b64decode(block["source"]["data"]) == upload.getvalue()
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from hedging import HedgedCaller
+
+
+def slow(result, seconds):
+    def call():
+        time.sleep(seconds)
+        return result
+
+    return call
+
+
+def failing():
+    raise RuntimeError("boom")
+
+
+def make_caller(**kwargs):
+    kwargs.setdefault("initial_delay_s", 0.05)
+    kwargs.setdefault("emit_metrics", False)
+    return HedgedCaller("test", **kwargs)
+
+
+def test_fast_primary_is_not_hedged():
+    caller = make_caller()
+    assert caller.call(slow("primary", 0), slow("hedge", 0)) == "primary"
+    assert caller.stats["hedges_sent"] == 0
+
+
+def test_slow_primary_is_hedged_and_hedge_wins():
+    caller = make_caller()
+    start = time.perf_counter()
+    assert caller.call(slow("primary", 1.0), slow("hedge", 0.01)) == "hedge"
+    assert time.perf_counter() - start < 0.5
+    assert caller.stats["hedges_sent"] == 1
+    assert caller.stats["hedges_won"] == 1
+
+
+def test_budget_caps_hedges():
+    caller = make_caller(budget_ratio=0.0, budget_burst=1.0)
+    caller.call(slow("primary", 0.1), slow("hedge", 0))
+    assert caller.call(slow("primary", 0.1), slow("hedge", 0)) == "primary"
+    assert caller.stats["hedges_sent"] == 1
+    assert caller.stats["hedges_denied"] == 1
+    assert caller.hedge_rate() == 0.5
+
+
+def test_failed_hedge_falls_back_to_primary():
+    caller = make_caller()
+    assert caller.call(slow("primary", 0.1), failing) == "primary"
+    assert caller.stats["hedges_won"] == 0
+
+
+def test_primary_error_is_raised_when_every_call_fails():
+    caller = make_caller()
+    with pytest.raises(RuntimeError):
+        caller.call(failing)
+
+
+def test_delay_follows_observed_percentile():
+    caller = make_caller(min_samples=10, min_delay_s=0.0, percentile=90)
+    for latency in range(1, 11):
+        caller.observe(latency / 100.0)
+    assert caller.delay() == pytest.approx(0.09)
+
+
+def test_only_primary_latencies_feed_the_percentile():
+    caller = make_caller()
+    assert caller.call(slow("primary", 0.3), slow("hedge", 0.01)) == "hedge"
+    # El hedge gano en ~0.06 s pero la ventana espera a la primaria
+    assert list(caller._latencies) == []
+    time.sleep(0.4)
+    (latency,) = caller._latencies
+    assert latency >= 0.3
+
+    # Una primaria fallida no aporta latencia
+    caller.call(slow("primary", 0), failing)
+    with pytest.raises(RuntimeError):
+        caller.call(failing)
+    assert len(caller._latencies) == 2
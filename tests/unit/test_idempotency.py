@@ -0,0 +1,197 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import idempotency
+import stubs
+from idempotency import (
+    ACQUIRE_ATTEMPTS,
+    COMPLETED,
+    FENCE_ATTRIBUTE,
+    IN_PROGRESS,
+    IdempotencyStore,
+    document_uuid,
+    fenced,
+    lease_key,
+    pending_response,
+    single_flight,
+)
+
+
+class Clock:
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def table(local_table):
+    return local_table("uuid")
+
+
+def test_only_one_invocation_gets_the_lease(table):
+    store = IdempotencyStore(table, lease_seconds=330, result_ttl=3600, clock=Clock())
+    lease, _ = store.acquire("doc")
+    assert lease is not None
+
+    duplicate, record = store.acquire("doc")
+    assert duplicate is None
+    assert record["estado"] == IN_PROGRESS
+
+    assert store.complete(lease, {"cuit": "30-00000000-7"})
+    _, record = store.acquire("doc")
+    assert record["estado"] == COMPLETED
+    assert json.loads(record["resultado"]) == {"cuit": "30-00000000-7"}
+
+
+def test_expired_lease_is_taken_over_and_fences_the_old_owner(table):
+    clock = Clock()
+    store = IdempotencyStore(table, lease_seconds=330, result_ttl=3600, clock=clock)
+    stale, _ = store.acquire("doc")
+
+    clock.now += 331
+    lease, _ = store.acquire("doc")
+    assert lease is not None and lease.token != stale.token
+    assert lease.fence > stale.fence
+
+    # La invocacion original (que sobrevivio al lease) ya no puede completar
+    assert not store.complete(stale, {"origen": "vieja"})
+    assert store.complete(lease, {"origen": "nueva"})
+    assert json.loads(store.get("doc")["resultado"]) == {"origen": "nueva"}
+
+
+def test_failed_invocation_releases_the_lease(table):
+    store = IdempotencyStore(table, clock=Clock())
+    lease, _ = store.acquire("doc")
+    store.release(lease)
+
+    retry, _ = store.acquire("doc")
+    assert retry is not None
+
+
+def test_completed_result_is_reprocessed_after_its_ttl(table):
+    clock = Clock()
+    store = IdempotencyStore(table, lease_seconds=330, result_ttl=3600, clock=clock)
+    lease, _ = store.acquire("doc")
+    store.complete(lease, {})
+
+    clock.now += 3601
+    lease, _ = store.acquire("doc")
+    assert lease is not None
+
+
+def test_document_uuid_and_pending_response():
+    direct = {"s3": {"bucket": "b", "key": "k.pdf"}}
+    proxied = {"body": json.dumps(direct)}
+    assert document_uuid(direct) == document_uuid(proxied)
+
+    response = pending_response("abc")
+    assert response["statusCode"] == 202
+    assert json.loads(response["body"]) == {"uuid": "abc", "estado": IN_PROGRESS}
+
+
+class VanishingTable:
+    """El put siempre encuentra un registro, pero el get ya no lo ve."""
+
+    def __init__(self):
+        self.puts = 0
+
+    def put_item(self, **kwargs):
+        self.puts += 1
+        raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem")
+
+    def get_item(self, **kwargs):
+        return {}
+
+
+def test_acquire_gives_up_after_a_bounded_number_of_attempts():
+    table = VanishingTable()
+    lease, record = IdempotencyStore(table, clock=Clock()).acquire("doc")
+
+    assert lease is None
+    assert record == {"uuid": "doc", "estado": IN_PROGRESS}
+    assert table.puts == ACQUIRE_ATTEMPTS
+
+
+def test_lease_key_includes_the_object_version(monkeypatch):
+    s3 = stubs.FakeS3Client()
+    monkeypatch.setattr(idempotency, "s3_client", s3)
+    event = {"s3": {"bucket": "b", "key": "k.pdf"}}
+
+    s3.put_object("b", "k.pdf", b"primera")
+    first = lease_key(event)
+    assert first.startswith(document_uuid(event) + "#")
+    assert lease_key(event) == first
+
+    s3.put_object("b", "k.pdf", b"segunda")
+    assert lease_key(event) != first
+    # La version informada en el evento se usa sin consultar S3
+    assert lease_key({"s3": {"bucket": "b", "key": "otra.pdf", "versionId": "v1"}}).endswith("#v1")
+
+
+@pytest.fixture
+def flight(table, monkeypatch):
+    s3 = stubs.FakeS3Client()
+    s3.put_object("b", "k.pdf", b"primera")
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_TABLE_NAME", table.name)
+    monkeypatch.setattr(idempotency, "WAIT_SECONDS", 0)
+    monkeypatch.setattr(idempotency, "s3_client", s3)
+    monkeypatch.setattr(idempotency, "_store", IdempotencyStore(table, clock=Clock()))
+    return s3
+
+
+EVENT = {"s3": {"bucket": "b", "key": "k.pdf"}}
+
+
+def test_a_new_upload_of_the_same_key_is_processed_again(flight):
+    calls = []
+
+    @single_flight
+    def handler(event, context):
+        calls.append(1)
+        return {"llamada": len(calls)}
+
+    assert handler(EVENT, None) == {"llamada": 1}
+    assert handler(EVENT, None) == {"llamada": 1}  # resultado guardado
+
+    flight.put_object("b", "k.pdf", b"segunda")
+    assert handler(EVENT, None) == {"llamada": 2}
+
+
+def test_error_responses_are_not_stored_as_the_result(flight):
+    responses = [{"statusCode": 429, "body": "{}"}, {"cuit": "30-00000000-7"}]
+
+    @single_flight
+    def handler(event, context):
+        return responses.pop(0)
+
+    assert handler(EVENT, None)["statusCode"] == 429
+    assert handler(EVENT, None) == {"cuit": "30-00000000-7"}
+
+
+def test_release_failure_does_not_mask_the_handler_error(flight, monkeypatch):
+    def broken_release(lease):
+        raise RuntimeError("DynamoDB no disponible")
+
+    monkeypatch.setattr(idempotency._store, "release", broken_release)
+
+    @single_flight
+    def handler(event, context):
+        raise ValueError("documento ilegible")
+
+    with pytest.raises(ValueError, match="documento ilegible"):
+        handler(EVENT, None)
+
+
+def test_rows_written_inside_the_handler_carry_the_lease_fence(flight):
+    @single_flight
+    def handler(event, context):
+        return fenced({"uuid": "doc"})
+
+    row = handler(EVENT, None)
+    assert row[FENCE_ATTRIBUTE] == idempotency._store.get(lease_key(EVENT))["fence"]
+    # Fuera de single_flight no hay lease
+    assert fenced({"uuid": "doc"}) == {"uuid": "doc"}
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("fitz")
+
+# Los modulos del pipeline crean clientes de boto3 al importarse
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import claude  # noqa: E402
+import dynamo_writer  # noqa: E402
+import prompting  # noqa: E402
+import rasterization  # noqa: E402
+import stubs  # noqa: E402
+from boto3.dynamodb.types import TypeDeserializer  # noqa: E402
+from pipeline import extract, rasterize  # noqa: E402
+from pipeline.local import run_pipeline  # noqa: E402
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "prompt_engineering")
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    s3 = stubs.FakeS3Client()
+    s3.load_directory("datos", PROMPTS_DIR, "prompt_engineering/")
+    s3.put_object("datos", "uploads/factura.pdf", stubs.synthesize_document(".pdf", None, 3))
+    bedrock = stubs.FakeBedrockClient(stubs.LatencyModel([0]))
+    dynamodb = stubs.FakeDynamoDBClient()
+
+    for module in (rasterization, rasterize, extract):
+        monkeypatch.setattr(module, "s3_client", s3)
+    monkeypatch.setattr(rasterize, "ARTIFACTS_BUCKET", "datos")
+    monkeypatch.setattr(extract, "DYNAMODB_TABLE_NAME", "ocr_files_data")
+    monkeypatch.setattr(claude, "bedrock_client", bedrock)
+    monkeypatch.setattr(claude, "BUCKET_NAME", "datos")
+    monkeypatch.setattr(claude, "FILE_KEY", "prompt_engineering/prompt.txt")
+    monkeypatch.setattr(claude, "claude_hedger", None)
+    monkeypatch.setattr(
+        prompting,
+        "read_prompt_from_s3",
+        lambda bucket, key: s3.get_object(Bucket=bucket, Key=key)["Body"].read().decode("utf-8"),
+    )
+    monkeypatch.setattr(prompting, "_templates", {})
+    monkeypatch.setattr(prompting, "_tools", {})
+    monkeypatch.setattr(dynamo_writer, "dynamodb_client", dynamodb)
+    monkeypatch.setattr(dynamo_writer, "_writers", {})
+    return s3, dynamodb
+
+
+@pytest.mark.parametrize("output_mode", ["text", "tool"])
+def test_run_pipeline_rasterizes_extracts_and_saves(aws, monkeypatch, output_mode):
+    s3, dynamodb = aws
+    monkeypatch.setattr(claude, "OUTPUT_MODE", output_mode)
+
+    result = run_pipeline({"s3": {"bucket": "datos", "key": "uploads/factura.pdf"}, "id_usuario": 7})
+    assert result == stubs.SAMPLE_RESULT
+
+    # rasterize dejo los bloques de imagen (3 paginas -> 2 imagenes) para extract
+    (artifact_key,) = [key for bucket, key in s3.objects if key.startswith("pipeline/")]
+    images = json.loads(s3.objects[("datos", artifact_key)])
+    assert [block["type"] for block in images] == ["image", "image"]
+
+    (item,) = dynamodb.tables["ocr_files_data"].values()
+    deserializer = TypeDeserializer()
+    saved = {name: deserializer.deserialize(value) for name, value in item.items()}
+    assert saved["uuid"] == artifact_key.split("/")[1]
+    assert saved["s3_uri"] == "s3://datos/uploads/factura.pdf"
+    assert saved["id_usuario"] == 7
+    assert {name: saved[name] for name in stubs.SAMPLE_RESULT} == stubs.SAMPLE_RESULT
+
+
+def test_rejected_write_returns_the_stored_row(aws, monkeypatch):
+    event = {"s3": {"bucket": "datos", "key": "uploads/factura.pdf"}, "id_usuario": 7}
+    uuid = hashlib.sha256(b"datos/uploads/factura.pdf").hexdigest()
+    newer = {"uuid": uuid, "timestamp": "2999-01-01T00:00:00", "cuit": "30-00000000-7"}
+    dynamo_writer.get_writer("ocr_files_data").put(newer)
+    # Otra ejecucion guardo una version mas nueva: la condicion de put falla
+    monkeypatch.setattr(extract, "save_to_dynamodb", lambda table_name, item: False)
+
+    assert run_pipeline(event) == newer
+
+
+def test_rasterize_stage_does_not_load_the_model_modules():
+    code = (
+        "import sys; sys.path.insert(0, %r); import pipeline.rasterize; "
+        "print(sorted(m for m in ('claude', 'hedging', 'ocr.generator') if m in sys.modules))"
+    ) % os.path.dirname(os.path.abspath(rasterization.__file__))
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=dict(os.environ, AWS_DEFAULT_REGION="us-east-1"),
+    ).stdout
+    assert output.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,72 @@
+import json
+import os
+
+import pytest
+
+import prompting
+from prompting import OUTPUT_TOOL_NAME, PromptTemplate, build_output_schema, load_output_tool
+
+PROMPT_JSON = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "prompt_engineering", "prompt.json"
+)
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Archivos de prompt en memoria en lugar de S3, con las caches vacias."""
+    files = {}
+    reads = []
+
+    def read(bucket_name, file_key):
+        reads.append(file_key)
+        return files[file_key]
+
+    monkeypatch.setattr(prompting, "read_prompt_from_s3", read)
+    monkeypatch.setattr(prompting, "_templates", {})
+    monkeypatch.setattr(prompting, "_tools", {})
+    return files, reads
+
+
+def test_template_renders_placeholders_once_compiled():
+    template = PromptTemplate("Campos: <example>\nTexto: <textract_example>\nFin <otro>")
+
+    assert template.render(example="{}", textract_example="CUIT: 30") == "Campos: {}\nTexto: CUIT: 30\nFin <otro>"
+    # Los placeholders sin valor quedan como estaban
+    assert template.render() == "Campos: <example>\nTexto: <textract_example>\nFin <otro>"
+    assert template.render(example="<textract_example>").startswith("Campos: <textract_example>\n")
+
+
+def test_template_is_read_and_compiled_once_per_process(prompts):
+    files, reads = prompts
+    files["prompt.txt"] = "Ejemplo: <example>"
+
+    first = prompting.load_template("bucket", "prompt.txt")
+    assert prompting.load_template("bucket", "prompt.txt") is first
+    assert prompting.load_prompt("bucket", "prompt.txt") == "Ejemplo: <example>"
+    assert reads == ["prompt.txt"]
+
+
+def test_output_schema_is_typed_with_optional_confidence():
+    schema = build_output_schema(
+        json.dumps({"monto_total": "Total", "iva": "Condicion", "campo_nuevo": "Otro"})
+    )
+
+    assert schema["required"] == ["monto_total", "iva", "campo_nuevo"]
+    properties = schema["properties"]
+    assert properties["monto_total"] == {"type": "number", "description": "Total"}
+    assert properties["iva"]["enum"] == ["I", "N", "E", "M", "S"]
+    # Los campos sin tipo declarado son strings
+    assert properties["campo_nuevo"] == {"type": "string", "description": "Otro"}
+    assert "confianza" not in schema["required"]
+    assert properties["confianza"]["properties"]["iva"] == {"type": "number", "minimum": 0, "maximum": 1}
+
+
+def test_output_tool_for_the_repository_prompt(prompts):
+    files, _ = prompts
+    with open(PROMPT_JSON, encoding="utf-8") as f:
+        files["prompt.json"] = f.read()
+
+    tool = load_output_tool("bucket", "prompt.json")
+    assert tool["name"] == OUTPUT_TOOL_NAME
+    assert set(tool["input_schema"]["required"]) == set(json.loads(files["prompt.json"]))
+    assert load_output_tool("bucket", "prompt.json") is tool
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+
+import replay
+
+REPLAY_SCRIPT = os.path.join(os.path.dirname(replay.__file__), "replay.py")
+
+
+def trace(handler="generator_textract", model_ms=5.0, **document):
+    return {
+        "handler": handler,
+        "event_shape": {"body": {"json": {"s3": {"bucket": "str", "key": "str"}, "id_usuario": "int"}}},
+        "document": dict({"extension": ".pdf", "size_bytes": 2048, "pages": 1}, **document),
+        "stages_ms": {"model": model_ms, "textract": 3.0},
+        "total_ms": 12.0,
+        "error": None,
+    }
+
+
+def test_load_traces_reads_jsonl_and_cloudwatch_exports(tmp_path):
+    path = tmp_path / "logs.txt"
+    path.write_text(
+        "\n".join(
+            [
+                json.dumps(trace()),
+                "2024-09-01T10:00:00 INFO TRACE " + json.dumps(trace(model_ms=7.0)),
+                "START RequestId: abc",
+                "TRACE {no es json",
+            ]
+        )
+    )
+    traces = replay.load_traces(str(path))
+    assert [t["stages_ms"]["model"] for t in traces] == [5.0, 7.0]
+
+
+def test_materialize_rebuilds_events_with_the_replay_document():
+    event = replay.materialize(trace()["event_shape"], "bucket", "replay/doc.pdf")
+    assert json.loads(event["body"]) == {
+        "s3": {"bucket": "bucket", "key": "replay/doc.pdf"},
+        "id_usuario": 0,
+    }
+
+    # Mismo documento (extension, tamaño, paginas) -> misma clave
+    document = trace()["document"]
+    assert replay.document_key(document) == replay.document_key(dict(document))
+    assert replay.document_key(document) != replay.document_key(dict(document, pages=3))
+
+
+def test_report_percentiles_and_error_rate():
+    assert replay.percentile([], 50) is None
+    assert replay.percentile(list(range(1, 101)), 95) == 95
+    results = [
+        {"latency_ms": float(i), "error": "RuntimeError" if i == 4 else None, "stages_ms": {"model": 1.0}}
+        for i in range(1, 5)
+    ]
+    report = replay.build_report(results, wall_s=2.0, target="generator", concurrency=2)
+    assert report["requests"] == 4
+    assert report["error_rate"] == 0.25
+    assert report["errors_by_type"] == {"RuntimeError": 1}
+    assert report["throughput_rps"] == 2.0
+    assert report["latency_ms"]["max"] == 4.0
+    assert report["stages_ms"]["model"]["p50"] == 1.0
+
+
+def test_replay_runs_the_handler_against_the_stubs(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    path.write_text("\n".join(json.dumps(trace(pages=n)) for n in (1, 2)))
+    env = dict(os.environ, AWS_DEFAULT_REGION="us-east-1")
+    for name in ("QUOTAS_TABLE_NAME", "IDEMPOTENCY_TABLE_NAME", "ARTIFACT_STORE_BUCKET", "TRACE_ENABLED"):
+        env.pop(name, None)
+
+    output = subprocess.run(
+        [sys.executable, REPLAY_SCRIPT, str(path), "--target", "generator_textract",
+         "--concurrency", "2", "--requests", "4", "--latency-scale", "0"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    report = json.loads(output)
+
+    assert report["requests"] == 4
+    assert report["error_rate"] == 0.0
+    assert {"download", "textract", "model", "dynamodb"} <= set(report["stages_ms"])
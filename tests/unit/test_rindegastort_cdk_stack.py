@@ -1,15 +1,256 @@
 import aws_cdk as core
 import aws_cdk.assertions as assertions
 
-from rindegastort_cdk.rindegastort_cdk_stack import RindegastortCdkStack
+from rindegastort_cdk.rindegastort_cdk_stack import RindegastORTCdkStack
 
 # example tests. To run these tests, uncomment this file along with the example
 # resource in rindegastort_cdk/rindegastort_cdk_stack.py
 def test_sqs_queue_created():
     app = core.App()
-    stack = RindegastortCdkStack(app, "rindegastort-cdk")
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk")
     template = assertions.Template.from_stack(stack)
 
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+def test_on_demand_by_default():
+    app = core.App()
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk")
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_count_is("AWS::Lambda::Alias", 0)
+    template.resource_count_is("AWS::ApplicationAutoScaling::ScalableTarget", 0)
+    template.resource_count_is("AWS::Events::Rule", 0)
+
+
+def test_provisioned_concurrency_scales_on_business_hours():
+    app = core.App()
+    stack = RindegastORTCdkStack(
+        app,
+        "rindegastort-cdk",
+        provisioned_concurrency=5,
+        off_hours_provisioned_concurrency=1,
+        business_hours=(8, 20),
+    )
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::Lambda::Alias",
+        {
+            "Name": "live",
+            "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 1},
+        },
+    )
+    template.has_resource_properties(
+        "AWS::ApplicationAutoScaling::ScalableTarget",
+        {
+            "MinCapacity": 1,
+            "MaxCapacity": 5,
+            "ScalableDimension": "lambda:function:ProvisionedConcurrency",
+            "ScheduledActions": [
+                {
+                    "ScheduledActionName": "ScaleUpBusinessHours",
+                    "Schedule": "cron(0 8 ? * MON-FRI *)",
+                    "ScalableTargetAction": {"MinCapacity": 5, "MaxCapacity": 5},
+                    "Timezone": "America/Argentina/Buenos_Aires",
+                },
+                {
+                    "ScheduledActionName": "ScaleDownOffHours",
+                    "Schedule": "cron(0 20 ? * MON-FRI *)",
+                    "ScalableTargetAction": {"MinCapacity": 1, "MaxCapacity": 1},
+                    "Timezone": "America/Argentina/Buenos_Aires",
+                },
+            ],
+        },
+    )
+    # La URL de la funcion apunta al alias con capacidad caliente
+    template.has_resource_properties(
+        "AWS::Lambda::Url",
+        {"Qualifier": "live"},
+    )
+
+
+def test_warmup_rule_sends_warmup_event():
+    app = core.App()
+    stack = RindegastORTCdkStack(
+        app, "rindegastort-cdk", warmup_interval=core.Duration.minutes(5)
+    )
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "ScheduleExpression": "rate(5 minutes)",
+            "Targets": [
+                assertions.Match.object_like({"Input": '{"warmup":true}'})
+            ],
+        },
+    )
+
+
+def test_staged_pipeline_right_sizes_each_stage():
+    app = core.App()
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk", staged_pipeline=True)
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "pipeline/rasterize.lambda_handler",
+            "MemorySize": 1769,
+            "Layers": assertions.Match.any_value(),
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "pipeline/extract.lambda_handler",
+            "MemorySize": 512,
+            "Layers": assertions.Match.absent(),
+        },
+    )
+    template.resource_count_is("AWS::StepFunctions::StateMachine", 1)
+    template.has_resource_properties(
+        "AWS::StepFunctions::StateMachine",
+        {"StateMachineName": "rinde_gastos_ocr_pipeline"},
+    )
+
+    # POST /pipeline inicia la state machine
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "pipeline"})
+    template.has_resource_properties(
+        "AWS::ApiGateway::Method",
+        {
+            "HttpMethod": "POST",
+            "Integration": {
+                "Type": "AWS",
+                "Uri": {"Fn::Join": ["", assertions.Match.array_with([":states:action/StartExecution"])]},
+                "IntegrationResponses": [{"StatusCode": "202"}],
+            },
+        },
+    )
+    template.has_resource_properties(
+        "AWS::IAM::Policy",
+        {
+            "PolicyDocument": {
+                "Statement": assertions.Match.array_with(
+                    [assertions.Match.object_like({"Action": "states:StartExecution"})]
+                )
+            }
+        },
+    )
+
+
+def test_monthly_export_runs_on_the_first_of_the_month():
+    app = core.App()
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk", monthly_export=True)
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {"Handler": "export/exporter.lambda_handler", "Timeout": 900},
+    )
+    template.has_resource_properties(
+        "AWS::Events::Rule",
+        {
+            "ScheduleExpression": "cron(0 6 1 * ? *)",
+            "Targets": [
+                assertions.Match.object_like({"Input": '{"month":"previous"}'})
+            ],
+        },
+    )
+
+
+def test_user_quotas_table_with_ttl():
+    app = core.App()
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk", user_quotas=True)
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "TableName": "rindegastort_quotas",
+            "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "FunctionName": "rinde_gastos_ocr_generator_function",
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {"QUOTAS_TABLE_NAME": assertions.Match.any_value()}
+                )
+            },
+        },
+    )
+
+
+def test_staged_pipeline_stages_take_admission():
+    app = core.App()
+    stack = RindegastORTCdkStack(
+        app, "rindegastort-cdk", user_quotas=True, staged_pipeline=True
+    )
+    template = assertions.Template.from_stack(stack)
+
+    # POST /pipeline no pasa por el generador: las etapas toman la admision
+    for function_name in (
+        "rinde_gastos_ocr_pipeline_rasterize",
+        "rinde_gastos_ocr_pipeline_extract",
+    ):
+        template.has_resource_properties(
+            "AWS::Lambda::Function",
+            {
+                "FunctionName": function_name,
+                "Environment": {
+                    "Variables": assertions.Match.object_like(
+                        {
+                            "QUOTAS_TABLE_NAME": assertions.Match.any_value(),
+                            "QUOTA_INFLIGHT_TTL_SECONDS": "600",
+                        }
+                    )
+                },
+            },
+        )
+
+
+def test_single_flight_lease_table():
+    app = core.App()
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk", single_flight=True)
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {
+            "TableName": "rindegastort_idempotency",
+            "KeySchema": [{"AttributeName": "uuid", "KeyType": "HASH"}],
+            "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+        },
+    )
+
+
+def test_artifact_store_adds_backfill_function():
+    app = core.App()
+    stack = RindegastORTCdkStack(app, "rindegastort-cdk", artifact_store=True)
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "FunctionName": "rinde_gastos_ocr_generator_function",
+            "Environment": {
+                "Variables": assertions.Match.object_like(
+                    {"ARTIFACT_STORE_PREFIX": "artifacts/"}
+                )
+            },
+        },
+    )
+    template.has_resource_properties(
+        "AWS::Lambda::Function",
+        {
+            "Handler": "backfill/reextract.lambda_handler",
+            "Timeout": 900,
+            "Layers": assertions.Match.any_value(),
+        },
+    )
@@ -0,0 +1,171 @@
+import time
+
+from textract_serializer import budget_chars, serialize_textract
+
+
+def word(block_id, text, confidence=99.0):
+    return {"Id": block_id, "BlockType": "WORD", "Text": text, "Confidence": confidence}
+
+
+def child(*ids):
+    return [{"Type": "CHILD", "Ids": list(ids)}]
+
+
+def key_value(key_id, key_word, value_id, value_word):
+    return [
+        {
+            "Id": key_id,
+            "BlockType": "KEY_VALUE_SET",
+            "EntityTypes": ["KEY"],
+            "Relationships": child(key_word) + [{"Type": "VALUE", "Ids": [value_id]}],
+        },
+        {
+            "Id": value_id,
+            "BlockType": "KEY_VALUE_SET",
+            "EntityTypes": ["VALUE"],
+            "Relationships": child(value_word),
+        },
+    ]
+
+
+def cell(cell_id, row, col, *word_ids):
+    return {
+        "Id": cell_id,
+        "BlockType": "CELL",
+        "RowIndex": row,
+        "ColumnIndex": col,
+        "Relationships": child(*word_ids) if word_ids else [],
+    }
+
+
+def receipt_blocks():
+    blocks = [
+        word("w1", "Total"),
+        word("w2", "1500"),
+        word("w3", "CUIT"),
+        word("w4", "basura", confidence=12.0),
+        word("w5", "Cafe"),
+        word("w6", "300"),
+    ]
+    blocks += key_value("k1", "w1", "v1", "w2")
+    blocks += key_value("k2", "w3", "v2", "w4")
+    blocks += [
+        cell("c1", 1, 1, "w5"),
+        cell("c2", 1, 2, "w6"),
+        cell("c3", 1, 3),
+        cell("c4", 2, 1, "w1"),
+        cell("c5", 2, 2, "w2"),
+        cell("c6", 2, 3),
+        {"Id": "t1", "BlockType": "TABLE", "Relationships": child("c1", "c2", "c3", "c4", "c5", "c6")},
+    ]
+    return blocks
+
+
+def test_compact_serialization_dedups_and_filters():
+    text, stats = serialize_textract(receipt_blocks(), min_confidence=50.0)
+
+    assert text == "Total: 1500\n\nCafe|300"
+    assert stats["low_confidence_words"] == 1
+    # La fila "Total | 1500" repite el par completo del formulario
+    assert stats["deduplicated_cells"] == 2
+    assert stats["compact_chars"] < stats["raw_chars"]
+
+
+def test_budget_drops_least_relevant_content_first():
+    text, stats = serialize_textract(receipt_blocks(), max_chars=12)
+
+    assert text == "Total: 1500"
+    # Solo se descarta la fila; la linea en blanco de la tabla ya no se emite
+    assert stats["truncated_items"] == 1
+
+
+def words(*texts):
+    return [word(f"w-{text}", text) for text in texts]
+
+
+def table(table_id, rows):
+    blocks, cell_ids = [], []
+    for r, row in enumerate(rows, start=1):
+        for c, text in enumerate(row, start=1):
+            cell_id = f"{table_id}-{r}-{c}"
+            cell_ids.append(cell_id)
+            blocks.append(cell(cell_id, r, c, *[f"w-{part}" for part in text.split()]))
+    blocks.append({"Id": table_id, "BlockType": "TABLE", "Relationships": child(*cell_ids)})
+    return blocks
+
+
+def test_pairs_are_deduplicated_as_a_whole():
+    blocks = words("Total", "1500", "IVA", "21%", "Neto")
+    blocks += key_value("k1", "w-Total", "v1", "w-1500")
+    blocks += key_value("k2", "w-IVA", "v2", "w-21%")
+    # Clave y valor ya vistos por separado, pero el par es nuevo
+    blocks += key_value("k3", "w-Total", "v3", "w-21%")
+    blocks += key_value("k4", "w-Total", "v4", "w-1500")
+
+    text, _ = serialize_textract(blocks)
+    assert text == "Total: 1500\nIVA: 21%\nTotal: 21%"
+
+
+def test_only_cells_repeating_a_whole_pair_are_blanked():
+    blocks = words("Cantidad", "1", "IVA", "21%", "Total", "1500", "Cafe", "Alicuota")
+    blocks += key_value("k1", "w-Cantidad", "v1", "w-1")
+    blocks += key_value("k2", "w-IVA", "v2", "w-21%")
+    blocks += key_value("k3", "w-Total", "v3", "w-1500")
+    blocks += table(
+        "t1",
+        [
+            ["Cafe", "1", "21%"],
+            ["IVA", "21%", "Alicuota"],
+            ["Total 1500", "Cafe", "1"],
+        ],
+    )
+
+    text, stats = serialize_textract(blocks)
+    assert text.splitlines()[4:] == [
+        "Cafe|1|21%",
+        "---|---|---",
+        "||Alicuota",
+        "|Cafe|1",
+    ]
+    assert stats["deduplicated_cells"] == 3
+
+
+def test_truncation_never_leaves_an_orphan_separator():
+    blocks = words("Total", "1500", "Cafe", "300", "Medialuna", "200")
+    blocks += key_value("k1", "w-Total", "v1", "w-1500")
+    blocks += table("t1", [["Cafe", "300"], ["Medialuna", "200"]])
+
+    full, _ = serialize_textract(blocks)
+    assert full == "Total: 1500\n\nCafe|300\n---|---\nMedialuna|200"
+
+    # Solo entra el encabezado: sin filas debajo no hay separador
+    text, stats = serialize_textract(blocks, max_chars=len("Total: 1500\n\nCafe|300") + 1)
+    assert text == "Total: 1500\n\nCafe|300"
+    assert stats["truncated_items"] == 1
+
+    # Sin ninguna fila de la tabla tampoco queda la linea en blanco
+    text, _ = serialize_textract(blocks, max_chars=12)
+    assert text == "Total: 1500"
+
+
+def test_large_tables_shrink_and_truncate_in_linear_time():
+    rows = [[f"Item{r}", f"{r}", f"{r * 10}"] for r in range(4000)]
+    blocks = words(*{text for row in rows for text in row}) + table("t1", rows)
+
+    text, stats = serialize_textract(blocks)
+    assert text.splitlines()[:4] == ["", "Item0|0|0", "---|---|---", "Item1|1|10"]
+    # Sin nada para deduplicar, no ocupa mas que el formato con tabuladores
+    assert stats["reduction_pct"] > 0
+
+    start = time.perf_counter()
+    text, stats = serialize_textract(blocks, max_chars=2000)
+    assert time.perf_counter() - start < 1.0
+    assert len(text) <= 2000
+    # Se conservan el encabezado y las primeras filas, sin cortar una fila
+    assert text.splitlines()[:3] == ["", "Item0|0|0", "---|---|---"]
+    assert all(line.count("|") == 2 for line in text.splitlines()[1:])
+
+
+def test_budget_uses_strictest_limit():
+    assert budget_chars(max_chars=1000, max_tokens=100) == 400
+    assert budget_chars(max_chars=0, max_tokens=0) is None
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+import tracing
+from tracing import annotate, finish_trace, record_error, sanitize_event, stage, start_trace
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    records = []
+    monkeypatch.setattr(tracing, "_sinks", [records.append])
+    return records
+
+
+def test_sanitize_event_keeps_only_the_shape():
+    body = json.dumps({"s3": {"bucket": "facturas", "key": "juan.pdf"}, "id_usuario": 7})
+    event = {"body": body, "headers": {"Authorization": "secreto"}, "items": [1, 2, 3], "vacio": []}
+
+    assert sanitize_event(event) == {
+        "body": {"json": {"s3": {"bucket": "str", "key": "str"}, "id_usuario": "int"}},
+        "headers": {"Authorization": "str"},
+        "items": ["int"],
+        "vacio": [],
+    }
+    assert "juan.pdf" not in json.dumps(sanitize_event(event))
+
+
+def test_stage_accumulates_and_finish_trace_emits_the_record(sink):
+    start_trace("generator", {"s3": {"bucket": "b", "key": "k.pdf"}})
+    with stage("model"):
+        pass
+    with stage("model"):
+        pass
+    annotate(pages=2)
+
+    record = finish_trace()
+    assert sink == [record]
+    assert record["handler"] == "generator"
+    assert record["event_shape"] == {"s3": {"bucket": "str", "key": "str"}}
+    assert record["document"] == {"pages": 2}
+    assert set(record["stages_ms"]) == {"model"} and record["stages_ms"]["model"] >= 0
+    assert record["error"] is None
+
+    # La traza se descarta al finalizar
+    assert tracing.current_trace() is None
+    assert finish_trace() is None
+
+
+def test_record_error_and_stage_on_failure(sink):
+    start_trace("generator_textract", {})
+    with pytest.raises(ValueError):
+        with stage("textract"):
+            raise ValueError("documento ilegible")
+    record_error(ValueError("documento ilegible"))
+
+    record = finish_trace()
+    assert "textract" in record["stages_ms"]
+    assert record["error"] == "ValueError"
+
+
+def test_nothing_is_emitted_without_sinks(monkeypatch):
+    monkeypatch.setattr(tracing, "_sinks", [])
+    monkeypatch.setattr(tracing, "TRACE_ENABLED", False)
+    start_trace("generator", {})
+    with stage("download"):
+        pass
+    record_error(RuntimeError())
+    assert finish_trace() is None
+
+    # Sin traza activa stage, annotate y record_error no fallan
+    with stage("download"):
+        annotate(pages=1)
+    record_error(RuntimeError())
+
+
+def test_handlers_log_the_sanitized_event(monkeypatch, caplog):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    from ocr import generator_textract
+    import stubs
+
+    monkeypatch.setattr(generator_textract, "s3_client", stubs.FakeS3Client())
+    monkeypatch.setattr(generator_textract, "send_sns_message", lambda *args: None)
+    event = {"s3": {"bucket": "facturas", "key": "dni-30111222.pdf"}, "id_usuario": 7}
+
+    with caplog.at_level("INFO"), pytest.raises(Exception):
+        generator_textract.lambda_handler(event, None)
+
+    (line,) = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Received event")]
+    assert "dni-30111222.pdf" not in line
+    assert '"key": "str"' in line
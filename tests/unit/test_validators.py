@@ -0,0 +1,46 @@
+from datetime import datetime
+
+from validators import is_valid_cuit, is_valid_date, parse_amount, validate_field
+
+
+def test_cuit_checksum():
+    assert is_valid_cuit("30-00000000-7")
+    assert is_valid_cuit("30000000007")
+    assert not is_valid_cuit("30-00000000-1")
+    assert not is_valid_cuit("12-34567890-1")
+    assert not is_valid_cuit("3000000000")
+
+
+def test_dates_in_common_formats():
+    today = datetime(2024, 10, 1)
+    assert is_valid_date("15-09-2024", today=today)
+    assert is_valid_date("15/09/2024", today=today)
+    assert is_valid_date("2024-09-15", today=today)
+    assert not is_valid_date("31-02-2024", today=today)
+    assert not is_valid_date("15-09-1990", today=today)
+
+
+def test_amounts_in_argentine_and_plain_formats():
+    assert parse_amount("$ 1.234,56") == 1234.56
+    assert parse_amount("1,234.56") == 1234.56
+    assert parse_amount("1.234.567") == 1234567.0
+    assert parse_amount("1.234") == 1234.0
+    assert parse_amount("$ 25.000") == 25000.0
+    assert parse_amount("0.500") == 0.5
+    assert parse_amount("12.50") == 12.5
+    assert parse_amount("1500") == 1500.0
+    assert parse_amount(99.5) == 99.5
+    assert parse_amount("sin monto") is None
+
+
+def test_validate_field():
+    assert validate_field("iva", "i") is True
+    assert validate_field("tipo_factura", "Z") is False
+    assert validate_field("tipo_factura", " b ") is True
+    # Nombres que prompt.json admite, con o sin letra y acentos
+    for name in ("Tique", "Tique Factura", "Tique Factura A", "Recibo C", "Liquidación de servicios", "FACTURA B"):
+        assert validate_field("tipo_factura", name) is True
+    assert validate_field("tipo_factura", "Factura Z") is False
+    assert validate_field("tipo_factura", "Remito") is False
+    assert validate_field("monto_total", "") is False
+    assert validate_field("razon_social", "Comercio SA") is None